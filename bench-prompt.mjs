@@ -0,0 +1,98 @@
+#!/usr/bin/env node
+/**
+ * MyCodeHelper Prompt Build Benchmark
+ * ===================================
+ *
+ * Measures the per-turn cost of building a chat request (system prompt with project
+ * context, pinned files, history, token count and JSON body) for a synthetic session.
+ *
+ * Usage:
+ *   node bench-prompt.mjs                  # default session
+ *   node bench-prompt.mjs --turns 200      # more turns
+ *   node bench-prompt.mjs --pinned 8       # more pinned files
+ *
+ * "uncached" clears every prompt cache before each turn and hands out fresh file objects,
+ * which is what each turn paid before memoization; "memoized" reuses them across turns.
+ */
+
+import { performance } from 'perf_hooks';
+import { PromptBuilder, TokenCounter, ContentChunker, Deduplicator, SYSTEM_PROMPT } from './bundle/mycodehelper-complete.js';
+
+const args = process.argv.slice(2);
+const option = (name, fallback) => {
+  const index = args.indexOf(name);
+  return index === -1 ? fallback : parseInt(args[index + 1]);
+};
+const turns = option('--turns', 100);
+const pinnedCount = option('--pinned', 4);
+
+function syntheticFile(index, functions) {
+  const body = Array.from({ length: functions }, (_, i) =>
+    `// Handles case ${i} of module ${index}\nexport function handler${index}_${i}(input, options = {}) {\n  const value = input?.items?.[${i}] ?? null;\n  if (!value) return { ok: false, reason: 'missing item ${i}' };\n  return { ok: true, value: transform(value, options) };\n}\n`
+  ).join('\n');
+  return { path: `src/module${index}.js`, content: body, size: body.length, extension: '.js' };
+}
+
+// One large pinned file (excerpted per query), the rest small enough to send whole
+const pinned = Array.from({ length: pinnedCount }, (_, i) => syntheticFile(i, i === 0 ? 2000 : 60));
+const projectContext = {
+  totalFiles: 100,
+  languages: { '.js': 80, '.json': 12, '.md': 8 },
+  totalLines: 48000,
+  files: Array.from({ length: 50 }, (_, i) => ({ path: `src/module${i}.js`, size: 4000 + i, lines: 120 + i }))
+};
+const history = Array.from({ length: 10 }, (_, i) => ({
+  role: i % 2 ? 'assistant' : 'user',
+  content: `Turn ${i}: ${'discussion of handler behaviour '.repeat(20)}`
+}));
+
+function buildTurn(files, message) {
+  const counter = TokenCounter.current;
+  const messages = [
+    { role: 'system', content: PromptBuilder.systemPrompt(projectContext) },
+    { role: 'system', content: PromptBuilder.fileContext(files, message) },
+    ...history,
+    { role: 'user', content: message }
+  ];
+  const tokens = counter.countMessages(messages);
+  const body = PromptBuilder.requestBody({ model: 'bench', temperature: 0.7, max_tokens: 4096, stream: true }, messages);
+  return { tokens, bytes: body.length };
+}
+
+function clearCaches() {
+  PromptBuilder.contexts = new WeakMap();
+  PromptBuilder.fileBlocks = new WeakMap();
+  PromptBuilder.messages = new Map();
+  PromptBuilder.lastFileContext = { blocks: [], text: '' };
+  ContentChunker.prepared = new WeakMap();
+  Deduplicator.prints = new WeakMap();
+  TokenCounter.current.texts = new Map();
+}
+
+function run(label, memoized) {
+  clearCaches();
+  const samples = [];
+  let bytes = 0;
+  for (let turn = 0; turn < turns; turn++) {
+    // Follow-up questions about the same code keep the same excerpt
+    const message = `Why does handler0_${turn % 5} return early for missing items?`;
+    if (!memoized) clearCaches();
+    const files = memoized ? pinned : pinned.map(file => ({ ...file }));
+    const started = performance.now();
+    bytes = buildTurn(files, message).bytes;
+    samples.push(performance.now() - started);
+  }
+  samples.sort((a, b) => a - b);
+  const median = samples[Math.floor(samples.length / 2)];
+  const p95 = samples[Math.floor(samples.length * 0.95)];
+  console.log(`  ${label.padEnd(10)} median ${median.toFixed(3)} ms   p95 ${p95.toFixed(3)} ms   (${(bytes / 1024).toFixed(0)} KB body)`);
+  return median;
+}
+
+TokenCounter.use('bench');
+const pinnedChars = pinned.reduce((total, file) => total + file.content.length, 0);
+console.log(`Prompt build per turn (${turns} turns, ${pinnedCount} pinned files, ${(pinnedChars / 1024).toFixed(0)} KB pinned, system prompt ${SYSTEM_PROMPT.length} chars)`);
+console.log('='.repeat(72));
+const uncached = run('uncached', false);
+const memoized = run('memoized', true);
+console.log(`  speedup    ${(uncached / memoized).toFixed(1)}x`);
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+MyCodeHelper Launcher Startup Benchmark
+=======================================
+
+Measures how long `mycodehelper-complete.py` takes to start for invocations
+that should never pay for Node, asyncio or HTTP machinery.
+
+Usage:
+  python bench-startup.py                 # wall-clock timings + import breakdown
+  python bench-startup.py --runs 30       # more samples
+  python bench-startup.py --top 15        # show the 15 slowest imports
+
+Scenarios:
+- --version       fast path, no argument parsing
+- --help          argparse only
+- daemon client   a prompt handed to a (stub) daemon socket, POSIX only
+
+The import breakdown comes from `python -X importtime` on the --version path.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+
+LAUNCHER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mycodehelper-complete.py')
+
+
+def run_stub_daemon(socket_path):
+    """Answer every request like a daemon whose run printed one line"""
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(16)
+
+    def serve():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            with conn:
+                conn.makefile('rb').readline()
+                conn.sendall(b'{"stream":"stdout","data":"ok\\n"}\n{"exit":0}\n')
+
+    threading.Thread(target=serve, daemon=True).start()
+    return server
+
+
+def time_invocation(argv, env, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable] + argv, env=env, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL, check=False)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def import_breakdown(env, top):
+    """Parse `-X importtime` output: (cumulative microseconds, module) for top-level imports"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', LAUNCHER, '--version'],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            text=True, check=False)
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, module = line.split('|', 2)
+        if module.startswith('   '):
+            continue  # Nested import, already counted in its parent's cumulative time
+        entries.append((int(cumulative_us), module.strip()))
+    entries.sort(reverse=True)
+    return sum(us for us, _ in entries), entries[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark launcher startup time')
+    parser.add_argument('--runs', type=int, default=15, help='Samples per scenario')
+    parser.add_argument('--top', type=int, default=10, help='Slowest imports to list')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    env = dict(os.environ, LOCAL_AI_API_KEY=os.environ.get('LOCAL_AI_API_KEY', 'local-key'))
+    scenarios = [
+        ('--version', [LAUNCHER, '--version']),
+        ('--help', [LAUNCHER, '--help']),
+    ]
+
+    stub = None
+    temp_dir = tempfile.mkdtemp(prefix='mch-bench-')
+    if hasattr(socket, 'AF_UNIX') and os.name == 'posix':
+        socket_path = os.path.join(temp_dir, 'daemon.sock')
+        stub = run_stub_daemon(socket_path)
+        env['MYCODEHELPER_DAEMON_SOCKET'] = socket_path
+        scenarios.append(('daemon client', [LAUNCHER, '--engine', 'node', '-c', 'ping']))
+
+    baseline = time_invocation(['-c', 'pass'], env, args.runs)
+    results = {'interpreter': statistics.median(baseline)}
+    for name, argv in scenarios:
+        results[name] = statistics.median(time_invocation(argv, env, args.runs))
+
+    total_us, slowest = import_breakdown(env, args.top)
+
+    if stub:
+        stub.close()
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps({
+            'medianMs': {name: round(ms, 2) for name, ms in results.items()},
+            'importMs': round(total_us / 1000, 2),
+            'slowestImports': [{'module': module, 'ms': round(us / 1000, 2)} for us, module in slowest]
+        }, indent=2))
+        return
+
+    print(f"Launcher startup (median of {args.runs} runs)")
+    print("=" * 44)
+    for name, ms in results.items():
+        extra = '' if name == 'interpreter' else f"  (+{ms - results['interpreter']:.1f} ms over bare interpreter)"
+        print(f"  {name:<15} {ms:7.1f} ms{extra}")
+    print()
+    print(f"Top-level imports on the --version path: {total_us / 1000:.1f} ms")
+    for us, module in slowest:
+        print(f"  {us / 1000:7.2f} ms  {module}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,9 +7,13 @@
  */
 
 import { createInterface } from 'readline';
-import { readFileSync, writeFileSync, existsSync, statSync, readdirSync } from 'fs';
-import { join, dirname, basename, extname, resolve } from 'path';
+import { readFileSync, realpathSync, writeFileSync, appendFileSync, renameSync, watch, existsSync, statSync, fstatSync, readdirSync, mkdirSync, chmodSync, openSync, readSync, writeSync, fsyncSync, closeSync, createReadStream, unlinkSync } from 'fs';
+import { join, dirname, basename, extname, resolve, relative, sep } from 'path';
 import { fileURLToPath } from 'url';
+import { createHash, randomBytes } from 'crypto';
+import { homedir } from 'os';
+import { createServer, connect } from 'net';
+import * as zlib from 'zlib';
 
 const __filename = fileURLToPath(import.meta.url);
 const __dirname = dirname(__filename);
@@ -17,46 +21,276 @@ const __dirname = dirname(__filename);
 // Simple fetch implementation for Node.js environments that don't have it
 const fetch = globalThis.fetch || (await import('undici')).fetch;
 
-// Enhanced Configuration with CLI support
-const CONFIG = {
+// Settings, lowest layer first: these defaults, ~/.mycodehelper/config.json, the project's
+// .mycodehelper.json, a --config file, the selected profile, the environment variables in
+// CONFIG_ENV, then command-line flags. Config files use the same (nested) keys as CONFIG.
+const CONFIG_DEFAULTS = {
   LOCAL_AI: {
-    apiKey: process.env.LOCAL_AI_API_KEY || 'local-key',
-    baseUrl: process.env.LOCAL_AI_BASE_URL || 'http://localhost:8080',
-    model: process.env.LOCAL_AI_MODEL || 'llama-3.1-8b'
+    apiKey: 'local-key',
+    baseUrl: 'http://localhost:8080',
+    model: 'llama-3.1-8b'
   },
   HUGGING_FACE: {
-    apiKey: process.env.HUGGING_FACE_API_KEY,
-    model: process.env.HUGGING_FACE_MODEL || 'microsoft/DialoGPT-large'
+    apiKey: undefined,
+    model: 'microsoft/DialoGPT-large',
+    baseUrl: '',
+    api: 'auto',
+    batchSize: 8
   },
-  maxTokens: parseInt(process.env.MYCODEHELPER_MAX_TOKENS || '8192'),
-  temperature: parseFloat(process.env.MYCODEHELPER_TEMPERATURE || '0.7'),
-  defaultProvider: process.env.MYCODEHELPER_DEFAULT_PROVIDER || 'local-ai-api-key',
-  streaming: process.env.MYCODEHELPER_STREAMING !== 'false',
-  outputFormat: process.env.MYCODEHELPER_OUTPUT_FORMAT || 'text',
-  contextWindow: parseInt(process.env.MYCODEHELPER_CONTEXT_WINDOW || '100000'),
-  projectRoot: process.cwd()
+  EMBEDDED: {
+    model: '',
+    threads: 0
+  },
+  maxTokens: 8192,
+  temperature: 0.7,
+  defaultProvider: 'local-ai-api-key',
+  streaming: true,
+  outputFormat: 'text',
+  schema: '',
+  schemaRetries: 2,
+  contextWindow: 100000,
+  outputBudgets: {
+    chat: 4096,
+    review: 4096,
+    edit: 4096,
+    summary: 1024
+  },
+  chunkSize: 24000,
+  contextChunkChars: 4000,
+  fileContextTokens: 6000,
+  tokenizer: '',
+  maxFileSize: 1000000,
+  maxScanFiles: 100,
+  scanIgnoreDirs: ['node_modules', '.git', 'dist', 'build', '.next', '__pycache__'],
+  scanExtensions: ['.js', '.ts', '.jsx', '.tsx', '.py', '.java', '.cpp', '.c', '.cs', '.php', '.rb', '.go', '.rs', '.swift', '.kt'],
+  historyMessages: 10,
+  fileHistoryMessages: 5,
+  analyzeFiles: 10,
+  dedupe: true,
+  nearDuplicateSimilarity: 0.9,
+  tokenCacheWords: 50000,
+  promptCacheEntries: 64,
+  probeTimeout: 1500,
+  requestCompression: 'off',
+  compressMinBytes: 32768,
+  contextWhitespace: 'compact',
+  watchInterval: 2000,
+  concurrency: 1,
+  maxConcurrency: 16,
+  models: '',
+  fanout: 'first',
+  draftModel: '',
+  cascadeMaxFiles: 3,
+  cascadeMaxChars: 12000,
+  cacheDir: join(homedir(), '.mycodehelper', 'cache'),
+  sessionDir: join(homedir(), '.mycodehelper', 'sessions'),
+  profile: ''
 };
 
+const parseBudgets = (value) => Object.fromEntries(value.split(',')
+  .map(pair => pair.split('=').map(part => part.trim()))
+  .filter(([task, tokens]) => task && parseInt(tokens) > 0)
+  .map(([task, tokens]) => [task, parseInt(tokens)]));
+
+// [variable, setting path, parser]; empty variables count as unset
+const CONFIG_ENV = [
+  ['LOCAL_AI_API_KEY', 'LOCAL_AI.apiKey'],
+  ['LOCAL_AI_BASE_URL', 'LOCAL_AI.baseUrl'],
+  ['LOCAL_AI_MODEL', 'LOCAL_AI.model'],
+  ['HUGGING_FACE_API_KEY', 'HUGGING_FACE.apiKey'],
+  ['HUGGING_FACE_MODEL', 'HUGGING_FACE.model'],
+  ['HUGGING_FACE_BASE_URL', 'HUGGING_FACE.baseUrl'],
+  ['HUGGING_FACE_API', 'HUGGING_FACE.api'],
+  ['HUGGING_FACE_BATCH_SIZE', 'HUGGING_FACE.batchSize', parseInt],
+  ['MYCODEHELPER_EMBEDDED_MODEL', 'EMBEDDED.model'],
+  ['MYCODEHELPER_THREADS', 'EMBEDDED.threads', parseInt],
+  ['MYCODEHELPER_MAX_TOKENS', 'maxTokens', parseInt],
+  ['MYCODEHELPER_TEMPERATURE', 'temperature', parseFloat],
+  ['MYCODEHELPER_DEFAULT_PROVIDER', 'defaultProvider'],
+  ['MYCODEHELPER_STREAMING', 'streaming', value => value !== 'false'],
+  ['MYCODEHELPER_OUTPUT_FORMAT', 'outputFormat'],
+  ['MYCODEHELPER_SCHEMA', 'schema'],
+  ['MYCODEHELPER_SCHEMA_RETRIES', 'schemaRetries', parseInt],
+  ['MYCODEHELPER_CONTEXT_WINDOW', 'contextWindow', parseInt],
+  ['MYCODEHELPER_OUTPUT_BUDGETS', 'outputBudgets', parseBudgets],
+  ['MYCODEHELPER_CHUNK_SIZE', 'chunkSize', parseInt],
+  ['MYCODEHELPER_CONTEXT_CHUNK', 'contextChunkChars', parseInt],
+  ['MYCODEHELPER_FILE_CONTEXT_TOKENS', 'fileContextTokens', parseInt],
+  ['MYCODEHELPER_TOKENIZER', 'tokenizer'],
+  ['MYCODEHELPER_MAX_FILE_SIZE', 'maxFileSize', parseInt],
+  ['MYCODEHELPER_MAX_SCAN_FILES', 'maxScanFiles', parseInt],
+  ['MYCODEHELPER_DEDUPE', 'dedupe', value => value !== 'false'],
+  ['MYCODEHELPER_COMPRESS', 'requestCompression'],
+  ['MYCODEHELPER_COMPRESS_MIN_BYTES', 'compressMinBytes', parseInt],
+  ['MYCODEHELPER_CONTEXT_WHITESPACE', 'contextWhitespace'],
+  ['MYCODEHELPER_NEAR_DUPLICATE', 'nearDuplicateSimilarity', parseFloat],
+  ['MYCODEHELPER_WATCH_INTERVAL', 'watchInterval', parseInt],
+  ['MYCODEHELPER_CONCURRENCY', 'concurrency', value => value === 'auto' ? 'auto' : parseInt(value)],
+  ['MYCODEHELPER_MAX_CONCURRENCY', 'maxConcurrency', parseInt],
+  ['MYCODEHELPER_MODELS', 'models'],
+  ['MYCODEHELPER_FANOUT', 'fanout'],
+  ['MYCODEHELPER_DRAFT_MODEL', 'draftModel'],
+  ['MYCODEHELPER_CASCADE_MAX_FILES', 'cascadeMaxFiles', parseInt],
+  ['MYCODEHELPER_CASCADE_MAX_CHARS', 'cascadeMaxChars', parseInt],
+  ['MYCODEHELPER_CACHE_DIR', 'cacheDir'],
+  ['MYCODEHELPER_SESSION_DIR', 'sessionDir'],
+  ['MYCODEHELPER_PROFILE', 'profile']
+];
+
+// Config files are parsed once and re-read only when their size or mtime changes, and the
+// merged result is reused while no layer has changed, so daemon runs pay one stat per file
+class ConfigLoader {
+  static files = new Map();
+  static resolved = null;
+  static filter = null;
+
+  static globalPath() {
+    return join(homedir(), '.mycodehelper', 'config.json');
+  }
+
+  static projectPath(root) {
+    return join(root, '.mycodehelper.json');
+  }
+
+  static fromEnv(env = process.env) {
+    const settings = {};
+    for (const [variable, path, parse = value => value] of CONFIG_ENV) {
+      if (!env[variable]) continue;
+      const keys = path.split('.');
+      const parent = keys.slice(0, -1).reduce((node, key) => (node[key] ??= {}), settings);
+      parent[keys[keys.length - 1]] = parse(env[variable]);
+    }
+    return settings;
+  }
+
+  // Nested objects merge key by key; arrays and scalars replace
+  static merge(base, overrides) {
+    const merged = { ...base };
+    for (const [key, value] of Object.entries(overrides || {})) {
+      if (value === undefined) continue;
+      const nested = value && typeof value === 'object' && !Array.isArray(value);
+      const into = merged[key] && typeof merged[key] === 'object' && !Array.isArray(merged[key]);
+      merged[key] = nested && into ? ConfigLoader.merge(merged[key], value) : value;
+    }
+    return merged;
+  }
+
+  // One config file's entry, or null when it does not exist
+  static read(path) {
+    let stats;
+    try {
+      stats = statSync(path);
+    } catch (error) {
+      ConfigLoader.files.delete(path);
+      return null;
+    }
+    const cached = ConfigLoader.files.get(path);
+    if (cached && cached.mtimeMs === stats.mtimeMs && cached.size === stats.size) return cached;
+    const entry = { path, mtimeMs: stats.mtimeMs, size: stats.size, settings: JSON.parse(readFileSync(path, 'utf-8')) };
+    ConfigLoader.files.set(path, entry);
+    return entry;
+  }
+
+  // {settings, sources, profile, errors} for a project root, an optional --config file and an
+  // optional --profile; profiles come from the "profiles" maps of the files, later files winning
+  static resolve({ root = process.cwd(), configPath = null, profile = null } = {}) {
+    const errors = [];
+    const layers = [];
+    for (const path of [ConfigLoader.globalPath(), ConfigLoader.projectPath(root), configPath]) {
+      if (!path) continue;
+      try {
+        const entry = ConfigLoader.read(resolve(path));
+        if (entry) layers.push(entry);
+        else if (path === configPath) errors.push(`Config file not found: ${path}`);
+      } catch (error) {
+        errors.push(`Could not load config ${path}: ${error.message}`);
+      }
+    }
+
+    // Daemon runs swap in their caller's environment, so it is part of the key
+    const env = ConfigLoader.fromEnv();
+    const key = JSON.stringify([layers.map(layer => [layer.path, layer.mtimeMs, layer.size]), profile, env]);
+    if (ConfigLoader.resolved?.key !== key) {
+      const { profiles = {}, ...files } = layers.reduce((merged, layer) => ConfigLoader.merge(merged, layer.settings), {});
+      const name = profile || env.profile || files.profile || '';
+      const profileErrors = name && !profiles[name]
+        ? [`Unknown profile: ${name} (defined: ${Object.keys(profiles).join(', ') || 'none'})`]
+        : [];
+      const explicit = ConfigLoader.merge(ConfigLoader.merge(files, profiles[name]), env);
+      const settings = ConfigLoader.merge(CONFIG_DEFAULTS, explicit);
+      settings.profile = name;
+      ConfigLoader.resolved = { key, settings, explicit, sources: layers.map(layer => layer.path), profile: name, errors: profileErrors };
+    }
+    return { ...ConfigLoader.resolved, errors: [...errors, ...ConfigLoader.resolved.errors] };
+  }
+
+  // Swap the resolved settings into CONFIG in place; every run starts from its own project's
+  // layers, so one daemon run's settings never leak into the next
+  static apply(options = {}) {
+    const resolved = ConfigLoader.resolve(options);
+    for (const key of Object.keys(CONFIG)) delete CONFIG[key];
+    Object.assign(CONFIG, resolved.settings, { projectRoot: options.root || process.cwd() });
+    return resolved;
+  }
+
+  // Whether a top-level setting came from a file, the profile or the environment rather than
+  // the defaults; before any files are applied only the environment counts
+  static isSet(key) {
+    return Object.hasOwn(ConfigLoader.resolved?.explicit ?? ConfigLoader.fromEnv(), key);
+  }
+
+  // Scan filters as sets, rebuilt only when the configured lists change
+  static get scanFilter() {
+    const filter = ConfigLoader.filter;
+    if (filter?.dirList !== CONFIG.scanIgnoreDirs || filter?.extensionList !== CONFIG.scanExtensions) {
+      ConfigLoader.filter = {
+        dirList: CONFIG.scanIgnoreDirs,
+        extensionList: CONFIG.scanExtensions,
+        ignoreDirs: new Set(CONFIG.scanIgnoreDirs),
+        extensions: new Set(CONFIG.scanExtensions)
+      };
+    }
+    return ConfigLoader.filter;
+  }
+}
+
+// Defaults and environment only; the app applies the config files for its project at startup
+const CONFIG = { ...ConfigLoader.merge(CONFIG_DEFAULTS, ConfigLoader.fromEnv()), projectRoot: process.cwd() };
+
 // CLI Arguments Parser
 class CLIParser {
-  constructor() {
-    this.args = this.parseArgs();
+  constructor(argv = process.argv.slice(2)) {
+    this.args = this.parseArgs(argv);
   }
 
-  parseArgs() {
-    const args = process.argv.slice(2);
+  parseArgs(args) {
     const parsed = {
       interactive: false,
       file: null,
       output: null,
-      format: 'text',
+      format: CONFIG.outputFormat,
+      schema: CONFIG.schema,
       stream: true,
       help: false,
       version: false,
       prompt: null,
       analyze: false,
       codebase: false,
-      config: null
+      config: null,
+      projectRoot: null,
+      daemon: false,
+      watch: false,
+      edit: null,
+      apply: false,
+      resume: null,
+      profile: null,
+      models: CONFIG.models,
+      fanout: CONFIG.fanout,
+      draftModel: CONFIG.draftModel,
+      stdin: false,
+      batch: null,
+      chunkSize: CONFIG.chunkSize,
+      concurrency: CONFIG.concurrency
     };
 
     for (let i = 0; i < args.length; i++) {
@@ -66,10 +300,25 @@ class CLIParser {
         parsed.interactive = true;
       } else if (arg === '--file' || arg === '-f') {
         parsed.file = args[++i];
+        if (parsed.file === '-') {
+          parsed.file = null;
+          parsed.stdin = true;
+        }
+      } else if (arg === '--batch') {
+        parsed.batch = args[++i];
+      } else if (arg === '--stdin') {
+        parsed.stdin = true;
+      } else if (arg === '--chunk-size') {
+        parsed.chunkSize = parseInt(args[++i]);
+      } else if (arg === '--concurrency') {
+        const value = args[++i];
+        parsed.concurrency = value === 'auto' ? 'auto' : Math.max(1, parseInt(value) || 1);
       } else if (arg === '--output' || arg === '-o') {
         parsed.output = args[++i];
       } else if (arg === '--format') {
         parsed.format = args[++i];
+      } else if (arg === '--schema') {
+        parsed.schema = args[++i];
       } else if (arg === '--no-stream') {
         parsed.stream = false;
       } else if (arg === '--help' || arg === '-h') {
@@ -82,6 +331,26 @@ class CLIParser {
         parsed.codebase = true;
       } else if (arg === '--config') {
         parsed.config = args[++i];
+      } else if (arg === '--profile') {
+        parsed.profile = args[++i];
+      } else if (arg === '--project-root') {
+        parsed.projectRoot = args[++i];
+      } else if (arg === '--daemon') {
+        parsed.daemon = true;
+      } else if (arg === '--watch') {
+        parsed.watch = true;
+      } else if (arg === '--edit') {
+        parsed.edit = args[++i];
+      } else if (arg === '--apply') {
+        parsed.apply = true;
+      } else if (arg === '--resume') {
+        parsed.resume = args[++i];
+      } else if (arg === '--models') {
+        parsed.models = args[++i];
+      } else if (arg === '--fanout') {
+        parsed.fanout = args[++i];
+      } else if (arg === '--draft-model') {
+        parsed.draftModel = args[++i];
       } else if (!arg.startsWith('-') && !parsed.prompt) {
         parsed.prompt = args.slice(i).join(' ');
         break;
@@ -92,19 +361,159 @@ class CLIParser {
   }
 }
 
+// File sniffing - the first block of a file classifies it as text, binary, minified or a
+// lockfile and picks its encoding before anything else is read. Binaries are never read past
+// that block, and low-value text reaches prompts as a short summary instead of its content.
+const SNIFF_BLOCK_BYTES = 8192;
+const SNIFF_KINDS = ['unknown', 'text', 'binary', 'minified', 'lockfile'];
+const LOCKFILE_NAMES = new Set(['package-lock.json', 'npm-shrinkwrap.json', 'yarn.lock', 'pnpm-lock.yaml', 'bun.lockb', 'Cargo.lock', 'poetry.lock', 'Pipfile.lock', 'uv.lock', 'composer.lock', 'Gemfile.lock', 'go.sum', 'flake.lock', 'packages.lock.json']);
+const MINIFIED_NAME = /[.-]min\.(js|mjs|cjs|css)$|\.bundle\.js$/;
+const BINARY_SIGNATURES = [
+  [0x89, 0x50, 0x4e, 0x47], // PNG
+  [0xff, 0xd8, 0xff], // JPEG
+  [0x47, 0x49, 0x46, 0x38], // GIF
+  [0x25, 0x50, 0x44, 0x46], // PDF
+  [0x50, 0x4b, 0x03, 0x04], // ZIP, JAR, Office
+  [0x1f, 0x8b], // gzip
+  [0x7f, 0x45, 0x4c, 0x46], // ELF
+  [0xcf, 0xfa, 0xed, 0xfe] // Mach-O
+];
+const SUMMARY_LINES = 20;
+const SUMMARY_CHARS = 400;
+
+class FileSniffer {
+  static nameKind(name) {
+    if (LOCKFILE_NAMES.has(name)) return 'lockfile';
+    if (MINIFIED_NAME.test(name)) return 'minified';
+    return null;
+  }
+
+  // {kind, encoding, bom} from a file's first block
+  static classify(head, name = '') {
+    const binary = { kind: 'binary', encoding: null, bom: 0 };
+    if (BINARY_SIGNATURES.some(signature => signature.every((byte, i) => head[i] === byte))) return binary;
+    if (head[0] === 0xff && head[1] === 0xfe) return { kind: FileSniffer.nameKind(name) || 'text', encoding: 'utf-16le', bom: 2 };
+    if (head[0] === 0xfe && head[1] === 0xff) return { kind: FileSniffer.nameKind(name) || 'text', encoding: 'utf-16be', bom: 2 };
+
+    let control = 0;
+    let newlines = 0;
+    for (const byte of head) {
+      if (byte === 0) return binary;
+      if (byte === 0x0a) newlines++;
+      else if (byte < 0x09 || (byte > 0x0d && byte < 0x20 && byte !== 0x1b)) control++;
+    }
+    if (control > head.length * 0.1) return binary;
+
+    let encoding = 'utf-8';
+    if (!FileSniffer.isUtf8(head)) {
+      // Legacy single-byte text, unless the bytes look random (compressed or encrypted data)
+      if (FileSniffer.entropy(head) > 7.5) return binary;
+      encoding = 'latin1';
+    }
+    const bom = head[0] === 0xef && head[1] === 0xbb && head[2] === 0xbf ? 3 : 0;
+    // Bundles and data blobs: a full block with hardly any line breaks
+    const minified = head.length >= 2048 && head.length / (newlines + 1) > 250;
+    return { kind: FileSniffer.nameKind(name) || (minified ? 'minified' : 'text'), encoding, bom };
+  }
+
+  static isUtf8(bytes) {
+    try {
+      // Streaming mode tolerates a character cut off at the end of the block
+      new TextDecoder('utf-8', { fatal: true }).decode(bytes, { stream: true });
+      return true;
+    } catch (error) {
+      return false;
+    }
+  }
+
+  // Shannon entropy in bits per byte
+  static entropy(bytes) {
+    const counts = new Uint32Array(256);
+    for (const byte of bytes) counts[byte]++;
+    let bits = 0;
+    for (const count of counts) {
+      if (count > 0) {
+        const p = count / bytes.length;
+        bits -= p * Math.log2(p);
+      }
+    }
+    return bits;
+  }
+
+  // {content, kind, encoding, bom}; content is empty for binaries
+  static read(filepath) {
+    const fd = openSync(filepath, 'r');
+    try {
+      const size = fstatSync(fd).size;
+      const head = Buffer.alloc(Math.min(size, SNIFF_BLOCK_BYTES));
+      const headBytes = readSync(fd, head, 0, head.length, 0);
+      const sniffed = FileSniffer.classify(head.subarray(0, headBytes), basename(filepath));
+      if (sniffed.kind === 'binary' || headBytes === size) {
+        return { ...sniffed, content: sniffed.kind === 'binary' ? '' : FileSniffer.decode(head.subarray(0, headBytes), sniffed) };
+      }
+
+      const buffer = Buffer.allocUnsafe(size);
+      head.copy(buffer, 0, 0, headBytes);
+      let read = headBytes;
+      while (read < size) {
+        const count = readSync(fd, buffer, read, size - read, read);
+        if (count === 0) break;
+        read += count;
+      }
+      return { ...sniffed, content: FileSniffer.decode(buffer.subarray(0, read), sniffed) };
+    } finally {
+      closeSync(fd);
+    }
+  }
+
+  static decode(bytes, { encoding, bom }) {
+    if (encoding === 'utf-16le') return bytes.toString('utf16le', bom);
+    if (encoding === 'utf-16be') {
+      const swapped = Buffer.from(bytes.subarray(bom, bom + ((bytes.length - bom) & ~1)));
+      return swapped.swap16().toString('utf16le');
+    }
+    return bytes.toString(encoding === 'latin1' ? 'latin1' : 'utf-8', bom);
+  }
+
+  // Back to the file's own encoding (and byte order mark) for writes
+  static encode(content, { encoding = 'utf-8', bom = 0 } = {}) {
+    if (encoding === 'utf-16le' || encoding === 'utf-16be') {
+      const bytes = Buffer.from(`\ufeff${content}`, 'utf16le');
+      return encoding === 'utf-16be' ? bytes.swap16() : bytes;
+    }
+    if (encoding === 'latin1') return Buffer.from(content, 'latin1');
+    return Buffer.from(bom ? `\ufeff${content}` : content, 'utf-8');
+  }
+
+  // What a prompt gets instead of a binary, minified bundle or lockfile
+  static summarize(file) {
+    const size = `${(file.size / 1024).toFixed(1)} KB`;
+    if (file.kind === 'binary') return `[binary file, ${size} - contents omitted]`;
+    const content = file.content;
+    const lines = content.split('\n');
+    if (file.kind === 'lockfile') {
+      return `[lockfile, ${size}, ${lines.length} lines - first ${Math.min(SUMMARY_LINES, lines.length)} shown]\n${lines.slice(0, SUMMARY_LINES).join('\n')}`;
+    }
+    return `[minified, ${size} on ${lines.length} lines - first ${Math.min(SUMMARY_CHARS, content.length)} characters shown]\n${content.slice(0, SUMMARY_CHARS)}`;
+  }
+}
+
 // File System Utilities
 class FileUtils {
   static readFile(filepath) {
     try {
       if (!existsSync(filepath)) return null;
-      const content = readFileSync(filepath, 'utf-8');
       const stats = statSync(filepath);
+      const { content, kind, encoding, bom } = FileSniffer.read(filepath);
       return {
         path: filepath,
         content,
         size: stats.size,
         modified: stats.mtime,
-        extension: extname(filepath)
+        extension: extname(filepath),
+        kind,
+        encoding,
+        bom
       };
     } catch (error) {
       console.error(`Error reading file ${filepath}:`, error.message);
@@ -112,9 +521,10 @@ class FileUtils {
     }
   }
 
-  static writeFile(filepath, content) {
+  // Pass the file read earlier to keep its encoding; new files are written as UTF-8
+  static writeFile(filepath, content, original = null) {
     try {
-      writeFileSync(filepath, content, 'utf-8');
+      writeFileSync(filepath, FileSniffer.encode(content, original || {}));
       return true;
     } catch (error) {
       console.error(`Error writing file ${filepath}:`, error.message);
@@ -122,28 +532,33 @@ class FileUtils {
     }
   }
 
-  static analyzeCodebase(rootPath = '.', maxFiles = 100) {
-    const files = [];
-    const ignoreDirs = new Set(['node_modules', '.git', 'dist', 'build', '.next', '__pycache__']);
-    const codeExts = new Set(['.js', '.ts', '.jsx', '.tsx', '.py', '.java', '.cpp', '.c', '.cs', '.php', '.rb', '.go', '.rs', '.swift', '.kt']);
+  // Paths in the result are relative to rootPath so they stay meaningful from any working directory.
+  // Only metadata is collected; contents are read lazily through the ScanResult.
+  static analyzeCodebase(rootPath = CONFIG.projectRoot, maxFiles = CONFIG.maxScanFiles) {
+    const scan = new ScanResult(rootPath);
+    const { ignoreDirs, extensions } = ConfigLoader.scanFilter;
 
     const scanDir = (dir, depth = 0) => {
-      if (depth > 5 || files.length >= maxFiles) return;
+      if (depth > 5 || scan.length >= maxFiles) return;
       
       try {
         const entries = readdirSync(dir, { withFileTypes: true });
         
         for (const entry of entries) {
-          if (files.length >= maxFiles) break;
+          if (scan.length >= maxFiles) break;
           
           const fullPath = join(dir, entry.name);
           
           if (entry.isDirectory() && !ignoreDirs.has(entry.name)) {
             scanDir(fullPath, depth + 1);
-          } else if (entry.isFile() && codeExts.has(extname(entry.name))) {
-            const file = this.readFile(fullPath);
-            if (file && file.size < 100000) { // Skip very large files
-              files.push(file);
+          } else if (entry.isFile() && extensions.has(extname(entry.name)) && !MINIFIED_NAME.test(entry.name)) {
+            try {
+              const stats = statSync(fullPath);
+              if (stats.size < CONFIG.maxFileSize) { // Large files are sent as chunks, not whole
+                scan.add(relative(rootPath, fullPath), extname(entry.name), stats.size, stats.mtimeMs);
+              }
+            } catch (error) {
+              // Vanished or unreadable - skip it
             }
           }
         }
@@ -153,77 +568,2302 @@ class FileUtils {
     };
 
     scanDir(rootPath);
-    return files;
+    return scan;
+  }
+
+  static parseBatchLine(line) {
+    const trimmed = line.trim();
+    if (!trimmed || trimmed.startsWith('#')) return null;
+    if (trimmed.startsWith('{')) {
+      try {
+        const item = JSON.parse(trimmed);
+        return item.prompt || item.file ? item : null;
+      } catch (error) {
+        // Not JSON after all - treat it as a plain prompt
+      }
+    }
+    return { prompt: trimmed };
+  }
+
+  // Only pipes and redirected files count; a TTY or /dev/null on stdin means no input
+  static isPipedInput() {
+    try {
+      const stats = fstatSync(0);
+      return stats.isFIFO() || stats.isFile();
+    } catch (error) {
+      return false;
+    }
+  }
+
+  // Split a text stream into line-aligned chunks of at most maxChars without buffering the whole input
+  static async *readChunks(stream, maxChars) {
+    let buffer = '';
+    let line = 1;
+
+    const take = (length) => {
+      const text = buffer.slice(0, length);
+      buffer = buffer.slice(length);
+      let newlines = 0;
+      for (let i = text.indexOf('\n'); i !== -1; i = text.indexOf('\n', i + 1)) newlines++;
+      const chunk = {
+        text,
+        startLine: line,
+        endLine: line + newlines - (text.endsWith('\n') ? 1 : 0)
+      };
+      line += newlines;
+      return chunk;
+    };
+
+    stream.setEncoding?.('utf-8');
+    for await (const data of stream) {
+      buffer += data;
+      while (buffer.length >= maxChars) {
+        const cut = buffer.lastIndexOf('\n', maxChars - 1);
+        yield take(cut > 0 ? cut + 1 : maxChars);
+      }
+    }
+    if (buffer.length > 0) {
+      yield take(buffer.length);
+    }
   }
 
-  static getProjectSummary(rootPath = '.') {
-    const files = this.analyzeCodebase(rootPath, 50);
+  // Summarizes the first 50 scanned files; pass an existing scan to avoid walking the tree twice
+  static getProjectSummary(rootPath = CONFIG.projectRoot, scan = null) {
+    scan = scan || this.analyzeCodebase(rootPath, 50);
+    const count = Math.min(scan.length, 50);
     const summary = {
-      totalFiles: files.length,
+      totalFiles: count,
       languages: {},
       totalLines: 0,
       structure: {},
       mainFiles: []
     };
 
-    files.forEach(file => {
-      const ext = file.extension;
+    for (let i = 0; i < count; i++) {
+      const ext = scan.extension(i);
       summary.languages[ext] = (summary.languages[ext] || 0) + 1;
-      summary.totalLines += file.content.split('\n').length;
+      summary.totalLines += scan.lineCount(i);
       
       // Track main files
-      const name = basename(file.path).toLowerCase();
+      const name = basename(scan.paths[i]).toLowerCase();
       if (['index', 'main', 'app', 'server', 'package.json', 'readme'].some(main => name.includes(main))) {
-        summary.mainFiles.push(file.path);
+        summary.mainFiles.push(scan.paths[i]);
       }
-    });
+    }
 
     return summary;
   }
 }
 
-// Enhanced AI Clients with streaming and file support
-class LocalAIClient {
-  constructor(config) {
-    this.config = config;
+// Compact scan result - one row per file in parallel columns (interned extensions, typed
+// arrays for sizes, mtimes and line counts) instead of one object with its content per file.
+// Contents are read from disk on demand, with a small LRU so repeated reads stay cheap.
+const SCAN_CONTENT_CACHE_CHARS = 4 * 1024 * 1024;
+
+class ScanResult {
+  constructor(rootPath) {
+    this.rootPath = rootPath;
+    this.length = 0;
+    this.paths = [];
+    this.extensions = [];
+    this.extensionIds = new Map();
+    this.extIds = new Uint16Array(256);
+    this.sizes = new Float64Array(256);
+    this.mtimes = new Float64Array(256);
+    this.lines = new Uint32Array(256); // 0 until counted
+    this.kinds = new Uint8Array(256); // SNIFF_KINDS index, 0 until read
+    this.cache = new Map();
+    this.cachedChars = 0;
+  }
+
+  add(path, extension, size, mtimeMs) {
+    if (this.length === this.sizes.length) this.grow();
+    if (!this.extensionIds.has(extension)) {
+      this.extensionIds.set(extension, this.extensions.length);
+      this.extensions.push(extension);
+    }
+    const i = this.length++;
+    this.paths.push(path);
+    this.extIds[i] = this.extensionIds.get(extension);
+    this.sizes[i] = size;
+    this.mtimes[i] = mtimeMs;
+  }
+
+  grow() {
+    for (const column of ['extIds', 'sizes', 'mtimes', 'lines', 'kinds']) {
+      const next = new this[column].constructor(this[column].length * 2);
+      next.set(this[column]);
+      this[column] = next;
+    }
+  }
+
+  extension(i) {
+    return this.extensions[this.extIds[i]];
+  }
+
+  content(i) {
+    const path = this.paths[i];
+    const cached = this.cache.get(path);
+    if (cached !== undefined) {
+      this.cache.delete(path);
+      this.cache.set(path, cached);
+      return cached;
+    }
+
+    let content = '';
+    try {
+      const read = FileSniffer.read(join(this.rootPath, path));
+      content = read.content;
+      this.kinds[i] = SNIFF_KINDS.indexOf(read.kind);
+    } catch (error) {
+      // Deleted since the scan - treat as empty
+    }
+    this.cache.set(path, content);
+    this.cachedChars += content.length;
+    for (const [oldest, text] of this.cache) {
+      if (this.cachedChars <= SCAN_CONTENT_CACHE_CHARS || oldest === path) break;
+      this.cache.delete(oldest);
+      this.cachedChars -= text.length;
+    }
+    return content;
+  }
+
+  lineCount(i) {
+    if (this.lines[i] === 0) {
+      const content = this.content(i);
+      let count = 1;
+      for (let at = content.indexOf('\n'); at !== -1; at = content.indexOf('\n', at + 1)) count++;
+      this.lines[i] = count;
+    }
+    return this.lines[i];
+  }
+
+  // A readFile()-shaped view; content is only read when accessed
+  file(i) {
+    const scan = this;
+    return {
+      path: this.paths[i],
+      size: this.sizes[i],
+      modified: new Date(this.mtimes[i]),
+      extension: this.extension(i),
+      get content() {
+        return scan.content(i);
+      },
+      get kind() {
+        if (scan.kinds[i] === 0) scan.content(i);
+        return SNIFF_KINDS[scan.kinds[i]] || 'text';
+      }
+    };
+  }
+
+  slice(start = 0, end = this.length) {
+    const files = [];
+    for (let i = Math.max(0, start); i < Math.min(end, this.length); i++) files.push(this.file(i));
+    return files;
+  }
+
+  *[Symbol.iterator]() {
+    for (let i = 0; i < this.length; i++) yield this.file(i);
+  }
+}
+
+// Symbol Index - definitions, imports and references extracted during the scan
+const SYMBOL_PATTERNS = {
+  js: {
+    extensions: ['.js', '.jsx', '.ts', '.tsx', '.mjs', '.cjs'],
+    definitions: [
+      ['function', /^[ \t]*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*([A-Za-z_$][\w$]*)/gm],
+      ['class', /^[ \t]*(?:export\s+)?(?:default\s+)?(?:abstract\s+)?class\s+([A-Za-z_$][\w$]*)/gm],
+      ['function', /^[ \t]*(?:export\s+)?(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*=\s*(?:async\s*)?(?:\([^)]*\)|[A-Za-z_$][\w$]*)\s*=>/gm],
+      ['method', /^[ \t]+(?:static\s+)?(?:async\s+)?([A-Za-z_$][\w$]*)\s*\([^)]*\)\s*\{/gm],
+      ['type', /^[ \t]*(?:export\s+)?(?:interface|type|enum)\s+([A-Za-z_$][\w$]*)/gm]
+    ],
+    imports: [
+      /^[ \t]*import\s+(?:[^'"]*?\s+from\s+)?['"]([^'"]+)['"]/gm,
+      /require\(\s*['"]([^'"]+)['"]\s*\)/g
+    ]
+  },
+  py: {
+    extensions: ['.py'],
+    definitions: [
+      ['function', /^[ \t]*(?:async\s+)?def\s+([A-Za-z_]\w*)/gm],
+      ['class', /^[ \t]*class\s+([A-Za-z_]\w*)/gm]
+    ],
+    imports: [
+      /^[ \t]*from\s+([\w.]+)\s+import/gm,
+      /^[ \t]*import\s+([\w.]+)/gm
+    ]
+  },
+  go: {
+    extensions: ['.go'],
+    definitions: [
+      ['function', /^func\s+(?:\([^)]*\)\s*)?([A-Za-z_]\w*)/gm],
+      ['type', /^type\s+([A-Za-z_]\w*)/gm]
+    ],
+    imports: [/^\s*(?:import\s+)?(?:[A-Za-z_.]\w*\s+)?"([^"]+)"/gm]
+  },
+  rs: {
+    extensions: ['.rs'],
+    definitions: [
+      ['function', /^[ \t]*(?:pub(?:\([^)]*\))?\s+)?(?:async\s+)?fn\s+([A-Za-z_]\w*)/gm],
+      ['type', /^[ \t]*(?:pub(?:\([^)]*\))?\s+)?(?:struct|enum|trait|type)\s+([A-Za-z_]\w*)/gm]
+    ],
+    imports: [/^[ \t]*use\s+([\w:]+)/gm, /^[ \t]*mod\s+([A-Za-z_]\w*)\s*;/gm]
+  },
+  c: {
+    extensions: ['.c', '.cpp', '.cs', '.java', '.kt', '.swift'],
+    definitions: [
+      ['class', /^[ \t]*(?:(?:public|private|protected|internal|abstract|final|sealed|static|open|data)\s+)*(?:class|struct|interface|enum|protocol)\s+([A-Za-z_]\w*)/gm],
+      ['function', /^[ \t]*(?:(?:public|private|protected|internal|static|virtual|override|final|inline|async)\s+)*(?:fun|func)\s+([A-Za-z_]\w*)/gm],
+      ['function', /^[ \t]*(?:(?:public|private|protected|internal|static|virtual|override|final|inline|async|const|unsigned)\s+)*[A-Za-z_][\w<>,:*&\[\] ]*\s+\**([A-Za-z_]\w*)\s*\([^;{]*\)\s*(?:const\s*)?\{/gm]
+    ],
+    imports: [/^[ \t]*#include\s+["<]([^">]+)[">]/gm, /^[ \t]*(?:import|using)\s+([\w.]+)/gm]
+  },
+  rb: {
+    extensions: ['.rb'],
+    definitions: [
+      ['function', /^[ \t]*def\s+(?:self\.)?([A-Za-z_]\w*[?!]?)/gm],
+      ['class', /^[ \t]*(?:class|module)\s+([A-Z]\w*)/gm]
+    ],
+    imports: [/^[ \t]*require(?:_relative)?\s+['"]([^'"]+)['"]/gm]
+  },
+  php: {
+    extensions: ['.php'],
+    definitions: [
+      ['function', /^[ \t]*(?:(?:public|private|protected|static|abstract|final)\s+)*function\s+([A-Za-z_]\w*)/gm],
+      ['class', /^[ \t]*(?:abstract\s+|final\s+)?(?:class|interface|trait)\s+([A-Za-z_]\w*)/gm]
+    ],
+    imports: [/^[ \t]*use\s+([\w\\]+)/gm, /(?:require|include)(?:_once)?\s*\(?\s*['"]([^'"]+)['"]/g]
+  }
+};
+
+const SYMBOL_KEYWORDS = new Set(['if', 'for', 'while', 'switch', 'catch', 'return', 'function', 'else', 'new', 'typeof', 'constructor']);
+const SYMBOL_INDEX_VERSION = 4;
+
+class SymbolIndex {
+  static instances = new Map();
+
+  constructor(rootPath) {
+    this.rootPath = resolve(rootPath);
+    this.indexPath = join(CONFIG.cacheDir, SymbolIndex.rootKey(this.rootPath), 'symbols.json');
+    this.files = {};
+    this.definitions = new Map();
+    this.changedChunks = 0;
+    this.tokenizer = null;
+    this.dirty = false;
+  }
+
+  static rootKey(rootPath) {
+    return createHash('sha1').update(resolve(rootPath)).digest('hex').slice(0, 16);
+  }
+
+  static languageFor(extension) {
+    for (const [lang, spec] of Object.entries(SYMBOL_PATTERNS)) {
+      if (spec.extensions.includes(extension)) return lang;
+    }
+    return null;
+  }
+
+  static load(rootPath = CONFIG.projectRoot) {
+    // A long-lived daemon keeps indexes in memory; update() still revalidates them against the scan
+    const warm = SymbolIndex.instances.get(resolve(rootPath));
+    if (warm) return warm.useTokenizer(TokenCounter.current.id);
+
+    const index = new SymbolIndex(rootPath);
+    SymbolIndex.instances.set(index.rootPath, index);
+    try {
+      if (existsSync(index.indexPath)) {
+        const data = JSON.parse(readFileSync(index.indexPath, 'utf-8'));
+        if (data.version === SYMBOL_INDEX_VERSION) {
+          index.files = data.files || {};
+          index.tokenizer = data.tokenizer;
+        }
+      }
+    } catch (error) {
+      // Corrupt or unreadable index - rebuild from scratch
+    }
+    index.rebuildDefinitions();
+    return index.useTokenizer(TokenCounter.current.id);
+  }
+
+  // Counts from another tokenizer are recomputed on the next update
+  useTokenizer(id) {
+    if (this.tokenizer !== id) {
+      for (const entry of Object.values(this.files)) entry.tokens = null;
+      this.tokenizer = id;
+    }
+    return this;
+  }
+
+  static extract(content, lang) {
+    const spec = SYMBOL_PATTERNS[lang];
+    const lineStarts = [0];
+    for (let i = content.indexOf('\n'); i !== -1; i = content.indexOf('\n', i + 1)) {
+      lineStarts.push(i + 1);
+    }
+    const lineAt = (offset) => {
+      let lo = 0;
+      let hi = lineStarts.length - 1;
+      while (lo < hi) {
+        const mid = (lo + hi + 1) >> 1;
+        if (lineStarts[mid] <= offset) lo = mid; else hi = mid - 1;
+      }
+      return lo + 1;
+    };
+
+    const definitions = [];
+    const seen = new Set();
+    for (const [kind, pattern] of spec.definitions) {
+      pattern.lastIndex = 0;
+      for (const match of content.matchAll(pattern)) {
+        const name = match[1];
+        const line = lineAt(match.index + match[0].indexOf(name));
+        if (SYMBOL_KEYWORDS.has(name) || seen.has(`${name}:${line}`)) continue;
+        seen.add(`${name}:${line}`);
+        definitions.push({ name, kind, line });
+      }
+    }
+    definitions.sort((a, b) => a.line - b.line);
+
+    const imports = new Set();
+    for (const pattern of spec.imports) {
+      pattern.lastIndex = 0;
+      for (const match of content.matchAll(pattern)) {
+        imports.add(match[1]);
+      }
+    }
+
+    const identifiers = new Set(content.match(/[A-Za-z_$][\w$]{2,}/g) || []);
+
+    return {
+      definitions,
+      imports: [...imports],
+      identifiers: [...identifiers],
+      lines: lineStarts.length
+    };
+  }
+
+  // Re-extract only files whose size or mtime changed since the cached entry
+  update(files) {
+    const live = new Set();
+    for (const file of files) {
+      const lang = SymbolIndex.languageFor(file.extension);
+      if (!lang) continue;
+      const rel = relative(this.rootPath, resolve(this.rootPath, file.path));
+      const mtimeMs = file.modified instanceof Date ? file.modified.getTime() : file.modified;
+      live.add(rel);
+
+      const cached = this.files[rel];
+      if (cached && cached.size === file.size && cached.mtimeMs === mtimeMs && cached.tokens != null) continue;
+
+      this.files[rel] = this.indexEntry(file, lang, mtimeMs, cached);
+      this.dirty = true;
+    }
+
+    for (const rel of Object.keys(this.files)) {
+      if (!live.has(rel)) {
+        delete this.files[rel];
+        this.dirty = true;
+      }
+    }
+
+    this.rebuildDefinitions();
+    return this;
+  }
+
+  indexEntry(file, lang, mtimeMs, cached = null) {
+    // Binaries and minified bundles are remembered (so they are not re-read) but not indexed
+    if (file.kind && file.kind !== 'text') {
+      return { size: file.size, mtimeMs, lang, kind: file.kind, definitions: [], imports: [], identifiers: [], lines: 0, chunks: [], tokens: 0 };
+    }
+    const extracted = SymbolIndex.extract(file.content, lang);
+    const counter = TokenCounter.current;
+    const known = new Map((cached?.chunks || []).map(chunk => [chunk.hash, chunk]));
+    const chunks = ContentChunker.split(file.content, lang, { definitions: extracted.definitions })
+      .map(({ text, ...chunk }) => {
+        // Unchanged chunks keep their count unless the tokenizer changed
+        const previous = known.get(chunk.hash);
+        if (!previous) this.changedChunks++;
+        const tokens = previous?.tokens != null && cached.tokens != null ? previous.tokens : counter.count(text);
+        return { ...chunk, tokens };
+      });
+    const tokens = chunks.reduce((total, chunk) => total + chunk.tokens, 0);
+    return { size: file.size, mtimeMs, lang, ...extracted, chunks, tokens };
+  }
+
+  // Re-index individual files (watch mode) without walking the tree
+  refresh(paths) {
+    let changed = 0;
+    for (const rel of paths) {
+      const lang = SymbolIndex.languageFor(extname(rel));
+      if (!lang) continue;
+
+      const cached = this.files[rel];
+      const fullPath = join(this.rootPath, rel);
+      let stats = null;
+      try {
+        stats = statSync(fullPath);
+      } catch (error) {
+        // Deleted
+      }
+
+      if (!stats || !stats.isFile() || stats.size >= CONFIG.maxFileSize) {
+        if (cached) {
+          this.removeDefinitions(rel, cached);
+          delete this.files[rel];
+          this.dirty = true;
+          changed++;
+        }
+        continue;
+      }
+      if (cached && cached.size === stats.size && cached.mtimeMs === stats.mtimeMs && cached.tokens != null) continue;
+      if (!cached && Object.keys(this.files).length >= CONFIG.maxScanFiles) continue;
+
+      const file = FileUtils.readFile(fullPath);
+      if (!file) continue;
+      if (cached) this.removeDefinitions(rel, cached);
+      this.files[rel] = this.indexEntry(file, lang, stats.mtimeMs, cached);
+      this.addDefinitions(rel, this.files[rel]);
+      this.dirty = true;
+      changed++;
+    }
+    return changed;
+  }
+
+  addDefinitions(rel, entry) {
+    for (const def of entry.definitions) {
+      if (!this.definitions.has(def.name)) this.definitions.set(def.name, []);
+      this.definitions.get(def.name).push({ ...def, file: rel });
+    }
+  }
+
+  removeDefinitions(rel, entry) {
+    for (const def of entry.definitions) {
+      const remaining = (this.definitions.get(def.name) || []).filter(other => other.file !== rel);
+      if (remaining.length > 0) {
+        this.definitions.set(def.name, remaining);
+      } else {
+        this.definitions.delete(def.name);
+      }
+    }
+  }
+
+  rebuildDefinitions() {
+    this.definitions = new Map();
+    for (const [rel, entry] of Object.entries(this.files)) {
+      this.addDefinitions(rel, entry);
+    }
+  }
+
+  save() {
+    if (!this.dirty) return;
+    try {
+      mkdirSync(dirname(this.indexPath), { recursive: true });
+      writeFileSync(this.indexPath, JSON.stringify({
+        version: SYMBOL_INDEX_VERSION,
+        root: this.rootPath,
+        tokenizer: this.tokenizer,
+        files: this.files
+      }), 'utf-8');
+      this.dirty = false;
+    } catch (error) {
+      // The index is an optimisation; failing to persist it is not fatal
+    }
+  }
+
+  // Resolve an import specifier to an indexed file, or null for external modules
+  resolveImport(fromRel, specifier, lang) {
+    const candidates = [];
+    if (lang === 'py') {
+      const base = specifier.replace(/^\.+/, '').replace(/\./g, '/');
+      const leadingDots = specifier.match(/^\.*/)[0].length;
+      let dir = leadingDots > 0 ? dirname(fromRel) : '';
+      for (let i = 1; i < leadingDots; i++) dir = dirname(dir);
+      const target = join(dir, base);
+      candidates.push(`${target}.py`, join(target, '__init__.py'));
+    } else if (specifier.startsWith('.')) {
+      const target = join(dirname(fromRel), specifier);
+      candidates.push(target);
+      for (const ext of SYMBOL_PATTERNS[lang]?.extensions || []) {
+        candidates.push(`${target}${ext}`, join(target, `index${ext}`));
+      }
+    } else {
+      candidates.push(specifier, join(dirname(fromRel), specifier));
+    }
+    return candidates.find(candidate => this.files[candidate]) || null;
+  }
+
+  dependenciesOf(rel) {
+    const entry = this.files[rel];
+    if (!entry) return [];
+    return entry.imports
+      .map(specifier => this.resolveImport(rel, specifier, entry.lang))
+      .filter(Boolean);
+  }
+
+  referencesTo(name) {
+    return Object.keys(this.files).filter(rel =>
+      this.files[rel].identifiers.includes(name) &&
+      !this.files[rel].definitions.some(def => def.name === name)
+    );
+  }
+
+  lookup(query) {
+    const exact = this.definitions.get(query);
+    if (exact) return exact;
+    const lower = query.toLowerCase();
+    const matches = [];
+    for (const [name, defs] of this.definitions) {
+      if (name.toLowerCase().includes(lower)) matches.push(...defs);
+    }
+    return matches;
+  }
+
+  // Lines from a definition up to (not including) the next definition in the same file
+  readDefinition(def, maxLines = 120, sources = new Map()) {
+    const entry = this.files[def.file];
+    if (!entry) return null;
+    // One read per file per prompt build, however many of its definitions are pulled in
+    if (!sources.has(def.file)) {
+      const fullPath = join(this.rootPath, def.file);
+      sources.set(def.file, existsSync(fullPath) ? FileSniffer.read(fullPath).content.split('\n') : null);
+    }
+    const source = sources.get(def.file);
+    if (!source) return null;
+
+    const next = entry.definitions.find(other => other.line > def.line);
+    const end = Math.min(next ? next.line - 1 : entry.lines, def.line + maxLines - 1);
+    const lines = source.slice(def.line - 1, end);
+    while (lines.length > 1 && lines[lines.length - 1].trim() === '') lines.pop();
+
+    return {
+      path: `${def.file}:${def.line}-${def.line + lines.length - 1}`,
+      content: lines.join('\n'),
+      size: lines.reduce((total, line) => total + line.length + 1, 0),
+      extension: extname(def.file)
+    };
+  }
+
+  // Definitions mentioned in the prompt plus the definitions they depend on
+  selectContext(prompt, { maxSnippets = 12, maxTokens = 15000 } = {}) {
+    const mentioned = new Set(prompt.match(/[A-Za-z_$][\w$]{2,}/g) || []);
+    const queue = [];
+    for (const name of mentioned) {
+      const defs = this.definitions.get(name);
+      if (defs) queue.push(...defs);
+    }
+
+    const snippets = [];
+    const visited = new Set();
+    const contents = new Set();
+    const sources = new Map();
+    let totalTokens = 0;
+
+    while (queue.length > 0 && snippets.length < maxSnippets) {
+      const def = queue.shift();
+      const key = `${def.file}:${def.line}`;
+      if (visited.has(key)) continue;
+      visited.add(key);
+
+      const snippet = this.readDefinition(def, 120, sources);
+      if (!snippet) continue;
+      // Copies of a snippet already chosen are only named in the prompt, so cost nothing
+      const hash = CONFIG.dedupe ? Deduplicator.fingerprint(snippet).hash : key;
+      snippet.tokens = contents.has(hash) ? 0 : TokenCounter.current.count(snippet.content);
+      if (totalTokens + snippet.tokens > maxTokens) continue;
+      snippets.push(snippet);
+      contents.add(hash);
+      totalTokens += snippet.tokens;
+
+      // Follow identifiers used by this definition into its own file and its imports
+      const scope = new Set([def.file, ...this.dependenciesOf(def.file)]);
+      const used = new Set(snippet.content.match(/[A-Za-z_$][\w$]{2,}/g) || []);
+      used.delete(def.name);
+      for (const name of used) {
+        for (const dep of this.definitions.get(name) || []) {
+          if (scope.has(dep.file)) queue.push(dep);
+        }
+      }
+    }
+
+    return snippets;
+  }
+
+  getStats() {
+    const entries = Object.values(this.files);
+    return {
+      indexedFiles: entries.length,
+      definitions: entries.reduce((total, entry) => total + entry.definitions.length, 0),
+      chunks: entries.reduce((total, entry) => total + entry.chunks.length, 0),
+      changedChunks: this.changedChunks,
+      tokens: entries.reduce((total, entry) => total + (entry.tokens || 0), 0),
+      imports: entries.reduce((total, entry) => total + entry.imports.length, 0)
+    };
+  }
+}
+
+// Session Persistence - one append-only JSONL log per session plus an index for listing
+const SESSION_VERSION = 1;
+
+class SessionStore {
+  constructor(id) {
+    this.id = id;
+    this.logPath = join(CONFIG.sessionDir, `${id}.jsonl`);
+    this.meta = null;
+    this.messages = [];
+    this.pinned = new Map();
+    this.loaded = new Map();
+    this.context = null;
+  }
+
+  static indexPath() {
+    return join(CONFIG.sessionDir, 'index.json');
+  }
+
+  static readIndex() {
+    try {
+      const data = JSON.parse(readFileSync(SessionStore.indexPath(), 'utf-8'));
+      return data.version === SESSION_VERSION ? data.sessions : {};
+    } catch (error) {
+      return {};
+    }
+  }
+
+  // Most recently used first, optionally limited to one project
+  static list(rootPath = null) {
+    return Object.values(SessionStore.readIndex())
+      .filter(entry => !rootPath || entry.projectRoot === resolve(rootPath))
+      .sort((a, b) => b.updatedAt.localeCompare(a.updatedAt));
+  }
+
+  // Accepts a full id, a unique prefix, or "last" for the latest session of the project
+  static resolveId(query) {
+    if (query === 'last') {
+      return SessionStore.list(CONFIG.projectRoot)[0]?.id || null;
+    }
+    const ids = Object.keys(SessionStore.readIndex()).filter(id => id.startsWith(query));
+    if (ids.length === 1) return ids[0];
+    return existsSync(join(CONFIG.sessionDir, `${query}.jsonl`)) ? query : null;
+  }
+
+  static create({ provider, model }) {
+    const stamp = new Date().toISOString().replace(/[-:]/g, '').replace('T', '-').slice(0, 15);
+    const session = new SessionStore(`${stamp}-${randomBytes(3).toString('hex')}`);
+    session.meta = {
+      type: 'session',
+      version: SESSION_VERSION,
+      id: session.id,
+      createdAt: new Date().toISOString(),
+      projectRoot: CONFIG.projectRoot,
+      provider,
+      model
+    };
+    mkdirSync(CONFIG.sessionDir, { recursive: true });
+    session.append(session.meta);
+    return session;
+  }
+
+  static open(query) {
+    const id = SessionStore.resolveId(query);
+    if (!id) return null;
+    const session = new SessionStore(id);
+    return session.replay() ? session : null;
+  }
+
+  replay() {
+    let lines;
+    try {
+      lines = readFileSync(this.logPath, 'utf-8').split('\n');
+    } catch (error) {
+      return false;
+    }
+
+    for (const line of lines) {
+      if (!line) continue;
+      let record;
+      try {
+        record = JSON.parse(line);
+      } catch (error) {
+        continue; // A torn final line from a crash - everything before it is intact
+      }
+      if (record.type === 'session') {
+        this.meta = record;
+      } else if (record.type === 'message') {
+        this.messages.push({ role: record.role, content: record.content });
+      } else if (record.type === 'pin') {
+        this.pinned.set(record.path, record);
+      } else if (record.type === 'unpin') {
+        this.pinned.delete(record.path);
+      } else if (record.type === 'context') {
+        this.context = record;
+      } else if (record.type === 'clear') {
+        this.messages = [];
+        this.pinned.clear();
+      }
+    }
+    return this.meta !== null;
+  }
+
+  append(record) {
+    appendFileSync(this.logPath, JSON.stringify(record) + '\n', 'utf-8');
+    this.touchIndex();
+  }
+
+  addMessage(role, content) {
+    this.messages.push({ role, content });
+    this.append({ type: 'message', role, content, at: new Date().toISOString() });
+  }
+
+  static hash(content) {
+    return createHash('sha1').update(content).digest('hex');
+  }
+
+  pin(file) {
+    const path = resolve(file.path);
+    const record = {
+      type: 'pin',
+      path,
+      sha1: SessionStore.hash(file.content),
+      size: file.size,
+      mtimeMs: file.modified instanceof Date ? file.modified.getTime() : file.modified
+    };
+    if (this.pinned.get(path)?.sha1 === record.sha1) return;
+    this.pinned.set(path, record);
+    this.append(record);
+  }
+
+  unpin(path) {
+    if (this.pinned.delete(path)) {
+      this.append({ type: 'unpin', path });
+    }
+  }
+
+  // Re-read pinned files; changed files are re-pinned, vanished ones dropped
+  // Files whose size and mtime are unchanged are reused without reading or hashing, which
+  // also keeps their prompt blocks memoized
+  loadPinned() {
+    const files = [];
+    const changed = [];
+    for (const [path, record] of [...this.pinned]) {
+      let stats = null;
+      try {
+        stats = statSync(path);
+      } catch (error) {
+        // Missing
+      }
+      const loaded = this.loaded.get(path);
+      if (stats && loaded && loaded.size === stats.size && loaded.mtimeMs === stats.mtimeMs) {
+        files.push(loaded.file);
+        continue;
+      }
+
+      const file = stats && FileUtils.readFile(path);
+      if (!file) {
+        this.unpin(path);
+        this.loaded.delete(path);
+        changed.push(`${path} (missing)`);
+        continue;
+      }
+      if (SessionStore.hash(file.content) !== record.sha1) {
+        this.pin(file);
+        changed.push(path);
+      }
+      const pinned = { ...file, path: relative(CONFIG.projectRoot, path) || path };
+      this.loaded.set(path, { size: stats.size, mtimeMs: stats.mtimeMs, file: pinned });
+      files.push(pinned);
+    }
+    return { files, changed };
+  }
+
+  // Context is only logged when it changes, so resumes replay a stable system prompt
+  setContext(projectContext) {
+    const hash = SessionStore.hash(JSON.stringify(projectContext));
+    if (this.context?.hash === hash) return;
+    this.context = { type: 'context', hash, summary: projectContext };
+    this.append(this.context);
+  }
+
+  clear() {
+    this.messages = [];
+    this.pinned.clear();
+    this.append({ type: 'clear' });
+  }
+
+  touchIndex() {
+    const firstPrompt = this.messages.find(message => message.role === 'user')?.content || '';
+    const sessions = SessionStore.readIndex();
+    sessions[this.id] = {
+      id: this.id,
+      title: firstPrompt.split('\n')[0].slice(0, 60),
+      projectRoot: this.meta.projectRoot,
+      model: this.meta.model,
+      createdAt: this.meta.createdAt,
+      updatedAt: new Date().toISOString(),
+      messages: this.messages.length
+    };
+
+    // Write-then-rename keeps the index readable if two runs update it at once
+    const partial = `${SessionStore.indexPath()}.${process.pid}.tmp`;
+    try {
+      writeFileSync(partial, JSON.stringify({ version: SESSION_VERSION, sessions }), 'utf-8');
+      renameSync(partial, SessionStore.indexPath());
+    } catch (error) {
+      // The log is the source of truth; a stale index only affects listing
+    }
+  }
+}
+
+// Edit mode - the model answers with SEARCH/REPLACE blocks (or unified diff hunks) against
+// the loaded file instead of regenerating it, and the blocks are applied locally
+const EDIT_INSTRUCTIONS = `
+
+You are editing a file. Do not reprint the whole file. Answer with one or more edit blocks:
+
+<<<<<<< SEARCH
+exact lines copied from the current file
+=======
+the lines that replace them
+>>>>>>> REPLACE
+
+Each SEARCH section must match the current file exactly and only once; include a few
+surrounding lines when needed to make it unique. Keep blocks small. A short explanation
+before the blocks is fine.`;
+const BRACE_LANGUAGES = new Set(['.js', '.ts', '.jsx', '.tsx', '.java', '.c', '.cpp', '.cs', '.go', '.rs', '.php', '.swift', '.kt']);
+const EDIT_BLOCK = /^<{5,9} ?SEARCH[^\n]*\n([\s\S]*?)^={5,9}[^\S\n]*\n([\s\S]*?)^>{5,9} ?REPLACE/gm;
+
+class PatchApplier {
+  // SEARCH/REPLACE blocks take precedence; otherwise unified diff hunks become blocks
+  static parse(response) {
+    const blocks = [];
+    for (const match of response.matchAll(EDIT_BLOCK)) {
+      blocks.push({ search: match[1].replace(/\n$/, ''), replace: match[2].replace(/\n$/, '') });
+    }
+    return blocks.length > 0 ? blocks : PatchApplier.parseUnifiedDiff(response);
+  }
+
+  static parseUnifiedDiff(response) {
+    const blocks = [];
+    let hunk = null;
+    const close = () => {
+      if (hunk && (hunk.search.length > 0 || hunk.replace.length > 0)) {
+        blocks.push({ search: hunk.search.join('\n'), replace: hunk.replace.join('\n') });
+      }
+      hunk = null;
+    };
+
+    for (const line of response.split('\n')) {
+      if (line.startsWith('@@')) {
+        close();
+        hunk = { search: [], replace: [] };
+      } else if (!hunk || line.startsWith('```') || line.startsWith('--- ') || line.startsWith('+++ ')) {
+        close();
+      } else if (line.startsWith('-')) {
+        hunk.search.push(line.slice(1));
+      } else if (line.startsWith('+')) {
+        hunk.replace.push(line.slice(1));
+      } else if (line.startsWith(' ') || line === '') {
+        // Models often drop the leading space on blank context lines
+        hunk.search.push(line.slice(1));
+        hunk.replace.push(line.slice(1));
+      } else if (!line.startsWith('\\')) {
+        close();
+      }
+    }
+    close();
+
+    // Trailing blank context is usually the gap before the closing fence
+    for (const block of blocks) {
+      while (block.search.endsWith('\n') && block.replace.endsWith('\n')) {
+        block.search = block.search.slice(0, -1);
+        block.replace = block.replace.slice(0, -1);
+      }
+    }
+    return blocks;
+  }
+
+  // Exact match first, then line-by-line ignoring indentation and trailing whitespace
+  static locate(text, search) {
+    if (!search.trim()) return { error: 'empty SEARCH section' };
+
+    const start = text.indexOf(search);
+    if (start !== -1) {
+      if (text.indexOf(search, start + 1) !== -1) return { error: 'SEARCH matches more than one place' };
+      return { start, end: start + search.length };
+    }
+
+    const lines = text.split('\n');
+    const wanted = search.split('\n').map(line => line.trim());
+    const offsets = [0];
+    for (const line of lines) offsets.push(offsets[offsets.length - 1] + line.length + 1);
+
+    const found = [];
+    for (let i = 0; i + wanted.length <= lines.length && found.length < 2; i++) {
+      if (wanted.every((line, k) => lines[i + k].trim() === line)) found.push(i);
+    }
+    if (found.length === 0) return { error: 'SEARCH text not found in the file' };
+    if (found.length > 1) return { error: 'SEARCH matches more than one place' };
+    return { start: offsets[found[0]], end: offsets[found[0] + wanted.length] - 1 };
+  }
+
+  static apply(content, blocks) {
+    let text = content;
+    const failed = [];
+    let applied = 0;
+    blocks.forEach((block, i) => {
+      const at = PatchApplier.locate(text, block.search);
+      if (at.error) {
+        failed.push({ index: i + 1, block, reason: at.error });
+        return;
+      }
+      text = text.slice(0, at.start) + block.replace + text.slice(at.end);
+      applied++;
+    });
+    return { content: text, applied, failed };
+  }
+
+  // Cheap sanity checks on the patched text before it is written. Bracket balance is
+  // compared with the original so brackets inside strings do not trip it.
+  static validate(content, extension, original = '') {
+    if (extension === '.json') {
+      try {
+        JSON.parse(content);
+      } catch (error) {
+        return `patched file is not valid JSON (${error.message})`;
+      }
+    }
+    if (BRACE_LANGUAGES.has(extension)) {
+      const before = PatchApplier.bracketBalance(original);
+      const after = PatchApplier.bracketBalance(content);
+      for (const pair of Object.keys(after)) {
+        if (after[pair] !== before[pair]) return `unbalanced ${pair} after patching`;
+      }
+    }
+    return null;
+  }
+
+  static bracketBalance(text) {
+    const balance = { '()': 0, '[]': 0, '{}': 0 };
+    for (const char of text) {
+      if (char === '(') balance['()']++;
+      else if (char === ')') balance['()']--;
+      else if (char === '[') balance['[]']++;
+      else if (char === ']') balance['[]']--;
+      else if (char === '{') balance['{}']++;
+      else if (char === '}') balance['{}']--;
+    }
+    return balance;
+  }
+}
+
+// Watch mode - keep the symbol index current while files are edited. Uses recursive
+// fs.watch where the platform supports it and falls back to polling file stats.
+const WATCH_DEBOUNCE_MS = 200;
+// Polling stats the known files every tick and rescans directories for new ones every Nth
+const WATCH_RESCAN_POLLS = 10;
+
+class ProjectWatcher {
+  constructor(rootPath, onChange) {
+    this.rootPath = rootPath;
+    this.onChange = onChange;
+    this.pending = new Set();
+    this.timer = null;
+    this.watcher = null;
+    this.poller = null;
+    this.snapshot = null;
+    this.polls = 0;
+    this.mode = null;
+    this.updates = 0;
+    this.lastUpdateAt = null;
+  }
+
+  start() {
+    try {
+      this.watcher = watch(this.rootPath, { recursive: true }, (event, filename) => {
+        if (filename) this.queue(filename.toString());
+      });
+      this.watcher.on('error', () => this.startPolling());
+      this.mode = 'fs.watch';
+    } catch (error) {
+      this.startPolling();
+    }
+    return this;
+  }
+
+  startPolling() {
+    this.watcher?.close();
+    this.watcher = null;
+    if (this.poller) return;
+    this.mode = `polling every ${CONFIG.watchInterval} ms`;
+    this.snapshot = this.rescan();
+    this.poller = setInterval(() => this.poll(), CONFIG.watchInterval);
+    this.poller.unref();
+  }
+
+  // Every file in the tree; the watcher is not bound by maxScanFiles, so files beyond the
+  // scan's cap are watched too
+  rescan() {
+    const scan = FileUtils.analyzeCodebase(this.rootPath, Infinity);
+    const stats = new Map();
+    for (let i = 0; i < scan.length; i++) {
+      stats.set(scan.paths[i], `${scan.sizes[i]}:${scan.mtimes[i]}`);
+    }
+    return stats;
+  }
+
+  poll() {
+    if (++this.polls % WATCH_RESCAN_POLLS === 0) {
+      const next = this.rescan();
+      for (const [rel, stamp] of next) {
+        if (this.snapshot.get(rel) !== stamp) this.queue(rel);
+      }
+      for (const rel of this.snapshot.keys()) {
+        if (!next.has(rel)) this.queue(rel);
+      }
+      this.snapshot = next;
+      return;
+    }
+
+    for (const [rel, stamp] of this.snapshot) {
+      let next = null;
+      try {
+        const stats = statSync(join(this.rootPath, rel));
+        next = `${stats.size}:${stats.mtimeMs}`;
+      } catch (error) {
+        // Deleted or unreadable
+      }
+      if (next === stamp) continue;
+      this.queue(rel);
+      if (next) this.snapshot.set(rel, next);
+      else this.snapshot.delete(rel);
+    }
+  }
+
+  // Editors write in bursts (temp file, rename, chmod); apply them once things settle
+  queue(rel) {
+    const { ignoreDirs, extensions } = ConfigLoader.scanFilter;
+    if (rel.split(sep).some(part => ignoreDirs.has(part)) || !extensions.has(extname(rel))) return;
+    this.pending.add(rel);
+    clearTimeout(this.timer);
+    this.timer = setTimeout(() => this.flush(), WATCH_DEBOUNCE_MS);
+  }
+
+  flush() {
+    const paths = [...this.pending];
+    this.pending.clear();
+    this.updates++;
+    this.lastUpdateAt = new Date();
+    this.onChange(paths);
+  }
+
+  close() {
+    clearTimeout(this.timer);
+    clearInterval(this.poller);
+    this.watcher?.close();
+  }
+}
+
+// Content-defined chunking - split files at definition boundaries where the language is
+// known and at content-defined line boundaries otherwise. A boundary depends only on nearby
+// lines, so an edit changes the chunks around it and every other chunk keeps its hash.
+const CHUNK_CDC_DIVISOR = 64;
+const CHUNK_LEADING_LINE = /^\s*(\/\/|#|\/?\*|@|"""|''')/;
+
+class ContentChunker {
+  static prepared = new WeakMap();
+
+  static lineHash(line) {
+    // FNV-1a over the trimmed line, so re-indenting does not move boundaries
+    let hash = 0x811c9dc5;
+    const text = line.trim();
+    for (let i = 0; i < text.length; i++) {
+      hash ^= text.charCodeAt(i);
+      hash = Math.imul(hash, 0x01000193);
+    }
+    return hash >>> 0;
+  }
+
+  // Chunks of roughly `target` characters (between target / 4 and 2 * target) with
+  // 1-based line ranges and a stable content hash
+  static split(content, lang = null, { target = CONFIG.contextChunkChars, definitions = null } = {}) {
+    const lines = content.split('\n');
+    const min = Math.floor(target / 4);
+    const max = target * 2;
+
+    // A definition's chunk starts at the comments and decorators directly above it
+    const starts = new Set();
+    const defs = definitions || (lang ? SymbolIndex.extract(content, lang).definitions : []);
+    for (const def of defs) {
+      let start = def.line - 1;
+      while (start > 0 && CHUNK_LEADING_LINE.test(lines[start - 1]) && lines[start - 1].trim()) start--;
+      starts.add(start);
+    }
+
+    const chunks = [];
+    let begin = 0;
+    let size = 0;
+    const cut = (end) => {
+      const text = lines.slice(begin, end).join('\n');
+      chunks.push({
+        startLine: begin + 1,
+        endLine: end,
+        chars: text.length,
+        hash: createHash('sha1').update(text).digest('hex').slice(0, 16),
+        text
+      });
+      begin = end;
+      size = 0;
+    };
+
+    // Characters from each definition start to the next one, so whole definitions can be
+    // packed up to the target before cutting
+    const spans = new Map();
+    const ordered = [...starts].sort((a, b) => a - b);
+    ordered.forEach((start, k) => {
+      const end = k + 1 < ordered.length ? ordered[k + 1] : lines.length;
+      let chars = 0;
+      for (let i = start; i < end; i++) chars += lines[i].length + 1;
+      spans.set(start, chars);
+    });
+
+    for (let i = 0; i < lines.length; i++) {
+      const length = lines[i].length + 1;
+      if (i > begin) {
+        const atDefinition = starts.has(i) && size >= min && size + spans.get(i) > target;
+        const contentDefined = size >= target && ContentChunker.lineHash(lines[i - 1]) % CHUNK_CDC_DIVISOR === 0;
+        if (atDefinition || contentDefined || size + length > max) cut(i);
+      }
+      size += length;
+    }
+    if (begin < lines.length) cut(lines.length);
+    return chunks;
+  }
+
+  // Keep a large file within `budget` tokens: the chunks sharing the most identifiers
+  // with the query, in file order, with the gaps marked
+  static fit(file, query, budget = CONFIG.fileContextTokens) {
+    const counter = TokenCounter.current;
+    // Byte-fallback tokenizers can spend a token per UTF-8 byte but never more, so files
+    // whose byte length fits skip counting
+    if (!file.content || Buffer.byteLength(file.content, 'utf-8') <= budget) return file;
+
+    // Chunking, counting and word sets do not depend on the query; keep them per file
+    let prepared = ContentChunker.prepared.get(file);
+    if (!prepared || prepared.counter !== counter) {
+      const tokens = counter.count(file.content);
+      const chunks = tokens <= budget ? [] : ContentChunker.split(file.content, SymbolIndex.languageFor(file.extension))
+        .map(chunk => ({
+          ...chunk,
+          tokens: counter.count(chunk.text),
+          words: new Set((chunk.text.match(/[A-Za-z_$][\w$]{2,}/g) || []).map(word => word.toLowerCase()))
+        }));
+      prepared = { counter, tokens, chunks };
+      ContentChunker.prepared.set(file, prepared);
+    }
+    if (prepared.tokens <= budget) return file;
+
+    const chunks = prepared.chunks;
+    const terms = new Set((query.match(/[A-Za-z_$][\w$]{2,}/g) || []).map(term => term.toLowerCase()));
+    const ranked = chunks.map((chunk, order) => {
+      let score = 0;
+      for (const term of terms) {
+        if (chunk.words.has(term)) score++;
+      }
+      // The head of a file (imports, module docs) breaks ties
+      return { chunk, order, score: score + (order === 0 ? 0.5 : 0) };
+    }).sort((a, b) => b.score - a.score || a.order - b.order);
+
+    const selected = [];
+    let used = 0;
+    for (const { chunk, order } of ranked) {
+      if (used + chunk.tokens > budget) continue;
+      selected.push({ chunk, order });
+      used += chunk.tokens;
+    }
+    selected.sort((a, b) => a.order - b.order);
+
+    const parts = [];
+    let nextLine = 1;
+    for (const { chunk } of selected) {
+      if (chunk.startLine > nextLine) parts.push(`... (lines ${nextLine}-${chunk.startLine - 1} omitted) ...`);
+      parts.push(chunk.text);
+      nextLine = chunk.endLine + 1;
+    }
+    if (nextLine <= chunks[chunks.length - 1].endLine) {
+      parts.push(`... (lines ${nextLine}-${chunks[chunks.length - 1].endLine} omitted) ...`);
+    }
+    return { ...file, content: parts.join('\n'), excerpt: true };
+  }
+}
+
+// Token counting - a fast estimate by default, or exact counts from a local Hugging Face
+// tokenizer.json (MYCODEHELPER_TOKENIZER, the cache's tokenizers/<model>/ directory, or the
+// Hugging Face hub cache) when one is available offline
+const TOKEN_PRETOKENIZE = /'(?:[sdmt]|ll|ve|re)| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+/gu;
+
+class TokenCounter {
+  static instances = new Map();
+  static active = null;
+
+  constructor(model = '', tokenizerPath = null) {
+    this.model = model;
+    this.path = tokenizerPath;
+    this.bpe = null;
+    this.words = new Map();
+    this.texts = new Map();
+    if (tokenizerPath) {
+      try {
+        this.bpe = TokenCounter.loadBPE(JSON.parse(readFileSync(tokenizerPath, 'utf-8')));
+      } catch (error) {
+        // Unsupported or unreadable tokenizer - fall back to the estimate
+      }
+    }
+    this.id = this.bpe ? `bpe:${createHash('sha1').update(tokenizerPath).digest('hex').slice(0, 8)}` : 'estimate';
+  }
+
+  // The counter used for index and context sizing, chosen once the model is known
+  static use(model) {
+    if (!TokenCounter.instances.has(model)) {
+      TokenCounter.instances.set(model, new TokenCounter(model, TokenCounter.locate(model)));
+    }
+    TokenCounter.active = TokenCounter.instances.get(model);
+    return TokenCounter.active;
+  }
+
+  static get current() {
+    return TokenCounter.active || TokenCounter.use('');
+  }
+
+  static locate(model) {
+    const candidates = [];
+    if (CONFIG.tokenizer) {
+      candidates.push(CONFIG.tokenizer, join(CONFIG.tokenizer, 'tokenizer.json'));
+    }
+    if (model) {
+      candidates.push(join(CONFIG.cacheDir, 'tokenizers', model.replace(/[\\/:]/g, '_'), 'tokenizer.json'));
+      const hub = join(process.env.HF_HOME || join(homedir(), '.cache', 'huggingface'), 'hub', `models--${model.replace(/\//g, '--')}`, 'snapshots');
+      try {
+        for (const snapshot of readdirSync(hub)) candidates.push(join(hub, snapshot, 'tokenizer.json'));
+      } catch (error) {
+        // Not in the hub cache
+      }
+    }
+    return candidates.find(candidate => {
+      try {
+        return statSync(candidate).isFile();
+      } catch (error) {
+        return false;
+      }
+    }) || null;
+  }
+
+  // Byte-level (GPT-2 / Llama 3 style) and SentencePiece-style (Metaspace) BPE models
+  static loadBPE(spec) {
+    const model = spec.model || {};
+    if (model.type !== 'BPE' || !model.vocab || !Array.isArray(model.merges)) return null;
+
+    const ranks = new Map();
+    model.merges.forEach((merge, rank) => {
+      const [left, right] = Array.isArray(merge) ? merge : merge.split(' ');
+      ranks.set(`${left} ${right}`, rank);
+    });
+
+    const pre = JSON.stringify(spec.pre_tokenizer || {});
+    const byteLevel = pre.includes('"ByteLevel"');
+    let pattern = TOKEN_PRETOKENIZE;
+    const custom = pre.match(/"Regex":"((?:[^"\\]|\\.)*)"/);
+    if (custom) {
+      try {
+        pattern = new RegExp(JSON.parse(`"${custom[1]}"`).replace(/\(\?i:/g, '(?:'), 'gu');
+      } catch (error) {
+        // Pattern uses syntax JavaScript lacks - the GPT-2 split is close enough
+      }
+    }
+
+    let byteChars = null;
+    if (byteLevel) {
+      // GPT-2's reversible byte-to-printable-character table
+      byteChars = [];
+      let extra = 0;
+      for (let byte = 0; byte < 256; byte++) {
+        const printable = (byte >= 33 && byte <= 126) || (byte >= 161 && byte <= 172) || byte >= 174;
+        byteChars.push(String.fromCharCode(printable ? byte : 256 + extra++));
+      }
+    }
+
+    return { vocab: model.vocab, ranks, byteLevel, byteChars, pattern, byteFallback: Boolean(model.byte_fallback) };
+  }
+
+  count(text) {
+    if (!text) return 0;
+    const pieces = this.bpe ? this.pretokenize(text) : text.match(TOKEN_PRETOKENIZE) || [];
+    let total = 0;
+    for (const piece of pieces) {
+      let tokens = this.words.get(piece);
+      if (tokens === undefined) {
+        tokens = this.bpe ? this.encodeWord(piece) : Math.max(1, Math.ceil((piece.length - (piece[0] === ' ' ? 1 : 0)) / 4));
+        if (this.words.size >= CONFIG.tokenCacheWords) this.words.clear();
+        this.words.set(piece, tokens);
+      }
+      total += tokens;
+    }
+    return total;
+  }
+
+  // Chat templates add a few tokens of framing per message; large contents repeat across
+  // turns (system prompt, pinned files) and are counted once
+  countMessages(messages) {
+    return messages.reduce((total, message) =>
+      total + PromptBuilder.remember(this.texts, message.content, () => this.count(message.content)) + 4, 2);
+  }
+
+  pretokenize(text) {
+    if (this.bpe.byteLevel) {
+      return (text.match(this.bpe.pattern) || []).map(piece =>
+        Array.from(Buffer.from(piece, 'utf-8'), byte => this.bpe.byteChars[byte]).join(''));
+    }
+    return `▁${text.replace(/ /g, '▁')}`.split(/(?=▁)/);
+  }
+
+  // Number of tokens after greedily applying the lowest-ranked merge until none applies
+  encodeWord(word) {
+    let symbols = Array.from(word);
+    while (symbols.length > 1) {
+      let best = -1;
+      let bestRank = Infinity;
+      for (let i = 0; i < symbols.length - 1; i++) {
+        const rank = this.bpe.ranks.get(`${symbols[i]} ${symbols[i + 1]}`);
+        if (rank !== undefined && rank < bestRank) {
+          bestRank = rank;
+          best = i;
+        }
+      }
+      if (best === -1) break;
+      const [left, right] = [symbols[best], symbols[best + 1]];
+      const next = [];
+      for (let i = 0; i < symbols.length; i++) {
+        if (symbols[i] === left && symbols[i + 1] === right) {
+          next.push(left + right);
+          i++;
+        } else {
+          next.push(symbols[i]);
+        }
+      }
+      symbols = next;
+    }
+    if (!this.bpe.byteFallback) return symbols.length;
+    // Characters missing from the vocabulary become one token per UTF-8 byte
+    return symbols.reduce((total, symbol) =>
+      total + (symbol in this.bpe.vocab ? 1 : Buffer.byteLength(symbol, 'utf-8')), 0);
+  }
+
+  describe() {
+    return this.bpe ? `exact (${this.path})` : 'estimate (about 4 characters per word piece)';
+  }
+
+  // max_tokens for one request: the task's output budget, capped by MYCODEHELPER_MAX_TOKENS
+  // and by what the context window has left after the prompt (with headroom for estimates)
+  static responseLimit(promptTokens, task = 'chat', contextWindow = CONFIG.contextWindow) {
+    const counter = TokenCounter.current;
+    const headroom = Math.ceil(promptTokens * (counter.bpe ? 0.02 : 0.15)) + 16;
+    const remaining = contextWindow - promptTokens - headroom;
+    const budget = CONFIG.outputBudgets[task] || CONFIG.outputBudgets.chat;
+    const maxTokens = Math.min(CONFIG.maxTokens, budget, remaining);
+    if (maxTokens < Math.min(256, budget)) {
+      return { error: `Prompt is about ${promptTokens} tokens, leaving no room for a response in the ${contextWindow}-token context window` };
+    }
+    return { maxTokens };
+  }
+}
+
+// Duplicate detection - vendored copies, generated clients and copy-pasted modules are sent
+// once. Exact copies match on a hash of whitespace-normalized content; near copies on a
+// bottom-k MinHash estimate of the Jaccard similarity of their 5-token shingles.
+const SHINGLE_TOKENS = 5;
+const SKETCH_SIZE = 64;
+
+class Deduplicator {
+  static prints = new WeakMap();
+  static omitted = 0;
+  static savedChars = 0;
+
+  // FNV-1a per token (identifier, number or punctuation character), whitespace skipped
+  static tokenHashes(content) {
+    const hashes = [];
+    let hash = 0;
+    let word = false;
+    for (let i = 0; i < content.length; i++) {
+      const code = content.charCodeAt(i);
+      const wordChar = (code >= 48 && code <= 57) || (code >= 65 && code <= 90) || (code >= 97 && code <= 122) || code === 95 || code === 36;
+      if (wordChar) {
+        if (!word) hash = 0x811c9dc5;
+        hash = Math.imul(hash ^ code, 0x01000193);
+        word = true;
+        continue;
+      }
+      if (word) hashes.push(hash >>> 0);
+      word = false;
+      if (code > 32) hashes.push(Math.imul(0x811c9dc5 ^ code, 0x01000193) >>> 0);
+    }
+    if (word) hashes.push(hash >>> 0);
+    return hashes;
+  }
+
+  // The SKETCH_SIZE smallest distinct shingle hashes, ascending; null for files too short
+  // to compare
+  static signature(content) {
+    const hashes = Deduplicator.tokenHashes(content);
+    if (hashes.length < SHINGLE_TOKENS + SKETCH_SIZE) return null;
+    const shingles = new Uint32Array(hashes.length - SHINGLE_TOKENS + 1);
+    for (let i = 0; i < shingles.length; i++) {
+      let shingle = hashes[i];
+      for (let j = 1; j < SHINGLE_TOKENS; j++) shingle = Math.imul(shingle ^ hashes[i + j], 0x01000193);
+      shingle ^= shingle >>> 15;
+      shingles[i] = Math.imul(shingle, 0x85ebca6b) ^ (shingle >>> 13);
+    }
+    shingles.sort();
+    const sketch = [];
+    for (let i = 0; i < shingles.length && sketch.length < SKETCH_SIZE; i++) {
+      if (i === 0 || shingles[i] !== shingles[i - 1]) sketch.push(shingles[i]);
+    }
+    return sketch.length === SKETCH_SIZE ? Uint32Array.from(sketch) : null;
+  }
+
+  // Share of the union's smallest SKETCH_SIZE hashes that both sketches contain
+  static similarity(a, b) {
+    let i = 0;
+    let j = 0;
+    let shared = 0;
+    for (let taken = 0; taken < SKETCH_SIZE; taken++) {
+      if (a[i] === b[j]) {
+        shared++;
+        i++;
+        j++;
+      } else if (a[i] < b[j]) {
+        i++;
+      } else {
+        j++;
+      }
+    }
+    return shared / SKETCH_SIZE;
+  }
+
+  // {hash, signature} for text files, cached per file object; null for summarized content
+  static fingerprint(file) {
+    if (file.kind && file.kind !== 'text') return null;
+    let print = Deduplicator.prints.get(file);
+    if (!print) {
+      const content = file.content || '';
+      print = {
+        hash: createHash('sha1').update(content.replace(/\s+/g, ' ').trim()).digest('hex'),
+        signature: CONFIG.nearDuplicateSimilarity <= 1 ? Deduplicator.signature(content) : null
+      };
+      Deduplicator.prints.set(file, print);
+    }
+    return print;
+  }
+
+  // [{file, duplicateOf, similarity}] in input order; the first copy is the representative
+  static pack(files) {
+    return files.map(Deduplicator.packer());
+  }
+
+  // pack one file at a time: each call compares the file with the distinct files seen so far
+  static packer() {
+    const kept = [];
+    return (file) => {
+      const print = CONFIG.dedupe ? Deduplicator.fingerprint(file) : null;
+      if (!print) return { file };
+      const exact = kept.find(other => other.print.hash === print.hash);
+      if (exact) return { file, duplicateOf: exact.file.path, similarity: 1 };
+      let best = null;
+      for (const other of print.signature ? kept : []) {
+        if (!other.print.signature) continue;
+        const similarity = Deduplicator.similarity(print.signature, other.print.signature);
+        if (similarity >= CONFIG.nearDuplicateSimilarity && similarity > (best?.similarity || 0)) {
+          best = { file, duplicateOf: other.file.path, similarity };
+        }
+      }
+      if (best) return best;
+      kept.push({ file, print });
+      return { file };
+    };
+  }
+
+  // The first `limit` distinct files, plus the copies of them met along the way
+  static representatives(files, limit) {
+    const selected = [];
+    const pack = Deduplicator.packer();
+    let distinct = 0;
+    for (const file of files) {
+      if (distinct >= limit) break;
+      selected.push(file);
+      if (!pack(file).duplicateOf) distinct++;
+    }
+    return selected;
+  }
+
+  // The omitted counts shown by status cover one run; a daemon serves many
+  static resetStats() {
+    Deduplicator.omitted = 0;
+    Deduplicator.savedChars = 0;
+  }
+}
+
+// Prompt building - the system prompt, serialized project context, file blocks and message
+// JSON are memoized, so a turn with large pinned files only re-serializes what changed
+const SYSTEM_PROMPT = `You are MyCodeHelper, an expert AI coding assistant. You help with:
+- Code analysis and debugging
+- Architecture and design patterns  
+- Best practices and optimization
+- Documentation and explanations
+- Problem solving and algorithms
+
+Provide clear, actionable, and helpful responses. When analyzing code, be specific about improvements and potential issues.`;
+const PROMPT_CACHE_MIN_CHARS = 1024;
+
+class PromptBuilder {
+  static contexts = new WeakMap();
+  static fileBlocks = new WeakMap();
+  static messages = new Map();
+  static lastFileContext = { blocks: [], text: '' };
+
+  // Project summaries are replaced rather than edited once in use, so identity is the key
+  static systemPrompt(projectContext = null) {
+    if (!projectContext) return SYSTEM_PROMPT;
+    if (!PromptBuilder.contexts.has(projectContext)) {
+      PromptBuilder.contexts.set(projectContext, `${SYSTEM_PROMPT}\n\nProject Context: ${PromptBuilder.json(projectContext)}`);
+    }
+    return PromptBuilder.contexts.get(projectContext);
+  }
+
+  // Summaries for the model are indented only in lossless mode
+  static json(value) {
+    return JSON.stringify(value, null, CONFIG.contextWhitespace === 'lossless' ? 2 : 0);
+  }
+
+  // Trailing whitespace, CRLF line ends and runs of blank lines tell the model nothing;
+  // indentation is kept. Edits and contextWhitespace 'lossless' send files as they are.
+  static compact(content, lossless = false) {
+    if (CONFIG.contextWhitespace === 'lossless' || lossless) return content;
+    return content.replace(/\r\n/g, '\n').replace(/[ \t]+$/gm, '').replace(/\n{3,}/g, '\n\n');
+  }
+
+  // One block per file; excerpts depend on the message and are rebuilt every time
+  static fileBlock(file, message, format) {
+    const cached = PromptBuilder.fileBlocks.get(file);
+    if (cached?.[format]) return cached[format];
+
+    const fitted = file.kind && file.kind !== 'text'
+      ? { path: file.path, extension: file.extension, content: FileSniffer.summarize(file), excerpt: false }
+      : ContentChunker.fit(file, message);
+    const content = PromptBuilder.compact(fitted.content, file.lossless);
+    const block = format === 'markdown'
+      ? `File: ${fitted.path}${fitted.excerpt ? ' (excerpt)' : ''}\n\`\`\`${fitted.extension}\n${content}\n\`\`\``
+      : `\n${fitted.path}${fitted.excerpt ? ' (excerpt)' : ''}:\n${content}\n`;
+    if (!fitted.excerpt) PromptBuilder.fileBlocks.set(file, { ...cached, [format]: block });
+    return block;
+  }
+
+  // A copy of a file already in the context is only named
+  static duplicateBlock(file, original, similarity, format) {
+    const relation = similarity === 1 ? `identical to ${original}` : `~${Math.round(similarity * 100)}% similar to ${original}`;
+    return format === 'markdown'
+      ? `File: ${file.path} (${relation}; content omitted)`
+      : `\n${file.path}: ${relation}; content omitted\n`;
+  }
+
+  // The same blocks in the same order give back the same string, which keeps the message
+  // JSON and token count caches warm
+  static fileContext(files, message, format = 'markdown') {
+    const blocks = Deduplicator.pack(files).map(({ file, duplicateOf, similarity }) => {
+      if (!duplicateOf) return PromptBuilder.fileBlock(file, message, format);
+      Deduplicator.omitted++;
+      Deduplicator.savedChars += file.content.length;
+      return PromptBuilder.duplicateBlock(file, duplicateOf, similarity, format);
+    });
+    const last = PromptBuilder.lastFileContext;
+    if (blocks.length !== last.blocks.length || blocks.some((block, i) => block !== last.blocks[i])) {
+      const text = format === 'markdown'
+        ? `Here are the relevant files for context:\n\n${blocks.join('\n\n')}`
+        : `Files for context:\n${blocks.join('')}\n`;
+      PromptBuilder.lastFileContext = { blocks, text };
+    }
+    return PromptBuilder.lastFileContext.text;
+  }
+
+  static remember(cache, key, build) {
+    if (key.length < PROMPT_CACHE_MIN_CHARS) return build();
+    let value = cache.get(key);
+    if (value === undefined) {
+      value = build();
+      if (cache.size >= CONFIG.promptCacheEntries) cache.delete(cache.keys().next().value);
+    } else {
+      cache.delete(key);
+    }
+    cache.set(key, value);
+    return value;
+  }
+
+  static messageJSON(message) {
+    const json = PromptBuilder.remember(PromptBuilder.messages, message.content, () => ({}));
+    if (!json[message.role]) json[message.role] = JSON.stringify(message);
+    return json[message.role];
+  }
+
+  // Request body with each message serialized once; the remaining fields are small
+  static requestBody(fields, messages) {
+    const head = JSON.stringify(fields);
+    return `${head.slice(0, -1)},"messages":[${messages.map(message => PromptBuilder.messageJSON(message)).join(',')}]}`;
+  }
+}
+
+// Structured output - --schema asks for JSON matching a JSON Schema. The schema goes to the
+// server as a response_format (a grammar for TGI and node-llama-cpp), replies are checked as
+// they stream so malformed output is cut off early, and only items that fail are asked again.
+const FINDINGS_SCHEMA = {
+  type: 'object',
+  required: ['summary', 'findings'],
+  additionalProperties: false,
+  properties: {
+    summary: { type: 'string' },
+    findings: {
+      type: 'array',
+      items: {
+        type: 'object',
+        required: ['severity', 'message'],
+        additionalProperties: false,
+        properties: {
+          file: { type: 'string' },
+          line: { type: 'integer', minimum: 1 },
+          severity: { enum: ['error', 'warning', 'info'] },
+          category: { type: 'string' },
+          message: { type: 'string' },
+          suggestion: { type: 'string' }
+        }
+      }
+    }
+  }
+};
+
+const OUTPUT_SCHEMAS = { findings: FINDINGS_SCHEMA };
+
+// Incremental JSON syntax checker: push() streamed text and it fails at the first character
+// that cannot belong to a JSON value, or reports done once the top-level value is complete.
+// A leading ``` fence line is skipped; the value itself is kept for one native JSON.parse.
+class JSONStreamParser {
+  constructor() {
+    this.text = '';
+    this.stack = [];
+    this.state = 'start';
+    this.string = null;
+    this.escape = false;
+    this.hex = 0;
+    this.literal = '';
+    this.matched = 0;
+    this.number = '';
+    this.fence = false;
+    this.done = false;
+    this.error = null;
+  }
+
+  // False as soon as the text can no longer be valid JSON; anything after a complete value is ignored
+  push(chunk) {
+    for (let i = 0; i < chunk.length && !this.error && !this.done; i++) this.step(chunk[i]);
+    return !this.error;
+  }
+
+  step(char) {
+    if (this.number && !/[\d.eE+-]/.test(char) && !this.endNumber()) return;
+    if (this.done) {
+      if (!/[\s`]/.test(char)) this.fail(`unexpected ${JSON.stringify(char)} after the JSON value`);
+      return;
+    }
+    if (this.string) {
+      this.text += char;
+      this.stringChar(char);
+      return;
+    }
+    if (this.literal) {
+      this.text += char;
+      if (char !== this.literal[this.matched++]) return this.fail(`invalid literal near ${JSON.stringify(this.literal)}`);
+      if (this.matched === this.literal.length) {
+        this.literal = '';
+        this.valueEnd();
+      }
+      return;
+    }
+    if (this.number) {
+      this.number += char;
+      this.text += char;
+      return;
+    }
+    if (this.fence) {
+      if (char === '\n') this.fence = false;
+      return;
+    }
+    if (/\s/.test(char)) {
+      if (this.state !== 'start') this.text += char;
+      return;
+    }
+    if (char === '`' && this.state === 'start') {
+      this.fence = true;
+      return;
+    }
+
+    this.text += char;
+    if (this.state === 'start' || this.state === 'value') {
+      this.valueStart(char);
+    } else if (this.state === 'valueOrEnd') {
+      if (char === ']') this.close('[');
+      else this.valueStart(char);
+    } else if (this.state === 'keyOrEnd' && char === '}') {
+      this.close('{');
+    } else if (this.state === 'key' || this.state === 'keyOrEnd') {
+      if (char === '"') this.string = 'key';
+      else this.fail(`expected a property name, got ${JSON.stringify(char)}`);
+    } else if (this.state === 'colon') {
+      if (char === ':') this.state = 'value';
+      else this.fail(`expected ":", got ${JSON.stringify(char)}`);
+    } else if (char === ',') {
+      this.state = this.stack[this.stack.length - 1] === '{' ? 'key' : 'value';
+    } else if (char === '}' || char === ']') {
+      this.close(char === '}' ? '{' : '[');
+    } else {
+      this.fail(`expected "," or a closing bracket, got ${JSON.stringify(char)}`);
+    }
+  }
+
+  valueStart(char) {
+    if (char === '{') {
+      this.stack.push('{');
+      this.state = 'keyOrEnd';
+    } else if (char === '[') {
+      this.stack.push('[');
+      this.state = 'valueOrEnd';
+    } else if (char === '"') {
+      this.string = 'value';
+    } else if (char === '-' || (char >= '0' && char <= '9')) {
+      this.number = char;
+    } else if (char === 't' || char === 'f' || char === 'n') {
+      this.literal = { t: 'true', f: 'false', n: 'null' }[char];
+      this.matched = 1;
+    } else {
+      this.fail(`expected a JSON value, got ${JSON.stringify(char)}`);
+    }
+  }
+
+  stringChar(char) {
+    if (this.hex > 0) {
+      this.hex--;
+      if (!/[0-9a-fA-F]/.test(char)) this.fail('invalid \\u escape');
+    } else if (this.escape) {
+      this.escape = false;
+      if (char === 'u') this.hex = 4;
+      else if (!'"\\/bfnrt'.includes(char)) this.fail(`invalid escape \\${char}`);
+    } else if (char === '\\') {
+      this.escape = true;
+    } else if (char === '"') {
+      const kind = this.string;
+      this.string = null;
+      if (kind === 'key') this.state = 'colon';
+      else this.valueEnd();
+    } else if (char < ' ') {
+      this.fail('unescaped control character in a string');
+    }
+  }
+
+  endNumber() {
+    if (!/^-?(0|[1-9]\d*)(\.\d+)?([eE][+-]?\d+)?$/.test(this.number)) {
+      this.fail(`invalid number ${this.number}`);
+      return false;
+    }
+    this.number = '';
+    this.valueEnd();
+    return true;
+  }
+
+  close(open) {
+    if (this.stack.pop() !== open) return this.fail('mismatched brackets');
+    this.valueEnd();
+  }
+
+  valueEnd() {
+    if (this.stack.length > 0) {
+      this.state = 'next';
+    } else {
+      this.state = 'done';
+      this.done = true;
+    }
+  }
+
+  fail(message) {
+    this.error = message;
+  }
+
+  // The parsed value once the reply has ended, or null with error set
+  finish() {
+    if (this.number) this.endNumber();
+    if (!this.error && !this.done) {
+      this.fail(this.text ? 'the reply ended inside the JSON value' : 'the reply contained no JSON');
+    }
+    if (this.error) return null;
+    try {
+      return JSON.parse(this.text);
+    } catch (error) {
+      this.fail(error.message);
+      return null;
+    }
+  }
+}
+
+// The JSON Schema subset replies are held to: type, enum, const, anyOf, string length and
+// pattern, numeric bounds, items and item counts, properties, required and additionalProperties
+class SchemaValidator {
+  // A built-in schema name or the path of a JSON Schema file
+  static load(spec) {
+    if (OUTPUT_SCHEMAS[spec]) return { name: spec, schema: OUTPUT_SCHEMAS[spec] };
+    let schema;
+    try {
+      schema = JSON.parse(readFileSync(spec, 'utf-8'));
+    } catch (error) {
+      throw new Error(`Could not load schema ${spec}: ${error.message} (built-in schemas: ${Object.keys(OUTPUT_SCHEMAS).join(', ')})`);
+    }
+    const name = basename(spec, extname(spec)).replace(/[^A-Za-z0-9_-]/g, '_') || 'schema';
+    return { name, schema };
+  }
+
+  static instructions(schema) {
+    return `Reply with a single JSON value that matches this JSON Schema, with no prose and no code fences:\n${JSON.stringify(schema)}`;
+  }
+
+  static typeOf(value) {
+    if (value === null) return 'null';
+    if (Array.isArray(value)) return 'array';
+    if (typeof value === 'number') return Number.isInteger(value) ? 'integer' : 'number';
+    return typeof value;
+  }
+
+  // The first problem found as a readable message, or null when the value matches
+  static validate(value, schema, path = '$') {
+    if (!schema || schema === true) return null;
+    const actual = SchemaValidator.typeOf(value);
+    if (schema.type) {
+      const types = [].concat(schema.type);
+      if (!types.includes(actual) && !(actual === 'integer' && types.includes('number'))) {
+        return `${path} should be ${types.join(' or ')}, got ${actual}`;
+      }
+    }
+    if (schema.enum && !schema.enum.includes(value)) {
+      return `${path} should be one of ${schema.enum.map(option => JSON.stringify(option)).join(', ')}`;
+    }
+    if ('const' in schema && schema.const !== value) return `${path} should be ${JSON.stringify(schema.const)}`;
+    if (schema.anyOf && !schema.anyOf.some(option => !SchemaValidator.validate(value, option, path))) {
+      return `${path} matches none of the allowed shapes`;
+    }
+
+    if (actual === 'string') {
+      if (value.length < (schema.minLength ?? 0)) return `${path} should have at least ${schema.minLength} characters`;
+      if (value.length > (schema.maxLength ?? Infinity)) return `${path} should have at most ${schema.maxLength} characters`;
+      if (schema.pattern && !new RegExp(schema.pattern, 'u').test(value)) return `${path} should match ${schema.pattern}`;
+    } else if (actual === 'integer' || actual === 'number') {
+      if (value < (schema.minimum ?? -Infinity)) return `${path} should be at least ${schema.minimum}`;
+      if (value > (schema.maximum ?? Infinity)) return `${path} should be at most ${schema.maximum}`;
+    } else if (actual === 'array') {
+      if (value.length < (schema.minItems ?? 0)) return `${path} should have at least ${schema.minItems} items`;
+      if (value.length > (schema.maxItems ?? Infinity)) return `${path} should have at most ${schema.maxItems} items`;
+      for (let i = 0; i < value.length; i++) {
+        const error = SchemaValidator.validate(value[i], schema.items, `${path}[${i}]`);
+        if (error) return error;
+      }
+    } else if (actual === 'object') {
+      const properties = schema.properties || {};
+      const missing = (schema.required || []).find(key => !(key in value));
+      if (missing) return `${path}.${missing} is required`;
+      for (const [key, entry] of Object.entries(value)) {
+        const error = key in properties
+          ? SchemaValidator.validate(entry, properties[key], `${path}.${key}`)
+          : schema.additionalProperties === false
+            ? `${path}.${key} is not allowed`
+            : SchemaValidator.validate(entry, schema.additionalProperties, `${path}.${key}`);
+        if (error) return error;
+      }
+    }
+    return null;
+  }
+}
+
+// Output Sinks - stream tokens to --output / stdout in the requested --format
+class OutputSink {
+  static create({ format = 'text', output = null } = {}, meta = {}) {
+    const Formatter = OUTPUT_FORMATTERS[format];
+    if (!Formatter) {
+      throw new Error(`Unknown output format: ${format} (expected ${Object.keys(OUTPUT_FORMATTERS).join(', ')})`);
+    }
+    // Plain text to the terminal is the classic behaviour - no sink needed (schema runs still
+    // go through one so every result is written the same way)
+    if (format === 'text' && !output && !meta.schema) return null;
+    return new Formatter(output, meta);
+  }
+
+  constructor(output, meta) {
+    this.output = output;
+    this.toStdout = !output;
+    this.fd = output ? openSync(output, 'w') : null;
+    this.meta = meta;
+    this.usage = null;
+    this.sent = null;
+    this.tokenCount = 0;
+    this.startedAt = Date.now();
+    this.firstTokenAt = null;
+  }
+
+  writeRaw(text) {
+    if (!text) return;
+    if (this.toStdout) {
+      process.stdout.write(text);
+    } else {
+      writeSync(this.fd, text);
+    }
+  }
+
+  begin() {}
+
+  write(token) {
+    if (!token) return;
+    if (this.firstTokenAt === null) this.firstTokenAt = Date.now();
+    this.tokenCount++;
+    this.writeToken(token);
+  }
+
+  writeToken(token) {
+    this.writeRaw(token);
+  }
+
+  // Section marker between chunk responses in multi-part runs
+  part(index, detail) {
+    this.writeToken(`${index > 1 ? '\n\n' : ''}--- Part ${index} (${detail}) ---\n\n`);
+  }
+
+  // One validated item of a --schema run: {ok, data} or {ok: false, error, raw}
+  result(index, detail, outcome) {
+    if (detail) this.part(index, detail);
+    this.writeRaw(outcome.ok ? `${JSON.stringify(outcome.data, null, 2)}\n` : `Invalid reply: ${outcome.error}\n`);
+  }
+
+  setUsage(usage) {
+    this.usage = usage;
+  }
+
+  // Multi-part runs send several requests; their bytes add up
+  addRequest({ bytes, wireBytes }) {
+    this.sent = { bytes: (this.sent?.bytes || 0) + bytes, wireBytes: (this.sent?.wireBytes || 0) + wireBytes };
+  }
+
+  getTimings() {
+    const totalMs = Date.now() - this.startedAt;
+    return {
+      startedAt: new Date(this.startedAt).toISOString(),
+      firstTokenMs: this.firstTokenAt === null ? null : this.firstTokenAt - this.startedAt,
+      totalMs
+    };
+  }
+
+  getUsage() {
+    // Servers that report usage are authoritative; otherwise each streamed delta counts as a token
+    return {
+      promptTokens: this.usage?.prompt_tokens ?? null,
+      completionTokens: this.usage?.completion_tokens ?? this.tokenCount,
+      estimated: !this.usage?.completion_tokens,
+      requestBytes: this.sent?.bytes ?? null,
+      wireBytes: this.sent?.wireBytes ?? null
+    };
+  }
+
+  finish() {}
+
+  end() {
+    this.finish();
+    if (!this.toStdout) {
+      try {
+        fsyncSync(this.fd);
+      } finally {
+        closeSync(this.fd);
+      }
+    }
+  }
+}
+
+class TextSink extends OutputSink {}
+
+class MarkdownSink extends OutputSink {
+  part(index, detail) {
+    this.writeRaw(`${index > 1 ? '\n\n' : ''}## Part ${index} (${detail})\n\n`);
+  }
+
+  result(index, detail, outcome) {
+    if (detail) this.part(index, detail);
+    this.writeRaw(outcome.ok ? `\`\`\`json\n${JSON.stringify(outcome.data, null, 2)}\n\`\`\`\n` : `> ⚠️ Invalid reply: ${outcome.error}\n`);
+  }
+
+  begin() {
+    const lines = ['# MyCodeHelper Response', ''];
+    if (this.meta.provider) lines.push(`- **Provider:** ${this.meta.provider}`);
+    if (this.meta.model) lines.push(`- **Model:** ${this.meta.model}`);
+    if (this.meta.file) lines.push(`- **File:** \`${this.meta.file}\``);
+    if (this.meta.prompt) lines.push(`- **Prompt:** ${this.meta.prompt}`);
+    this.writeRaw(lines.join('\n') + '\n\n');
+  }
+
+  finish() {
+    const timings = this.getTimings();
+    const usage = this.getUsage();
+    const seconds = timings.totalMs / 1000;
+    const parts = [`Generated in ${seconds.toFixed(2)}s`];
+    if (timings.firstTokenMs !== null) parts.push(`first token ${(timings.firstTokenMs / 1000).toFixed(2)}s`);
+    parts.push(`${usage.estimated ? '~' : ''}${usage.completionTokens} completion tokens`);
+    if (seconds > 0) parts.push(`${(usage.completionTokens / seconds).toFixed(1)} tokens/s`);
+    if (usage.wireBytes !== null) parts.push(`${usage.wireBytes.toLocaleString()} bytes sent`);
+    this.writeRaw(`\n\n---\n_${parts.join(' · ')}_\n`);
+  }
+}
+
+class JSONSink extends OutputSink {
+  begin() {
+    // Emit the envelope up to the response string so tokens can be appended as escaped fragments;
+    // schema runs collect their validated results in an array instead
+    this.results = 0;
+    const head = JSON.stringify({ ...this.meta, ...(this.meta.schema ? { results: [] } : { response: '' }) });
+    this.writeRaw(head.slice(0, -2));
+  }
+
+  result(index, detail, outcome) {
+    this.writeRaw(`${this.results++ > 0 ? ',' : ''}${JSON.stringify({ index, detail, ...outcome })}`);
+  }
+
+  writeToken(token) {
+    this.writeRaw(JSON.stringify(token).slice(1, -1));
+  }
+
+  finish() {
+    const close = this.meta.schema ? ']' : '"';
+    this.writeRaw(`${close},${JSON.stringify({ timings: this.getTimings(), usage: this.getUsage() }).slice(1)}\n`);
+  }
+}
+
+class JSONLSink extends OutputSink {
+  begin() {
+    this.writeRaw(JSON.stringify({ type: 'start', ...this.meta }) + '\n');
+  }
+
+  part(index, detail) {
+    this.writeRaw(JSON.stringify({ type: 'part', index, detail }) + '\n');
+  }
+
+  writeToken(token) {
+    this.writeRaw(JSON.stringify({ type: 'token', text: token }) + '\n');
+  }
+
+  result(index, detail, outcome) {
+    this.writeRaw(JSON.stringify({ type: 'result', index, detail, ...outcome }) + '\n');
+  }
+
+  finish() {
+    this.writeRaw(JSON.stringify({ type: 'end', timings: this.getTimings(), usage: this.getUsage() }) + '\n');
+  }
+}
+
+const OUTPUT_FORMATTERS = {
+  text: TextSink,
+  markdown: MarkdownSink,
+  json: JSONSink,
+  jsonl: JSONLSink
+};
+
+// Enhanced AI Clients with streaming and file support
+// Request compression - opt-in gzip or zstd bodies for servers (or proxies in front of them)
+// that accept Content-Encoding. Small bodies go out as-is, and a server that rejects a
+// compressed body is sent plain JSON from then on. Only a 415, or a 400 whose body names the
+// encoding, counts as a rejection; other errors are not the compression's fault.
+const ENCODING_ERROR = /encod|gzip|zstd|compress/i;
+// Level 1 keeps gzip ahead of a gigabit link; higher levels gain little on code
+const GZIP_OPTIONS = { level: 1 };
+
+class RequestEncoder {
+  static rejected = new Set();
+  static totals = RequestEncoder.emptyTotals();
+
+  // The totals shown by status cover one run; a daemon serves many
+  static emptyTotals() {
+    return { requests: 0, bytes: 0, wireBytes: 0, resent: 0 };
+  }
+
+  // zstd needs Node 22.15 or later; older versions use gzip
+  static encoding() {
+    const wanted = CONFIG.requestCompression;
+    if (wanted === 'zstd') return zlib.zstdCompress ? 'zstd' : 'gzip';
+    return wanted === 'gzip' ? 'gzip' : null;
+  }
+
+  // {body, encoding, bytes, wireBytes}; compression runs on the libuv pool
+  static async encode(body, baseUrl) {
+    const bytes = Buffer.byteLength(body);
+    const encoding = bytes >= CONFIG.compressMinBytes && !RequestEncoder.rejected.has(baseUrl) ? RequestEncoder.encoding() : null;
+    let payload = body;
+    if (encoding) {
+      payload = await new Promise((resolve, reject) => {
+        const done = (error, result) => error ? reject(error) : resolve(result);
+        if (encoding === 'zstd') zlib.zstdCompress(Buffer.from(body), done);
+        else zlib.gzip(Buffer.from(body), GZIP_OPTIONS, done);
+      });
+    }
+    return { body: payload, encoding, bytes, wireBytes: encoding ? payload.length : bytes };
+  }
+
+  // Whether a response to a compressed body says the server cannot read it; the body is read
+  // from a clone so callers still get it
+  static async rejects(response) {
+    if (response.status === 415) return true;
+    if (response.status !== 400) return false;
+    return ENCODING_ERROR.test(await response.clone().text().catch(() => ''));
+  }
+
+  // Totals count the attempt a request was answered on; compressed bodies the server
+  // rejected are only counted in resent
+  static record(request) {
+    RequestEncoder.totals.requests++;
+    RequestEncoder.totals.bytes += request.bytes;
+    RequestEncoder.totals.wireBytes += request.wireBytes;
+  }
+}
+
+class LocalAIClient {
+  static contextWindows = new Map();
+  static responseFormats = new Map();
+
+  constructor(config) {
+    this.config = config;
+  }
+
+  // A configured contextWindow wins; otherwise ask the server once per process
+  async contextWindow() {
+    if (ConfigLoader.isSet('contextWindow')) return CONFIG.contextWindow;
+    if (this.config.contextWindow) return this.config.contextWindow;
+    const key = `${this.config.baseUrl}|${this.config.model}`;
+    if (!LocalAIClient.contextWindows.has(key)) {
+      LocalAIClient.contextWindows.set(key, this.discoverContextWindow());
+    }
+    return LocalAIClient.contextWindows.get(key);
+  }
+
+  // vLLM reports max_model_len per model, llama.cpp the server's n_ctx on /props and
+  // TGI max_total_tokens on /info
+  async discoverContextWindow() {
+    const probe = async (path) => {
+      try {
+        const response = await fetch(`${this.config.baseUrl}${path}`, {
+          headers: { 'Authorization': `Bearer ${this.config.apiKey}` },
+          signal: AbortSignal.timeout(CONFIG.probeTimeout)
+        });
+        if (response.ok) return await response.json();
+        await response.body?.cancel();
+        return null;
+      } catch (error) {
+        return null;
+      }
+    };
+
+    const models = await probe('/v1/models');
+    const entry = models?.data?.find(model => model.id === this.config.model) || models?.data?.[0];
+    if (entry?.max_model_len > 0) return entry.max_model_len;
+
+    const props = await probe('/props');
+    const nCtx = props?.default_generation_settings?.n_ctx || props?.n_ctx;
+    if (nCtx > 0) return nCtx;
+
+    const info = await probe('/info');
+    return info?.max_total_tokens > 0 ? info.max_total_tokens : CONFIG.contextWindow;
   }
 
   async generateContent(message, options = {}) {
+    this.lastStatus = null;
     try {
       const messages = this.buildMessages(message, options);
-      
+      this.lastPromptTokens = TokenCounter.current.countMessages(messages);
+      this.lastRequestAt = Date.now();
+      const limit = TokenCounter.responseLimit(this.lastPromptTokens, options.task, await this.contextWindow());
+      if (limit.error) throw new Error(limit.error);
+      this.lastMaxTokens = limit.maxTokens;
+
       const requestBody = {
         model: this.config.model,
-        messages,
         temperature: CONFIG.temperature,
-        max_tokens: CONFIG.maxTokens,
+        max_tokens: limit.maxTokens,
         stream: options.stream !== false && CONFIG.streaming
       };
+      const format = options.responseFormat ? LocalAIClient.responseFormats.get(this.config.baseUrl) || 'json_schema' : null;
+      if (format) Object.assign(requestBody, LocalAIClient.responseFormat(format, options.responseFormat));
 
+      const request = await RequestEncoder.encode(PromptBuilder.requestBody(requestBody, messages), this.config.baseUrl);
       const response = await fetch(`${this.config.baseUrl}/v1/chat/completions`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
-          'Authorization': `Bearer ${this.config.apiKey}`
+          'Authorization': `Bearer ${this.config.apiKey}`,
+          ...(request.encoding ? { 'Content-Encoding': request.encoding } : {}),
+          ...this.config.headers
         },
-        body: JSON.stringify(requestBody)
+        body: request.body,
+        signal: options.signal
       });
 
+      this.lastStatus = response.status;
+      if (request.encoding && await RequestEncoder.rejects(response)) {
+        await response.body?.cancel();
+        RequestEncoder.rejected.add(this.config.baseUrl);
+        RequestEncoder.totals.resent++;
+        return this.generateContent(message, options);
+      }
+      // Servers without schema support reject the response_format; step down to plain JSON
+      // mode, then to the instructions in the prompt alone, and remember what worked
+      if (format && format !== 'prompt' && [400, 422].includes(response.status)) {
+        await response.body?.cancel();
+        LocalAIClient.responseFormats.set(this.config.baseUrl, format === 'json_schema' ? 'json_object' : 'prompt');
+        return this.generateContent(message, options);
+      }
+      this.lastRequest = { bytes: request.bytes, wireBytes: request.wireBytes, encoding: request.encoding };
+      RequestEncoder.record(this.lastRequest);
+      options.onRequest?.(this.lastRequest);
       if (!response.ok) {
-        throw new Error(`Local AI API error: ${response.status} ${response.statusText}`);
+        throw new Error(`${this.config.name || 'Local AI'} API error: ${response.status} ${response.statusText}`);
       }
 
       if (requestBody.stream) {
-        return this.handleStreamingResponse(response);
+        return this.handleStreamingResponse(response, options);
       } else {
         const data = await response.json();
-        return data.choices?.[0]?.message?.content || 'No response from Local AI';
+        const content = data.choices?.[0]?.message?.content || 'No response from Local AI';
+        options.onToken?.(content);
+        if (data.usage) {
+          this.lastUsage = data.usage;
+          options.onUsage?.(data.usage);
+        }
+        return content;
       }
     } catch (error) {
       return `Error: ${error.message}`;
     }
   }
 
+  // vLLM, llama.cpp and OpenAI take a json_schema response format; older llama.cpp builds
+  // read the schema from a json_object one
+  static responseFormat(format, { name, schema }) {
+    if (format === 'json_schema') {
+      return { response_format: { type: 'json_schema', json_schema: { name, schema, strict: false } } };
+    }
+    if (format === 'json_object') return { response_format: { type: 'json_object', schema } };
+    return {};
+  }
+
   buildMessages(message, options) {
     const messages = [];
     
@@ -232,15 +2872,11 @@ class LocalAIClient {
       messages.push({ role: 'system', content: options.systemPrompt });
     }
 
-    // Add file context if provided
+    // Add file context if provided (large files shrink to the chunks relevant to the message)
     if (options.files && options.files.length > 0) {
-      const fileContext = options.files.map(file => 
-        `File: ${file.path}\n\`\`\`${file.extension}\n${file.content}\n\`\`\``
-      ).join('\n\n');
-      
       messages.push({ 
         role: 'system', 
-        content: `Here are the relevant files for context:\n\n${fileContext}` 
+        content: PromptBuilder.fileContext(options.files, message)
       });
     }
 
@@ -255,8 +2891,9 @@ class LocalAIClient {
     return messages;
   }
 
-  async handleStreamingResponse(response) {
+  async handleStreamingResponse(response, options = {}) {
     let fullResponse = '';
+    const collect = options.collect !== false;
     const reader = response.body.getReader();
     
     try {
@@ -276,8 +2913,13 @@ class LocalAIClient {
               const parsed = JSON.parse(data);
               const content = parsed.choices?.[0]?.delta?.content || '';
               if (content) {
-                process.stdout.write(content);
-                fullResponse += content;
+                if (options.echo !== false) process.stdout.write(content);
+                options.onToken?.(content);
+                if (collect) fullResponse += content;
+              }
+              if (parsed.usage) {
+                this.lastUsage = parsed.usage;
+                options.onUsage?.(parsed.usage);
               }
             } catch (e) {
               // Skip invalid JSON
@@ -293,36 +2935,114 @@ class LocalAIClient {
   }
 }
 
+// Hugging Face - the OpenAI-compatible chat endpoint (server-side chat templates) when the
+// model or TGI server offers it, otherwise the text-generation API, which also takes a list
+// of inputs for batch jobs. Responses are only cached when sampling is off.
+const HF_APIS = ['auto', 'chat', 'text-generation'];
+
 class HuggingFaceClient {
+  static apis = new Map();
+
   constructor(config) {
     this.config = config;
+    if (!HF_APIS.includes(config.api || 'auto')) {
+      throw new Error(`Unknown HUGGING_FACE_API: ${config.api} (expected ${HF_APIS.join(', ')})`);
+    }
+    this.root = config.baseUrl ? config.baseUrl.replace(/\/$/, '') : `https://api-inference.huggingface.co/models/${config.model}`;
+    this.batching = true;
+    this.grammar = true;
+    this.chat = new LocalAIClient({
+      ...config,
+      baseUrl: this.root,
+      name: 'Hugging Face',
+      // The hosted API has no endpoint that reports the context size; a TGI server does
+      contextWindow: config.baseUrl ? 0 : CONFIG.contextWindow,
+      headers: { 'x-use-cache': String(HuggingFaceClient.deterministic()) }
+    });
+  }
+
+  static deterministic() {
+    return CONFIG.temperature === 0;
+  }
+
+  // 'chat' or 'text-generation'; 'auto' until the first chat request shows which one works
+  get api() {
+    if (this.config.api && this.config.api !== 'auto') return this.config.api;
+    return HuggingFaceClient.apis.get(this.root) || 'auto';
   }
 
   async generateContent(message, options = {}) {
+    if (this.api !== 'text-generation') {
+      const result = await this.chat.generateContent(message, options);
+      this.adopt(this.chat);
+      const unsupported = [404, 405].includes(this.chat.lastStatus);
+      if (this.api === 'chat' || !unsupported) {
+        if (this.chat.lastStatus === 200) HuggingFaceClient.apis.set(this.root, 'chat');
+        return result;
+      }
+      HuggingFaceClient.apis.set(this.root, 'text-generation');
+    }
+    return this.generateText(message, options);
+  }
+
+  // Request statistics shown by status come from whichever endpoint answered
+  adopt(client) {
+    this.lastPromptTokens = client.lastPromptTokens;
+    this.lastMaxTokens = client.lastMaxTokens;
+    this.lastUsage = client.lastUsage;
+    this.lastRequest = client.lastRequest;
+    this.lastRequestAt = client.lastRequestAt;
+  }
+
+  // TGI constrains generation to a JSON schema through its grammar parameter
+  parameters(maxTokens, responseFormat = null) {
+    const sampling = !HuggingFaceClient.deterministic();
+    return {
+      ...(sampling ? { temperature: CONFIG.temperature } : {}),
+      max_new_tokens: maxTokens,
+      return_full_text: false,
+      do_sample: sampling,
+      ...(responseFormat && this.grammar ? { grammar: { type: 'json', value: responseFormat.schema } } : {})
+    };
+  }
+
+  async postText(inputs, maxTokens, signal, responseFormat = null) {
+    const response = await fetch(this.root, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Authorization': `Bearer ${this.config.apiKey}`
+      },
+      body: JSON.stringify({
+        inputs,
+        parameters: this.parameters(maxTokens, responseFormat),
+        options: {
+          wait_for_model: true,
+          use_cache: HuggingFaceClient.deterministic()
+        }
+      }),
+      signal
+    });
+    return response;
+  }
+
+  async generateText(message, options = {}) {
     try {
       const prompt = this.buildPrompt(message, options);
-      
-      const response = await fetch(`https://api-inference.huggingface.co/models/${this.config.model}`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'Authorization': `Bearer ${this.config.apiKey}`
-        },
-        body: JSON.stringify({
-          inputs: prompt,
-          parameters: {
-            temperature: CONFIG.temperature,
-            max_new_tokens: CONFIG.maxTokens,
-            return_full_text: false,
-            do_sample: true
-          },
-          options: {
-            wait_for_model: true,
-            use_cache: false
-          }
-        })
-      });
+      this.lastPromptTokens = TokenCounter.current.count(prompt);
+      this.lastRequest = null;
+      this.lastRequestAt = Date.now();
+      const limit = TokenCounter.responseLimit(this.lastPromptTokens, options.task, await this.chat.contextWindow());
+      if (limit.error) throw new Error(limit.error);
+      this.lastMaxTokens = limit.maxTokens;
 
+      const response = await this.postText(prompt, limit.maxTokens, options.signal, options.responseFormat);
+      if (options.responseFormat && this.grammar && [400, 422].includes(response.status)) {
+        // Models without grammar support get the schema from the prompt alone
+        await response.body?.cancel();
+        this.grammar = false;
+        return this.generateText(message, options);
+      }
       if (!response.ok) {
         const errorText = await response.text();
         throw new Error(`Hugging Face API error: ${response.status} ${errorText}`);
@@ -330,8 +3050,9 @@ class HuggingFaceClient {
 
       const data = await response.json();
       const result = Array.isArray(data) ? data[0]?.generated_text || 'No response' : data.generated_text || 'No response';
+      options.onToken?.(result);
       
-      if (options.stream !== false && CONFIG.streaming) {
+      if (options.stream !== false && CONFIG.streaming && options.echo !== false) {
         // Simulate streaming for HF
         this.simulateStreaming(result);
       }
@@ -342,29 +3063,66 @@ class HuggingFaceClient {
     }
   }
 
+  // Answers for several {prompt, files} items, in order. The text-generation API takes them
+  // as one list of inputs; the chat API has no batch form, so there each item is sent alone.
+  async generateBatch(items, options = {}) {
+    const results = [];
+    let rest = items;
+    if (this.api === 'auto') {
+      results.push(await this.generateContent(items[0].prompt, { ...options, files: items[0].files }));
+      rest = items.slice(1);
+    }
+    if (this.api !== 'text-generation' || !this.batching || rest.length < 2) {
+      for (const item of rest) {
+        results.push(await this.generateContent(item.prompt, { ...options, files: item.files }));
+      }
+      return results;
+    }
+
+    try {
+      const prompts = rest.map(item => this.buildPrompt(item.prompt, { ...options, files: item.files }));
+      const counts = prompts.map(prompt => TokenCounter.current.count(prompt));
+      const limit = TokenCounter.responseLimit(Math.max(...counts), options.task, await this.chat.contextWindow());
+      if (limit.error) throw new Error(limit.error);
+      this.lastPromptTokens = counts.reduce((total, count) => total + count, 0);
+      this.lastMaxTokens = limit.maxTokens;
+      this.lastRequestAt = Date.now();
+
+      const response = await this.postText(prompts, limit.maxTokens, options.signal);
+      const data = response.ok ? await response.json() : null;
+      if (response.status >= 500) {
+        throw new Error(`Hugging Face API error: ${response.status} ${await response.text()}`);
+      }
+      if (!Array.isArray(data) || data.length !== prompts.length) {
+        // Servers without list inputs (a plain TGI /) reject them; send items one by one from now on
+        this.batching = false;
+        return results.concat(await this.generateBatch(rest, options));
+      }
+      return results.concat(data.map(entry => (Array.isArray(entry) ? entry[0] : entry)?.generated_text || 'No response'));
+    } catch (error) {
+      return results.concat(rest.map(() => `Error: ${error.message}`));
+    }
+  }
+
   buildPrompt(message, options) {
-    let prompt = '';
+    const parts = [];
     
     if (options.systemPrompt) {
-      prompt += `System: ${options.systemPrompt}\n\n`;
+      parts.push(`System: ${options.systemPrompt}\n\n`);
     }
     
     if (options.files && options.files.length > 0) {
-      prompt += 'Files for context:\n';
-      options.files.forEach(file => {
-        prompt += `\n${file.path}:\n${file.content}\n`;
-      });
-      prompt += '\n';
+      parts.push(PromptBuilder.fileContext(options.files, message, 'plain'));
     }
     
     if (options.history && options.history.length > 0) {
       options.history.forEach(msg => {
-        prompt += `${msg.role === 'user' ? 'Human' : 'Assistant'}: ${msg.content}\n`;
+        parts.push(`${msg.role === 'user' ? 'Human' : 'Assistant'}: ${msg.content}\n`);
       });
     }
     
-    prompt += `Human: ${message}\nAssistant:`;
-    return prompt;
+    parts.push(`Human: ${message}\nAssistant:`);
+    return parts.join('');
   }
 
   simulateStreaming(text) {
@@ -385,14 +3143,620 @@ class HuggingFaceClient {
   }
 }
 
+// Embedded backend - a GGUF model run in-process through node-llama-cpp, an optional peer
+// dependency imported on first use. Loaded models stay resident for the life of the process,
+// so a daemon pays the load once and answers later runs warm.
+class EmbeddedClient extends LocalAIClient {
+  static models = new Map();
+  static resident = new Map();
+
+  constructor(config) {
+    super(config);
+    this.queue = Promise.resolve();
+  }
+
+  get key() {
+    return `${resolve(this.config.model)}|${this.config.threads || 0}`;
+  }
+
+  static load(modelPath, threads = 0) {
+    const key = `${resolve(modelPath)}|${threads || 0}`;
+    if (!EmbeddedClient.models.has(key)) {
+      const loading = (async () => {
+        let bindings;
+        try {
+          bindings = await import('node-llama-cpp');
+        } catch (error) {
+          throw new Error('The embedded backend needs node-llama-cpp (npm install node-llama-cpp)');
+        }
+        if (!existsSync(modelPath)) {
+          throw new Error(`Embedded model not found: ${modelPath}`);
+        }
+        const startedAt = Date.now();
+        const llama = await bindings.getLlama();
+        const model = await llama.loadModel({ modelPath: resolve(modelPath) });
+        const context = await model.createContext({
+          contextSize: ConfigLoader.isSet('contextWindow') ? CONFIG.contextWindow : 'auto',
+          ...(threads > 0 ? { threads } : {})
+        });
+        const loaded = { bindings, llama, model, context, threads, loadMs: Date.now() - startedAt, requests: 0, grammars: new WeakMap() };
+        EmbeddedClient.resident.set(key, loaded);
+        return loaded;
+      })();
+      // A failed load is retried by the next request rather than cached
+      loading.catch(() => EmbeddedClient.models.delete(key));
+      EmbeddedClient.models.set(key, loading);
+    }
+    return EmbeddedClient.models.get(key);
+  }
+
+  // JSON schema grammars are compiled once per loaded model
+  static async grammar(loaded, schema) {
+    if (!loaded.grammars.has(schema)) {
+      loaded.grammars.set(schema, await loaded.llama.createGrammarForJsonSchema(schema));
+    }
+    return loaded.grammars.get(schema);
+  }
+
+  async contextWindow() {
+    const { context } = await EmbeddedClient.load(this.config.model, this.config.threads);
+    return context.contextSize;
+  }
+
+  // The model has one context sequence, so requests take turns
+  generateContent(message, options = {}) {
+    const run = this.queue.then(() => this.generate(message, options));
+    this.queue = run.catch(() => {});
+    return run;
+  }
+
+  async generate(message, options) {
+    let session = null;
+    try {
+      const loaded = await EmbeddedClient.load(this.config.model, this.config.threads);
+      const messages = this.buildMessages(message, options);
+      this.lastPromptTokens = TokenCounter.current.countMessages(messages);
+      this.lastRequestAt = Date.now();
+      const limit = TokenCounter.responseLimit(this.lastPromptTokens, options.task, loaded.context.contextSize);
+      if (limit.error) throw new Error(limit.error);
+      this.lastMaxTokens = limit.maxTokens;
+
+      // Same conversation as the HTTP request body, as node-llama-cpp chat history
+      const system = messages.filter(entry => entry.role === 'system').map(entry => entry.content).join('\n\n');
+      const history = messages.slice(0, -1).filter(entry => entry.role !== 'system').map(entry =>
+        entry.role === 'user' ? { type: 'user', text: entry.content } : { type: 'model', response: [entry.content] });
+      session = new loaded.bindings.LlamaChatSession({ contextSequence: loaded.context.getSequence() });
+      session.setChatHistory([{ type: 'system', text: system }, ...history]);
+
+      const echo = options.stream !== false && CONFIG.streaming && options.echo !== false;
+      const response = await session.prompt(message, {
+        grammar: options.responseFormat ? await EmbeddedClient.grammar(loaded, options.responseFormat.schema) : undefined,
+        maxTokens: limit.maxTokens,
+        temperature: CONFIG.temperature,
+        signal: options.signal,
+        onTextChunk: (text) => {
+          if (echo) process.stdout.write(text);
+          options.onToken?.(text);
+        }
+      });
+      loaded.requests++;
+      return response;
+    } catch (error) {
+      return `Error: ${error.message}`;
+    } finally {
+      session?.dispose({ disposeSequence: true });
+    }
+  }
+
+  describe() {
+    const loaded = EmbeddedClient.resident.get(this.key);
+    if (!loaded) return `${this.config.model} (not loaded yet)`;
+    const threads = loaded.threads > 0 ? loaded.threads : 'default';
+    return `${this.config.model}, loaded in ${loaded.loadMs} ms, ${loaded.context.contextSize}-token context, ${threads} threads, ${loaded.requests} requests served`;
+  }
+}
+
+// Multi-model fan-out - the same prompt goes to every configured model at once.
+// "first" streams the first model to produce a token and aborts the rest (or, without
+// streaming, takes the first successful answer); "compare" waits for all of them and emits
+// one part per model with its timing.
+const FANOUT_MODES = ['first', 'compare'];
+
+class FanOutClient {
+  constructor(clients, mode = 'first') {
+    if (!FANOUT_MODES.includes(mode)) {
+      throw new Error(`Unknown fan-out mode: ${mode} (expected ${FANOUT_MODES.join(', ')})`);
+    }
+    this.clients = clients;
+    this.mode = mode;
+    this.config = { model: clients.map(client => client.config.model).join(', ') };
+    this.lastRun = null;
+  }
+
+  // Comma-separated specs: "model" or "local:model[@baseUrl]" for Local AI, "hf:org/model" for
+  // Hugging Face, "embedded:path.gguf" for an in-process model
+  static parseModels(spec) {
+    return (spec || '').split(',').map(entry => entry.trim()).filter(Boolean).map(entry => {
+      if (entry.startsWith('hf:')) {
+        if (!CONFIG.HUGGING_FACE.apiKey) {
+          throw new Error(`${entry} needs HUGGING_FACE_API_KEY`);
+        }
+        return new HuggingFaceClient({ ...CONFIG.HUGGING_FACE, model: entry.slice(3) });
+      }
+      if (entry.startsWith('embedded:')) {
+        return new EmbeddedClient({ ...CONFIG.EMBEDDED, model: entry.slice(9) });
+      }
+      const [model, baseUrl] = entry.replace(/^local:/, '').split('@');
+      return new LocalAIClient({ ...CONFIG.LOCAL_AI, model, baseUrl: baseUrl || CONFIG.LOCAL_AI.baseUrl });
+    });
+  }
+
+  static providerName(client) {
+    if (client instanceof HuggingFaceClient) return 'Hugging Face';
+    return client instanceof EmbeddedClient ? 'Embedded' : 'Local AI';
+  }
+
+  async generateContent(message, options = {}) {
+    const startedAt = Date.now();
+    const controllers = this.clients.map(() => new AbortController());
+    const results = this.clients.map(client => ({
+      model: client.config.model,
+      provider: FanOutClient.providerName(client),
+      ok: false,
+      ms: null,
+      text: null,
+      usage: null
+    }));
+
+    const emit = (text) => {
+      options.onToken?.(text);
+      if (options.echo !== false && options.stream !== false && CONFIG.streaming) {
+        process.stdout.write(text);
+      }
+    };
+
+    // In "first" mode the model that produces the first token (or finishes first) leads: its
+    // tokens stream through and the other requests are aborted at that point. A stream that
+    // fails part-way cannot be taken back, so the run then ends with that model's error.
+    const racing = this.mode === 'first';
+    let leader = null;
+    let streamed = false;
+    const lead = (i) => {
+      if (leader !== null) return leader === i;
+      leader = i;
+      controllers.forEach((controller, j) => j !== i && controller.abort());
+      return true;
+    };
+
+    const attempts = this.clients.map(async (client, i) => {
+      let text;
+      try {
+        text = await client.generateContent(message, {
+          ...options,
+          stream: racing ? options.stream : false,
+          echo: false,
+          collect: true,
+          onToken: racing ? token => {
+            if (!lead(i)) return;
+            streamed = true;
+            emit(token);
+          } : undefined,
+          onUsage: usage => { results[i].usage = usage; },
+          signal: controllers[i].signal
+        });
+      } catch (error) {
+        Object.assign(results[i], { ms: Date.now() - startedAt, error: error.message });
+        throw error;
+      }
+      if (controllers[i].signal.aborted) throw new Error('cancelled');
+      Object.assign(results[i], { ms: Date.now() - startedAt, text, ok: !String(text).startsWith('Error: ') });
+      if (!results[i].ok) throw new Error(text);
+      if (racing && !lead(i)) throw new Error('cancelled');
+      return results[i];
+    });
+
+    let response;
+    if (racing) {
+      try {
+        const winner = await Promise.any(attempts);
+        controllers.forEach(controller => controller.abort());
+        if (winner.usage) options.onUsage?.(winner.usage);
+        response = winner.text;
+        if (!streamed) emit(response);
+      } catch (error) {
+        const reasons = results.map(result => `${result.model}: ${String(result.text ?? result.error ?? 'cancelled').replace(/^Error: /, '')}`);
+        response = `Error: all models failed (${reasons.join('; ')})`;
+        emit(streamed ? `\n${response}` : response);
+      }
+    } else {
+      await Promise.allSettled(attempts);
+      const part = options.onPart || ((index, detail) => emit(`${index > 1 ? '\n\n' : ''}--- ${detail} ---\n\n`));
+      const sections = results.map((result, i) => {
+        part(i + 1, `${result.model} · ${result.ms} ms${result.ok ? '' : ' · failed'}`);
+        emit(result.text);
+        return `### ${result.model} (${result.ms} ms)\n\n${result.text}`;
+      });
+      response = sections.join('\n\n');
+    }
+
+    this.lastRun = { mode: this.mode, totalMs: Date.now() - startedAt, results };
+    return response;
+  }
+
+  // One line per model: how long it took, and which one won in "first" mode
+  describeLastRun() {
+    if (!this.lastRun) return '';
+    const winner = this.mode === 'first'
+      ? this.lastRun.results.filter(result => result.ok).sort((a, b) => a.ms - b.ms)[0]
+      : null;
+    return this.lastRun.results.map(result => {
+      const state = result.ms === null ? 'cancelled' : result.ok ? `${result.ms} ms` : `failed after ${result.ms} ms`;
+      return `  ${result === winner ? '⚡' : ' '} ${result.model.padEnd(28)} ${state}`;
+    }).join('\n');
+  }
+}
+
+// Draft/verify cascade - a small model answers first and only hard prompts, or drafts
+// that look unsure, go to the large model
+const CASCADE_HARD_PROMPT = /\b(refactor\w*|architect\w*|redesign|debug\w*|race conditions?|deadlocks?|concurren\w*|security|vulnerab\w*|optimi[sz]\w*|performance|migrat\w*|prove|trade-?offs?)\b/i;
+const CASCADE_UNSURE_DRAFT = /\b(i'?m not (sure|certain)|i am not (sure|certain)|i don'?t know|i do not know|cannot determine|can'?t determine|hard to say|need more (context|information)|i'?m unable to|i am unable to|without (seeing|more context))\b/i;
+
+class CascadeClient {
+  constructor(draft, target) {
+    this.draft = draft;
+    this.target = target;
+    this.config = { model: `${draft.config.model} → ${target.config.model}` };
+    this.stats = {
+      draft: { requests: 0, accepted: 0, totalMs: 0, firstTokenMs: 0 },
+      target: { requests: 0, routed: 0, escalated: 0, totalMs: 0, firstTokenMs: 0 }
+    };
+  }
+
+  // Pre-routing gate: reasons to skip the draft entirely
+  static routeReason(message, options) {
+    const files = options.files || [];
+    if (files.length > CONFIG.cascadeMaxFiles) return `${files.length} files`;
+    const chars = files.reduce((total, file) => total + file.content.length, message.length);
+    if (chars > CONFIG.cascadeMaxChars) return `${chars} chars of input`;
+    const hard = message.match(CASCADE_HARD_PROMPT);
+    return hard ? `"${hard[0].toLowerCase()}" prompt` : null;
+  }
+
+  // Post-draft gate: reasons not to trust the draft
+  static doubtReason(text) {
+    if (!text.trim()) return 'empty draft';
+    if (text.startsWith('Error: ')) return 'draft failed';
+    const unsure = text.match(CASCADE_UNSURE_DRAFT);
+    return unsure ? `draft says "${unsure[0]}"` : null;
+  }
+
+  async ask(tier, client, message, options) {
+    const stats = this.stats[tier];
+    const startedAt = Date.now();
+    let firstTokenAt = null;
+    // Callers may pass collect: false, but the doubt gate needs the draft's text
+    const tokens = [];
+    const text = await client.generateContent(message, {
+      ...options,
+      onToken: token => {
+        if (firstTokenAt === null) firstTokenAt = Date.now();
+        tokens.push(token);
+        options.onToken?.(token);
+      }
+    });
+    stats.requests++;
+    stats.totalMs += Date.now() - startedAt;
+    stats.firstTokenMs += (firstTokenAt ?? Date.now()) - startedAt;
+    return text || tokens.join('');
+  }
+
+  async generateContent(message, options = {}) {
+    const route = CascadeClient.routeReason(message, options);
+    if (route) {
+      this.stats.target.routed++;
+      return this.ask('target', this.target, message, options);
+    }
+
+    // The draft streams straight to the caller; an escalation follows it as a second part
+    const draft = await this.ask('draft', this.draft, message, options);
+    const doubt = CascadeClient.doubtReason(draft);
+    if (!doubt) {
+      this.stats.draft.accepted++;
+      return draft;
+    }
+
+    this.stats.target.escalated++;
+    const detail = `${this.target.config.model} · escalated: ${doubt}`;
+    if (options.onPart) {
+      options.onPart(2, detail);
+    } else {
+      const marker = `\n\n--- ${detail} ---\n\n`;
+      options.onToken?.(marker);
+      if (options.echo !== false && options.stream !== false && CONFIG.streaming) {
+        process.stdout.write(marker);
+      }
+    }
+    return this.ask('target', this.target, message, options);
+  }
+
+  describeStats() {
+    const { draft, target } = this.stats;
+    const average = (total, count) => count ? `${Math.round(total / count)} ms` : '-';
+    const hitRate = draft.requests ? `${Math.round(100 * draft.accepted / draft.requests)}%` : '-';
+    return [
+      `  Draft  ${this.draft.config.model}: ${draft.requests} answered, ${draft.accepted} accepted (hit rate ${hitRate}), ` +
+        `first token ${average(draft.firstTokenMs, draft.requests)}, total ${average(draft.totalMs, draft.requests)}`,
+      `  Large  ${this.target.config.model}: ${target.requests} answered (${target.routed} routed, ${target.escalated} escalated), ` +
+        `first token ${average(target.firstTokenMs, target.requests)}, total ${average(target.totalMs, target.requests)}`
+    ].join('\n');
+  }
+}
+
+// Concurrency limit for map steps. Fixed with --concurrency n; with "auto" it follows
+// AIMD: one more slot per window of healthy responses, halved on errors (503s, timeouts)
+// and cut by 10% when latency climbs well above the best recently seen.
+const TRANSIENT_ERROR = /API error: (429|502|503|504)\b|fetch failed|ECONNRESET|ETIMEDOUT/;
+
+class ConcurrencyLimiter {
+  constructor({ limit = 1, adaptive = false, min = 1, max = CONFIG.maxConcurrency } = {}) {
+    this.limit = limit;
+    this.adaptive = adaptive;
+    this.min = min;
+    this.max = max;
+    this.inFlight = 0;
+    this.waiters = [];
+    this.baselineMs = Infinity;
+    this.lastDecreaseAt = 0;
+    this.stats = { requests: 0, errors: 0, retries: 0, latencyMs: 0, peak: limit, low: limit, startedAt: Date.now() };
+  }
+
+  static fromArgs(concurrency) {
+    return concurrency === 'auto'
+      ? new ConcurrencyLimiter({ limit: 2, adaptive: true })
+      : new ConcurrencyLimiter({ limit: concurrency });
+  }
+
+  get slots() {
+    return Math.max(this.min, Math.floor(this.limit));
+  }
+
+  acquire() {
+    if (this.inFlight < this.slots) {
+      this.inFlight++;
+      return Promise.resolve();
+    }
+    return new Promise(resolve => this.waiters.push(resolve));
+  }
+
+  release() {
+    this.inFlight--;
+    this.wake();
+  }
+
+  wake() {
+    while (this.waiters.length > 0 && this.inFlight < this.slots) {
+      this.inFlight++;
+      this.waiters.shift()();
+    }
+  }
+
+  // Feed one finished request back into the limit
+  record(startedAt, ok) {
+    const latencyMs = Date.now() - startedAt;
+    this.stats.requests++;
+    this.stats.latencyMs += latencyMs;
+    if (!ok) this.stats.errors++;
+    if (!this.adaptive) return;
+
+    if (!ok) {
+      this.decrease(0.5, startedAt);
+    } else {
+      // The baseline drifts up slowly so one unusually fast item does not pin it forever
+      this.baselineMs = Math.min(latencyMs, this.baselineMs * 1.02);
+      if (latencyMs > this.baselineMs * 2.5) {
+        this.decrease(0.9, startedAt);
+      } else {
+        this.limit = Math.min(this.max, this.limit + 1 / this.limit);
+      }
+    }
+    this.stats.peak = Math.max(this.stats.peak, this.slots);
+    this.stats.low = Math.min(this.stats.low, this.slots);
+    this.wake();
+  }
+
+  // Requests that started before the last cut saw the old limit; they do not cut again
+  decrease(factor, startedAt) {
+    if (startedAt < this.lastDecreaseAt) return;
+    this.limit = Math.max(this.min, this.limit * factor);
+    this.lastDecreaseAt = Date.now();
+  }
+
+  describe() {
+    const { requests, errors, retries, latencyMs, peak, low, startedAt } = this.stats;
+    const seconds = (Date.now() - startedAt) / 1000;
+    const mode = this.adaptive ? `adaptive, settled at ${this.slots} (range ${low}-${peak})` : `fixed at ${this.slots}`;
+    const throughput = seconds > 0 ? (requests / seconds).toFixed(2) : '-';
+    const average = requests ? `${Math.round(latencyMs / requests)} ms` : '-';
+    return `⚙️  Concurrency ${mode}: ${requests} requests in ${seconds.toFixed(1)}s ` +
+      `(${throughput} req/s, avg latency ${average}, ${errors} errors, ${retries} retries)`;
+  }
+}
+
+// Daemon - a long-lived process that serves CLI runs over a local socket with warm caches.
+// Each request carries the caller's settings variables, which replace the daemon's own for
+// that run, so a changed key, model or base URL is never served from the daemon's environment.
+const DAEMON_ENV = /^(MYCODEHELPER_|LOCAL_AI_|HF_|HUGGING_FACE_)|_API_KEY$/;
+
+class DaemonServer {
+  static socketPath() {
+    return process.env.MYCODEHELPER_DAEMON_SOCKET || join(CONFIG.cacheDir, 'daemon.sock');
+  }
+
+  constructor(socketPath = DaemonServer.socketPath()) {
+    this.socketPath = socketPath;
+    this.queue = Promise.resolve();
+    this.served = 0;
+  }
+
+  async start() {
+    if (process.platform === 'win32') {
+      throw new Error('Daemon mode requires Unix domain sockets and is not available on Windows');
+    }
+
+    // Whoever can connect runs commands with this user's keys: the socket is owner-only and
+    // never sits where other users could replace it
+    const dir = dirname(this.socketPath);
+    mkdirSync(dir, { recursive: true, mode: 0o700 });
+    const { mode } = statSync(dir);
+    if ((mode & 0o002) && !(mode & 0o1000)) {
+      throw new Error(`Refusing to create the daemon socket in ${dir}: the directory is world-writable without the sticky bit`);
+    }
+    if (existsSync(this.socketPath)) {
+      if (await DaemonServer.isAlive(this.socketPath)) {
+        throw new Error(`A daemon is already listening on ${this.socketPath}`);
+      }
+      unlinkSync(this.socketPath); // Stale socket from a crashed daemon
+    }
+
+    this.server = createServer(socket => this.accept(socket));
+    const umask = process.umask(0o077);
+    try {
+      await new Promise((resolvePromise, reject) => {
+        this.server.once('error', reject);
+        this.server.listen(this.socketPath, resolvePromise);
+      });
+    } finally {
+      process.umask(umask);
+    }
+    chmodSync(this.socketPath, 0o600);
+    process.on('exit', () => {
+      try {
+        unlinkSync(this.socketPath);
+      } catch (error) {
+        // Already removed
+      }
+    });
+
+    console.log(`🛰️  MyCodeHelper daemon listening on ${this.socketPath}`);
+  }
+
+  static isAlive(socketPath) {
+    return new Promise(resolvePromise => {
+      const probe = connect(socketPath);
+      probe.once('connect', () => {
+        probe.destroy();
+        resolvePromise(true);
+      });
+      probe.once('error', () => resolvePromise(false));
+    });
+  }
+
+  accept(socket) {
+    let buffered = '';
+    const onData = (data) => {
+      buffered += data;
+      const newline = buffered.indexOf('\n');
+      if (newline === -1) return;
+      socket.off('data', onData);
+
+      let request;
+      try {
+        request = JSON.parse(buffered.slice(0, newline));
+      } catch (error) {
+        socket.end(JSON.stringify({ stream: 'stderr', data: `Invalid daemon request: ${error.message}\n` }) + '\n' +
+          JSON.stringify({ exit: 2 }) + '\n');
+        return;
+      }
+      // Runs share process-wide stdout and cwd, so they are served one at a time
+      this.queue = this.queue.then(() => this.serve(request, socket));
+    };
+    socket.setEncoding('utf-8');
+    socket.on('data', onData);
+    socket.on('error', () => {});
+  }
+
+  async serve({ argv = [], cwd = null, env = null }, socket) {
+    const send = (message) => {
+      if (!socket.destroyed) socket.write(JSON.stringify(message) + '\n');
+    };
+    const restore = DaemonServer.captureOutput(send);
+    const restoreEnv = DaemonServer.useEnv(env);
+    const previousCwd = process.cwd();
+    let exit = 0;
+
+    try {
+      if (cwd) process.chdir(cwd);
+      const app = new MyCodeHelperComplete(argv, { daemon: true });
+      await app.run();
+      exit = app.exitCode;
+    } catch (error) {
+      process.stderr.write(`💥 Fatal error: ${error.message}\n`);
+      exit = 1;
+    } finally {
+      restore();
+      restoreEnv();
+      process.chdir(previousCwd);
+      this.served++;
+      send({ exit });
+      socket.end();
+    }
+  }
+
+  // Replace the daemon's settings variables with the caller's until the returned function runs;
+  // requests without an environment (older launchers) keep the daemon's
+  static useEnv(env) {
+    if (!env) return () => {};
+    const settings = () => Object.keys(process.env).filter(name => DAEMON_ENV.test(name));
+    const saved = Object.fromEntries(settings().map(name => [name, process.env[name]]));
+    settings().forEach(name => delete process.env[name]);
+    for (const [name, value] of Object.entries(env)) {
+      if (DAEMON_ENV.test(name)) process.env[name] = String(value);
+    }
+    return () => {
+      settings().forEach(name => delete process.env[name]);
+      Object.assign(process.env, saved);
+    };
+  }
+
+  // Route stdout/stderr writes (including console.*) into framed messages for the client
+  static captureOutput(send) {
+    const original = { stdout: process.stdout.write, stderr: process.stderr.write };
+    const capture = (stream) => (chunk, encoding, callback) => {
+      send({ stream, data: typeof chunk === 'string' ? chunk : Buffer.from(chunk).toString('utf-8') });
+      const done = typeof encoding === 'function' ? encoding : callback;
+      if (done) done();
+      return true;
+    };
+    process.stdout.write = capture('stdout');
+    process.stderr.write = capture('stderr');
+    return () => {
+      process.stdout.write = original.stdout;
+      process.stderr.write = original.stderr;
+    };
+  }
+}
+
 // Main Application with full CLI support
 class MyCodeHelperComplete {
-  constructor() {
+  constructor(argv = process.argv.slice(2), { daemon = false } = {}) {
+    this.inDaemon = daemon;
+    this.exitCode = 0;
+    this.failed = false;
+    Deduplicator.resetStats();
+    RequestEncoder.totals = RequestEncoder.emptyTotals();
     this.conversation = [];
     this.projectContext = null;
-    this.cliParser = new CLIParser();
+    this.symbolIndex = null;
+    this.session = null;
+    this.watcher = null;
+    this.contextStale = false;
+    // Settings files come first: the CLI's defaults are read from the settings they produce
+    const { projectRoot, config, profile } = new CLIParser(argv).args;
+    this.settings = ConfigLoader.apply({ root: projectRoot ? resolve(projectRoot) : process.cwd(), configPath: config, profile });
+    this.cliParser = new CLIParser(argv);
     this.client = null;
     this.providerType = '';
+    this.schema = null;
   }
 
   async initialize() {
@@ -407,129 +3771,606 @@ class MyCodeHelperComplete {
       return false;
     }
 
-    // Load configuration
-    if (this.cliParser.args.config) {
-      this.loadConfig(this.cliParser.args.config);
+    // A bad settings file is reported but does not stop the run
+    this.settings.errors.forEach(error => console.log(`❌ ${error}`));
+    if (this.cliParser.args.config && this.settings.sources.length > 0) {
+      const profile = this.settings.profile ? ` (profile ${this.settings.profile})` : '';
+      this.info(`📄 Configuration loaded from: ${this.settings.sources.join(', ')}${profile}`);
     }
 
-    // Initialize AI provider
-    if (CONFIG.HUGGING_FACE.apiKey) {
-      this.client = new HuggingFaceClient(CONFIG.HUGGING_FACE);
+    // Initialize AI provider (an embedded model is an explicit opt-in, so it comes first)
+    if (CONFIG.EMBEDDED.model) {
+      this.client = new EmbeddedClient(CONFIG.EMBEDDED);
+      this.providerType = 'Embedded';
+    } else if (CONFIG.HUGGING_FACE.apiKey) {
+      try {
+        this.client = new HuggingFaceClient(CONFIG.HUGGING_FACE);
+      } catch (error) {
+        console.log(`❌ ${error.message}`);
+        this.exitCode = 2;
+        return false;
+      }
       this.providerType = 'Hugging Face';
     } else if (CONFIG.LOCAL_AI.apiKey) {
       this.client = new LocalAIClient(CONFIG.LOCAL_AI);
       this.providerType = 'Local AI';
     } else {
       console.log('❌ No AI provider configured!');
-      console.log('Set HUGGING_FACE_API_KEY or LOCAL_AI_API_KEY environment variable.');
+      console.log('Set HUGGING_FACE_API_KEY, LOCAL_AI_API_KEY or MYCODEHELPER_EMBEDDED_MODEL.');
+      return false;
+    }
+
+    // --models swaps the single provider for one client per listed model
+    try {
+      const models = FanOutClient.parseModels(this.cliParser.args.models);
+      if (models.length > 1) {
+        this.client = new FanOutClient(models, this.cliParser.args.fanout);
+        this.providerType = `Fan-out (${this.cliParser.args.fanout})`;
+      } else if (models.length === 1) {
+        this.client = models[0];
+        this.providerType = FanOutClient.providerName(models[0]);
+      }
+
+      // A draft model puts a cascade in front of whatever answers otherwise
+      const [draft] = FanOutClient.parseModels(this.cliParser.args.draftModel);
+      if (draft) {
+        this.client = new CascadeClient(draft, this.client);
+        this.providerType = `Cascade (${this.providerType})`;
+      }
+    } catch (error) {
+      console.log(`❌ ${error.message}`);
+      this.exitCode = 2;
+      return false;
+    }
+
+    if (this.cliParser.args.schema) {
+      try {
+        this.schema = SchemaValidator.load(this.cliParser.args.schema);
+      } catch (error) {
+        console.log(`❌ ${error.message}`);
+        this.exitCode = 2;
+        return false;
+      }
+    }
+
+    // Context sizing counts tokens for the model that ultimately answers
+    let primary = this.client;
+    while (primary.target || primary.clients) primary = primary.target || primary.clients[0];
+    TokenCounter.use(primary.config.model);
+
+    if (this.cliParser.args.resume && !this.resumeSession(this.cliParser.args.resume)) {
+      this.exitCode = 1;
       return false;
     }
 
     // Load project context if analyzing codebase
     if (this.cliParser.args.codebase || this.cliParser.args.analyze) {
-      this.projectContext = FileUtils.getProjectSummary();
+      const scan = FileUtils.analyzeCodebase();
+      this.projectContext = FileUtils.getProjectSummary(CONFIG.projectRoot, scan);
+      this.symbolIndex = SymbolIndex.load().update(scan);
+      this.symbolIndex.save();
+      this.projectContext.symbols = this.symbolIndex.getStats();
+      this.session?.setContext(this.projectContext);
     }
 
     return true;
   }
 
   async run() {
+    if (this.cliParser.args.daemon && !this.inDaemon) {
+      await new DaemonServer().start();
+      return;
+    }
+
     const initialized = await this.initialize();
     if (!initialized) return;
 
+    if (this.inDaemon && (this.cliParser.args.interactive || this.cliParser.args.stdin)) {
+      console.log('❌ Interactive and stdin runs cannot be served by the daemon');
+      this.exitCode = 2;
+      return;
+    }
+
+    // Piped input is consumed as a stream unless another mode was explicitly requested
+    const args = this.cliParser.args;
+    const piped = !this.inDaemon && FileUtils.isPipedInput() && !args.interactive && !args.file && !args.analyze && !args.batch && !args.edit;
+
     // Handle non-interactive modes
-    if (this.cliParser.args.file) {
+    if (args.batch) {
+      await this.processBatch(args.batch);
+    } else if (args.edit) {
+      const applied = await this.editFile(args.edit, args.prompt || 'Improve this file.');
+      if (applied === null) this.exitCode = 1;
+    } else if (args.stdin || piped) {
+      await this.processStdin();
+    } else if (this.cliParser.args.file) {
       await this.processFile(this.cliParser.args.file);
     } else if (this.cliParser.args.prompt) {
       await this.processPrompt(this.cliParser.args.prompt);
     } else if (this.cliParser.args.analyze) {
-      await this.analyzeProject();
+      await this.analyzeProject(true);
+    } else if (this.inDaemon) {
+      console.log('❌ The daemon needs a prompt, --file, --batch or --analyze run');
+      this.exitCode = 2;
     } else {
-      // Default to interactive mode
+      // Default to interactive mode; a failed request there is not the session's exit status
       await this.interactiveMode();
+      return;
     }
+    if (this.failed && this.exitCode === 0) this.exitCode = 1;
+  }
+
+  // Clients return failures as 'Error: ...' replies; one-shot runs with any exit 1
+  recordFailure(response) {
+    if (typeof response === 'string' && response.startsWith('Error: ')) this.failed = true;
   }
 
   async processFile(filepath) {
     const file = FileUtils.readFile(filepath);
     if (!file) {
       console.log(`❌ Could not read file: ${filepath}`);
+      this.exitCode = 1;
+      return;
+    }
+    if (file.kind === 'binary') {
+      console.log(`❌ Not a text file: ${filepath}`);
+      this.exitCode = 1;
       return;
     }
 
-    console.log(`🔍 Processing file: ${filepath}`);
-    console.log(`📊 Size: ${file.size} bytes`);
-    console.log('');
+    this.info(`🔍 Processing file: ${filepath}`);
+    this.info(`📊 Size: ${file.size} bytes`);
+    if (file.kind !== 'text') this.info(`📉 ${file.kind} content - sending a summary instead of the full file`);
+    this.info('');
 
     const prompt = this.cliParser.args.prompt || `Analyze this ${file.extension} file and provide insights:`;
+    const systemPrompt = 'You are an expert code analyst. Provide detailed insights about the provided file.';
+
+    // Files too big for one request are mapped chunk by chunk along definition boundaries
+    if (file.kind === 'text' && file.content.length > this.cliParser.args.chunkSize) {
+      const chunks = ContentChunker.split(file.content, SymbolIndex.languageFor(file.extension), {
+        target: Math.floor(this.cliParser.args.chunkSize / 2)
+      });
+      const items = chunks.map((chunk, i) => this.chunkItem(`${prompt} (${filepath})`, chunk, i + 1));
+      const parts = await this.runParts(items, { systemPrompt, meta: { prompt, file: filepath } });
+      this.info(`✅ Processed ${parts} parts of ${filepath}`);
+      return;
+    }
     
+    if (this.schema) {
+      await this.runParts([{ prompt, files: [file] }], { systemPrompt, meta: { prompt, file: filepath } });
+      return;
+    }
+
     const options = {
       files: [file],
       stream: this.cliParser.args.stream,
-      systemPrompt: 'You are an expert code analyst. Provide detailed insights about the provided file.'
+      systemPrompt,
+      task: 'review'
     };
 
-    const response = await this.client.generateContent(prompt, options);
-    
-    if (!options.stream) {
-      console.log(response);
+    await this.generateWithOutput(prompt, options, { file: filepath });
+  }
+
+  async processStdin() {
+    const args = this.cliParser.args;
+    const instruction = args.prompt || 'Review the following input and provide insights.';
+    const systemPrompt = this.getSystemPrompt() + '\n\nThe user has piped input into the assistant.';
+    const chunks = FileUtils.readChunks(process.stdin, args.chunkSize);
+
+    // Peek two chunks: small inputs go out as one ordinary request
+    const first = await chunks.next();
+    const second = first.done ? first : await chunks.next();
+    if (second.done && !first.value?.text.trim()) {
+      // An empty pipe or file with a prompt argument is an ordinary prompt run
+      if (args.prompt) {
+        await this.processPrompt(args.prompt);
+        return;
+      }
+      console.log('❌ No input received on stdin');
+      this.exitCode = 2;
+      return;
     }
-    console.log('');
+    if (second.done) {
+      this.info(`📥 Read ${first.value.text.length} characters from stdin`);
+      if (this.schema) {
+        await this.runParts([{ prompt: this.buildChunkPrompt(instruction, first.value) }], { systemPrompt, meta: { input: 'stdin' } });
+        return;
+      }
+      await this.generateWithOutput(
+        this.buildChunkPrompt(instruction, first.value),
+        { stream: args.stream, systemPrompt },
+        { input: 'stdin' }
+      );
+      return;
+    }
+
+    const items = (async function* (app) {
+      let part = 0;
+      for (const chunk of [first.value, second.value]) {
+        part++;
+        yield app.chunkItem(instruction, chunk, part);
+      }
+      for await (const chunk of chunks) {
+        part++;
+        yield app.chunkItem(instruction, chunk, part);
+      }
+    })(this);
+
+    const parts = await this.runParts(items, { systemPrompt, meta: { prompt: instruction, input: 'stdin' } });
+    this.info(`✅ Processed ${parts} parts from stdin`);
+  }
+
+  chunkItem(instruction, chunk, part) {
+    return {
+      prompt: this.buildChunkPrompt(instruction, chunk, part),
+      detail: `lines ${chunk.startLine}-${chunk.endLine}`
+    };
+  }
+
+  // One request per line of the batch file: plain prompts or {"prompt": ..., "file": ...} objects
+  async processBatch(batchPath) {
+    if (!existsSync(batchPath)) {
+      console.log(`❌ Could not read batch file: ${batchPath}`);
+      this.exitCode = 1;
+      return;
+    }
+
+    const lines = createInterface({ input: createReadStream(batchPath, 'utf-8'), crlfDelay: Infinity });
+    // Items whose file cannot be read or is binary run without it, as with --file the batch exits 1
+    const skipped = [];
+    const items = (async function* () {
+      let lineNumber = 0;
+      for await (const line of lines) {
+        lineNumber++;
+        const item = FileUtils.parseBatchLine(line);
+        if (!item) continue;
+
+        const files = [];
+        if (item.file) {
+          const file = FileUtils.readFile(item.file);
+          if (file && file.kind !== 'binary') files.push(file);
+          else skipped.push(item.file);
+        }
+        yield {
+          prompt: item.prompt || `Analyze this ${extname(item.file || '')} file and provide insights:`,
+          files,
+          detail: `line ${lineNumber}`
+        };
+      }
+    })();
+
+    this.info(`📋 Running batch: ${batchPath}`);
+    const parts = await this.runParts(items, {
+      systemPrompt: this.getSystemPrompt(),
+      meta: { batch: batchPath }
+    });
+    this.info(`✅ Processed ${parts} batch items`);
+    if (skipped.length > 0) {
+      this.info(`❌ Skipped unreadable or binary files: ${skipped.join(', ')}`);
+      this.exitCode = 1;
+    }
+  }
+
+  // Send a sequence of {prompt, files, detail} requests through one output sink,
+  // streaming them one by one or as a bounded map step with --concurrency > 1 or auto
+  async runParts(items, { systemPrompt, meta = {} }) {
+    const args = this.cliParser.args;
+    const sink = OutputSink.create(args, {
+      provider: this.providerType,
+      model: this.client.config.model,
+      ...(this.schema ? { schema: this.schema.name } : {}),
+      ...meta
+    });
+    const checked = { valid: 0, invalid: 0, retried: 0 };
+    const emit = {
+      result: (index, detail, outcome) => {
+        sink.result(index, detail, outcome);
+        checked[outcome.ok ? 'valid' : 'invalid']++;
+        if (outcome.attempts > 1) checked.retried++;
+        if (!sink.toStdout) this.info(`📄 Part ${index}${detail ? ` (${detail})` : ''}: ${outcome.ok ? 'valid' : `invalid - ${outcome.error}`}`);
+      },
+      part: (index, detail) => {
+        if (sink) sink.part(index, detail);
+        if (!sink || !sink.toStdout) this.info(`\n📄 Part ${index} (${detail}):`);
+      },
+      token: (token) => {
+        if (sink) sink.write(token);
+        if (!sink || !sink.toStdout) process.stdout.write(token);
+      }
+    };
+
+    sink?.begin();
+    let parts = 0;
+    try {
+      if (args.concurrency === 'auto' || args.concurrency > 1) {
+        const limiter = ConcurrencyLimiter.fromArgs(args.concurrency);
+        parts = await this.mapConcurrently(items, systemPrompt, emit, limiter);
+        this.info(`\n${limiter.describe()}`);
+      } else if (this.client instanceof HuggingFaceClient && this.client.api === 'text-generation' && this.client.batching &&
+        CONFIG.HUGGING_FACE.batchSize > 1 && !this.schema) {
+        // Only list inputs batch; chat requests and servers without them stream one by one
+        parts = await this.mapBatches(items, systemPrompt, emit);
+      } else {
+        for await (const item of items) {
+          parts++;
+          if (this.schema) {
+            emit.result(parts, item.detail, await this.structuredRequest(item, systemPrompt));
+            continue;
+          }
+          emit.part(parts, item.detail);
+          let received = false;
+          const response = await this.client.generateContent(item.prompt, {
+            files: item.files,
+            stream: args.stream,
+            systemPrompt,
+            task: 'summary',
+            echo: false,
+            collect: false,
+            onToken: token => {
+              received = true;
+              emit.token(token);
+            },
+            onUsage: usage => sink?.setUsage(usage),
+            onRequest: request => sink?.addRequest(request)
+          });
+          // Errors are returned rather than streamed
+          if (!received && response) emit.token(response);
+          this.recordFailure(response);
+        }
+      }
+    } finally {
+      sink?.end();
+    }
+
+    if (!this.schema || !sink.toStdout) console.log('');
+    if (this.schema) {
+      this.info(`🧾 ${checked.valid}/${parts} replies matched the ${this.schema.name} schema${checked.retried ? ` (${checked.retried} needed a retry)` : ''}`);
+      if (checked.invalid > 0) this.exitCode = 1;
+    }
+    if (sink && !sink.toStdout) {
+      console.log(`💾 Output saved to: ${sink.output}`);
+    }
+    return parts;
+  }
+
+  // Map step for Hugging Face text-generation: items go out in groups of HUGGING_FACE_BATCH_SIZE
+  async mapBatches(items, systemPrompt, emit) {
+    let parts = 0;
+    let group = [];
+    const send = async () => {
+      const responses = await this.client.generateBatch(group, { systemPrompt, task: 'summary', stream: false, echo: false });
+      group.forEach((item, i) => {
+        emit.part(parts - group.length + i + 1, item.detail);
+        emit.token(responses[i]);
+        this.recordFailure(responses[i]);
+      });
+      group = [];
+    };
+
+    for await (const item of items) {
+      parts++;
+      group.push(item);
+      if (group.length >= CONFIG.HUGGING_FACE.batchSize) await send();
+    }
+    if (group.length > 0) await send();
+    return parts;
+  }
+
+  // Map step: keep as many requests in flight as the limiter allows and emit results in
+  // input order; finished results wait in a reorder window of twice the current limit
+  async mapConcurrently(items, systemPrompt, emit, limiter) {
+    const pending = [];
+    let index = 0;
+
+    const flush = async (wait) => {
+      if (wait && pending.length > 0) await pending[0].request;
+      while (pending.length > 0 && pending[0].settled) {
+        const { item, position, request } = pending.shift();
+        if (this.schema) {
+          emit.result(position, item.detail, await request);
+          continue;
+        }
+        emit.part(position, item.detail);
+        const response = await request;
+        emit.token(response);
+        this.recordFailure(response);
+      }
+    };
+
+    for await (const item of items) {
+      index++;
+      await limiter.acquire();
+      const entry = { item, position: index, settled: false };
+      entry.request = this.limitedRequest(item, systemPrompt, limiter).finally(() => {
+        entry.settled = true;
+      });
+      pending.push(entry);
+      await flush(pending.length >= limiter.slots * 2);
+    }
+
+    while (pending.length > 0) {
+      await flush(true);
+    }
+    return index;
+  }
+
+  // One map item on a slot already acquired from the limiter; overload errors are retried
+  async limitedRequest(item, systemPrompt, limiter, maxAttempts = 3) {
+    try {
+      for (let attempt = 1; ; attempt++) {
+        const startedAt = Date.now();
+        const response = this.schema ? await this.structuredRequest(item, systemPrompt) : await this.client.generateContent(item.prompt, {
+          files: item.files,
+          stream: false,
+          systemPrompt,
+          task: 'summary',
+          echo: false
+        });
+        const transient = TRANSIENT_ERROR.test(typeof response === 'string' ? response : response.error || '');
+        limiter.record(startedAt, !transient);
+        if (!transient || attempt === maxAttempts) return response;
+        limiter.stats.retries++;
+        await new Promise(resolve => setTimeout(resolve, 250 * 2 ** attempt));
+      }
+    } finally {
+      limiter.release();
+    }
+  }
+
+  // One item of a --schema run. The reply is checked as it streams and the request cut off as
+  // soon as it cannot be valid JSON or the value is complete; replies that fail to parse or
+  // validate are asked again with the problem spelled out, up to MYCODEHELPER_SCHEMA_RETRIES times
+  async structuredRequest(item, systemPrompt) {
+    const maxAttempts = CONFIG.schemaRetries + 1;
+    let prompt = item.prompt;
+    let failure = null;
+    for (let attempt = 1; attempt <= maxAttempts; attempt++) {
+      const parser = new JSONStreamParser();
+      const controller = new AbortController();
+      const response = await this.client.generateContent(prompt, {
+        files: item.files,
+        stream: this.cliParser.args.stream,
+        systemPrompt: `${systemPrompt}\n\n${SchemaValidator.instructions(this.schema.schema)}`,
+        task: 'review',
+        echo: false,
+        collect: false,
+        signal: controller.signal,
+        responseFormat: this.schema,
+        onToken: token => {
+          if (!parser.done && (!parser.push(token) || parser.done)) controller.abort();
+        }
+      });
+
+      // A request that failed before any output is an error, not a bad reply
+      if (!parser.text && !parser.error && response.startsWith('Error: ')) {
+        return { ok: false, error: response.slice(7), attempts: attempt };
+      }
+      const value = parser.finish();
+      const error = value === null ? parser.error : SchemaValidator.validate(value, this.schema.schema);
+      if (!error) return { ok: true, data: value, attempts: attempt };
 
-    // Save output if requested
-    if (this.cliParser.args.output) {
-      FileUtils.writeFile(this.cliParser.args.output, response);
-      console.log(`💾 Output saved to: ${this.cliParser.args.output}`);
+      failure = { ok: false, error, raw: parser.text, attempts: attempt };
+      prompt = `${item.prompt}\n\nYour previous reply was rejected: ${error}. Reply again with only a JSON value that matches the schema.`;
     }
+    return failure;
+  }
+
+  buildChunkPrompt(instruction, chunk, part = null) {
+    const label = part ? `Input part ${part}` : 'Input';
+    const text = PromptBuilder.compact(chunk.text.endsWith('\n') ? chunk.text.slice(0, -1) : chunk.text);
+    return `${instruction}\n\n${label} (lines ${chunk.startLine}-${chunk.endLine}):\n\`\`\`\n${text}\n\`\`\``;
   }
 
   async processPrompt(prompt) {
-    console.log(`🤖 ${this.providerType}:`);
+    this.info(`🤖 ${this.providerType}:`);
 
     const options = {
       stream: this.cliParser.args.stream,
-      systemPrompt: this.getSystemPrompt()
+      systemPrompt: PromptBuilder.systemPrompt(this.projectContext)
     };
 
-    // Add project context if available
-    if (this.projectContext) {
-      options.systemPrompt += `\n\nProject Context: ${JSON.stringify(this.projectContext, null, 2)}`;
+    options.files = this.contextFiles(prompt);
+
+    if (this.schema) {
+      await this.runParts([{ prompt, files: options.files }], { systemPrompt: options.systemPrompt, meta: { prompt } });
+      return;
     }
 
-    const response = await this.client.generateContent(prompt, options);
-    
-    if (!options.stream) {
-      console.log(response);
+    if (this.session) {
+      options.history = this.conversation.slice(-CONFIG.historyMessages);
     }
-    console.log('');
 
-    // Save output if requested
-    if (this.cliParser.args.output) {
-      FileUtils.writeFile(this.cliParser.args.output, response);
-      console.log(`💾 Output saved to: ${this.cliParser.args.output}`);
+    const response = await this.generateWithOutput(prompt, options);
+    this.recordTurn(prompt, response);
+  }
+
+  // Pinned session files first so the request prefix stays stable across turns, then
+  // the definitions the prompt mentions instead of whole files
+  contextFiles(prompt) {
+    const files = [];
+    if (this.session) {
+      const pinned = this.session.loadPinned();
+      pinned.changed.forEach(path => this.info(`📌 Pinned file changed: ${path}`));
+      files.push(...pinned.files);
+    }
+    if (this.symbolIndex) {
+      const seen = new Set(files.map(file => file.path));
+      files.push(...this.symbolIndex.selectContext(prompt).filter(snippet => !seen.has(snippet.path.replace(/:\d+-\d+$/, ''))));
     }
+    return files;
   }
 
-  async analyzeProject() {
-    console.log('🔍 Analyzing codebase...');
-    const files = FileUtils.analyzeCodebase();
-    const summary = FileUtils.getProjectSummary();
+  recordTurn(prompt, response) {
+    if (!this.session) return;
+    this.conversation.push({ role: 'user', content: prompt }, { role: 'assistant', content: response });
+    this.session.addMessage('user', prompt);
+    this.session.addMessage('assistant', response);
+  }
+
+  // Resuming replays history, pinned files and the recorded project context; the symbol
+  // index comes from its on-disk cache instead of a rescan (pass -c to refresh both)
+  resumeSession(query) {
+    const session = SessionStore.open(query);
+    if (!session) {
+      console.log(`❌ No session found: ${query}`);
+      return false;
+    }
+
+    this.session = session;
+    this.conversation = [...session.messages];
+    CONFIG.projectRoot = session.meta.projectRoot;
+    if (session.context) {
+      this.projectContext = session.context.summary;
+      this.symbolIndex = SymbolIndex.load();
+    }
+    this.info(`🗂️  Resumed session ${session.id}: ${session.messages.length} messages, ${session.pinned.size} pinned files`);
+    return true;
+  }
 
-    console.log('📊 Project Summary:');
-    console.log(`   Files: ${summary.totalFiles}`);
-    console.log(`   Languages: ${Object.keys(summary.languages).join(', ')}`);
-    console.log(`   Total Lines: ${summary.totalLines}`);
+  showSessions() {
+    const sessions = SessionStore.list();
+    if (sessions.length === 0) {
+      console.log('🗂️  No saved sessions');
+      console.log('');
+      return;
+    }
+
+    console.log('🗂️  Recent sessions:');
+    sessions.slice(0, 15).forEach(entry => {
+      const current = entry.id === this.session?.id ? '*' : ' ';
+      const here = entry.projectRoot === CONFIG.projectRoot ? '' : `  [${entry.projectRoot}]`;
+      console.log(` ${current}${entry.id}  ${entry.updatedAt.slice(0, 16).replace('T', ' ')}  ${String(entry.messages).padStart(3)} msgs  ${entry.title || '(empty)'}${here}`);
+    });
     console.log('');
+  }
+
+  async analyzeProject(useOutput = false) {
+    this.info('🔍 Analyzing codebase...');
+    const files = FileUtils.analyzeCodebase();
+    const summary = FileUtils.getProjectSummary(CONFIG.projectRoot, files);
+
+    this.info('📊 Project Summary:');
+    this.info(`   Files: ${summary.totalFiles}`);
+    this.info(`   Languages: ${Object.keys(summary.languages).join(', ')}`);
+    this.info(`   Total Lines: ${summary.totalLines}`);
+    this.info('');
 
     const prompt = 'Analyze this codebase structure and provide insights about the architecture, patterns, and potential improvements.';
     
     const options = {
-      files: files.slice(0, 10), // Limit to first 10 files
+      files: Deduplicator.representatives(files, CONFIG.analyzeFiles),
       stream: this.cliParser.args.stream,
-      systemPrompt: `You are a senior software architect. Analyze this codebase and provide insights about architecture, code quality, and recommendations.\n\nProject Summary: ${JSON.stringify(summary, null, 2)}`
+      task: 'review',
+      systemPrompt: `You are a senior software architect. Analyze this codebase and provide insights about architecture, code quality, and recommendations.\n\nProject Summary: ${PromptBuilder.json(summary)}`
     };
 
-    console.log(`🤖 ${this.providerType} Analysis:`);
+    this.info(`🤖 ${this.providerType} Analysis:`);
+    if (useOutput) {
+      await this.generateWithOutput(prompt, options);
+      return;
+    }
+
     const response = await this.client.generateContent(prompt, options);
     
     if (!options.stream) {
@@ -538,6 +4379,80 @@ class MyCodeHelperComplete {
     console.log('');
   }
 
+  // Stream the response into the --output/--format sink as tokens arrive
+  async generateWithOutput(prompt, options, meta = {}) {
+    const sink = OutputSink.create(this.cliParser.args, {
+      provider: this.providerType,
+      model: this.client.config.model,
+      prompt,
+      ...meta
+    });
+
+    if (!sink) {
+      const response = await this.client.generateContent(prompt, options);
+      if (!options.stream) {
+        console.log(response);
+      }
+      console.log('');
+      this.reportFanOut();
+      this.recordFailure(response);
+      return response;
+    }
+
+    // The sink already has every token; keep a copy only when the session needs the reply
+    const tokens = this.session ? [] : null;
+    options.onToken = token => {
+      tokens?.push(token);
+      sink.write(token);
+    };
+    options.onUsage = usage => sink.setUsage(usage);
+    options.onRequest = request => sink.addRequest(request);
+    options.onPart = (index, detail) => {
+      sink.part(index, detail);
+      if (!sink.toStdout) this.info(`\n📄 ${detail}:`);
+    };
+    options.echo = !sink.toStdout;
+    options.collect = false;
+
+    sink.begin();
+    let response;
+    try {
+      response = await this.client.generateContent(prompt, options);
+    } finally {
+      sink.end();
+    }
+    if (tokens && !response) {
+      response = tokens.join('');
+    }
+
+    if (!sink.toStdout) {
+      if (!options.stream) {
+        console.log(response);
+      }
+      console.log('');
+      console.log(`💾 Output saved to: ${sink.output}`);
+    }
+    this.reportFanOut();
+    this.recordFailure(response);
+    return response;
+  }
+
+  reportFanOut() {
+    if (this.client instanceof FanOutClient && this.client.lastRun) {
+      this.info(`🔀 ${this.client.mode} of ${this.client.clients.length} models in ${this.client.lastRun.totalMs} ms:`);
+      this.info(this.client.describeLastRun());
+    }
+  }
+
+  // Progress messages go to stderr when stdout carries structured output
+  info(message) {
+    if ((this.cliParser.args.format !== 'text' || this.schema) && !this.cliParser.args.output) {
+      console.error(message);
+    } else {
+      console.log(message);
+    }
+  }
+
   async interactiveMode() {
     console.log('🚀 MyCodeHelper Complete v0.1.13 - Local AI & Hugging Face Edition');
     console.log('============================================================');
@@ -546,6 +4461,22 @@ class MyCodeHelperComplete {
     if (this.projectContext) {
       console.log(`📁 Project context loaded: ${this.projectContext.totalFiles} files`);
     }
+
+    if (!this.session) {
+      try {
+        this.session = SessionStore.create({ provider: this.providerType, model: this.client.config.model });
+        if (this.projectContext) this.session.setContext(this.projectContext);
+      } catch (error) {
+        console.log(`⚠️  Session will not be saved: ${error.message}`);
+      }
+    }
+    if (this.session) {
+      console.log(`🗂️  Session ${this.session.id} (resume with --resume ${this.session.id})`);
+    }
+
+    if (this.cliParser.args.watch) {
+      this.startWatching();
+    }
     
     console.log('\n💡 Enhanced features: file processing, codebase analysis, streaming');
     console.log('💡 Type "help" for commands, "exit" to quit.\n');
@@ -577,6 +4508,7 @@ class MyCodeHelperComplete {
 
         if (userInput.toLowerCase() === 'clear') {
           this.conversation = [];
+          this.session?.clear();
           console.log('🧹 Conversation cleared.');
           continue;
         }
@@ -591,6 +4523,35 @@ class MyCodeHelperComplete {
           continue;
         }
 
+        if (userInput.toLowerCase() === 'sessions') {
+          this.showSessions();
+          continue;
+        }
+
+        if (userInput.startsWith('resume ')) {
+          this.resumeSession(userInput.slice(7).trim());
+          console.log('');
+          continue;
+        }
+
+        if (userInput.startsWith('unpin ')) {
+          this.session?.unpin(resolve(userInput.slice(6).trim()));
+          console.log(`📌 Unpinned: ${userInput.slice(6).trim()}`);
+          continue;
+        }
+
+        if (userInput.startsWith('symbols ')) {
+          this.showSymbols(userInput.slice(8).trim());
+          continue;
+        }
+
+        if (userInput.startsWith('edit ')) {
+          const [, filepath, ...instruction] = userInput.trim().split(/\s+/);
+          const confirm = async () => /^y(es)?$/i.test((await new Promise(resolve => rl.question('💾 Apply these edits? [y/N] ', resolve))).trim());
+          await this.editFile(filepath, instruction.join(' ') || 'Improve this file.', confirm);
+          continue;
+        }
+
         if (userInput.startsWith('file ')) {
           const filepath = userInput.slice(5).trim();
           await this.processFileInteractive(filepath);
@@ -601,18 +4562,18 @@ class MyCodeHelperComplete {
           continue;
         }
 
+        this.refreshProjectContext();
+
         // Add user message to conversation
         this.conversation.push({ role: 'user', content: userInput });
 
         const options = {
-          history: this.conversation.slice(-10), // Keep last 10 messages
+          history: this.conversation.slice(-CONFIG.historyMessages),
           stream: CONFIG.streaming,
-          systemPrompt: this.getSystemPrompt()
+          systemPrompt: PromptBuilder.systemPrompt(this.projectContext)
         };
 
-        if (this.projectContext) {
-          options.systemPrompt += `\n\nProject Context: ${JSON.stringify(this.projectContext, null, 2)}`;
-        }
+        options.files = this.contextFiles(userInput);
 
         process.stdout.write(`🤖 ${this.providerType}: `);
         const response = await this.client.generateContent(userInput, options);
@@ -621,9 +4582,12 @@ class MyCodeHelperComplete {
           console.log(response);
         }
         console.log('');
+        this.reportFanOut();
 
         // Add AI response to conversation
         this.conversation.push({ role: 'assistant', content: response });
+        this.session?.addMessage('user', userInput);
+        this.session?.addMessage('assistant', response);
 
       } catch (error) {
         console.log(`❌ Error: ${error.message}`);
@@ -632,6 +4596,114 @@ class MyCodeHelperComplete {
     }
 
     rl.close();
+    this.watcher?.close();
+  }
+
+  startWatching() {
+    if (!this.symbolIndex) {
+      this.symbolIndex = SymbolIndex.load();
+    }
+    // One stat pass catches edits made while nothing was watching; only changed files are read
+    this.symbolIndex.update(FileUtils.analyzeCodebase());
+    this.symbolIndex.save();
+
+    this.watcher = new ProjectWatcher(CONFIG.projectRoot, paths => {
+      if (this.symbolIndex.refresh(paths) > 0) {
+        this.symbolIndex.save();
+        this.contextStale = true;
+      }
+    }).start();
+    console.log(`👀 Watching ${CONFIG.projectRoot} (${this.watcher.mode})`);
+  }
+
+  // After watched edits the project summary is rebuilt once, on the next prompt
+  refreshProjectContext() {
+    if (!this.contextStale) return;
+    this.contextStale = false;
+    if (!this.projectContext) return;
+    this.projectContext = FileUtils.getProjectSummary();
+    this.projectContext.symbols = this.symbolIndex.getStats();
+    this.session?.setContext(this.projectContext);
+  }
+
+  // Ask for edit blocks against the file, apply them locally (one retry for blocks that do
+  // not match), validate, then write when confirmed. Returns the number of applied edits,
+  // or null when nothing could be applied.
+  async editFile(filepath, instruction, confirm = null) {
+    const file = FileUtils.readFile(filepath);
+    if (!file) {
+      console.log(`❌ Could not read file: ${filepath}`);
+      return null;
+    }
+    if (file.kind === 'binary') {
+      console.log(`❌ Not a text file: ${filepath}`);
+      return null;
+    }
+
+    const options = {
+      // Edits need the real content, even for files prompts would otherwise summarize, and
+      // SEARCH blocks must match it exactly
+      files: [{ ...file, kind: 'text', lossless: true }],
+      history: this.conversation.slice(-4),
+      stream: this.cliParser.args.stream,
+      systemPrompt: this.getSystemPrompt() + EDIT_INSTRUCTIONS,
+      task: 'edit'
+    };
+    console.log(`✏️  Editing ${filepath} (${file.size} bytes)`);
+    process.stdout.write(`🤖 ${this.providerType}: `);
+    let response = await this.client.generateContent(`Edit ${filepath}: ${instruction}`, options);
+    if (!options.stream || !CONFIG.streaming) console.log(response);
+    console.log('');
+
+    const blocks = PatchApplier.parse(response);
+    if (blocks.length === 0) {
+      console.log('❌ The response contained no SEARCH/REPLACE blocks or diff hunks');
+      return null;
+    }
+    let result = PatchApplier.apply(file.content, blocks);
+    let responseChars = response.length;
+
+    if (result.failed.length > 0) {
+      const problems = result.failed.map(({ index, block, reason }) =>
+        `Block ${index} (${reason}):\n<<<<<<< SEARCH\n${block.search}\n=======`).join('\n\n');
+      console.log(`🔁 ${result.failed.length} of ${blocks.length} edits did not apply; asking for corrected blocks`);
+      process.stdout.write(`🤖 ${this.providerType}: `);
+      const retry = await this.client.generateContent(
+        `These edit blocks did not apply to ${filepath}:\n\n${problems}\n\nReply with corrected SEARCH/REPLACE blocks for only these edits. Copy SEARCH text exactly from the current file.`,
+        { ...options, files: [{ ...file, kind: 'text', lossless: true, content: result.content }], history: [] }
+      );
+      if (!options.stream || !CONFIG.streaming) console.log(retry);
+      console.log('');
+      responseChars += retry.length;
+      const retried = PatchApplier.apply(result.content, PatchApplier.parse(retry));
+      result = { content: retried.content, applied: result.applied + retried.applied, failed: retried.failed };
+    }
+
+    result.failed.forEach(({ index, reason }) => console.log(`⚠️  Edit ${index} skipped: ${reason}`));
+    if (result.applied === 0) {
+      console.log('❌ No edits could be applied');
+      return null;
+    }
+
+    const problem = PatchApplier.validate(result.content, file.extension, file.content);
+    if (problem) {
+      console.log(`❌ Not writing ${filepath}: ${problem}`);
+      return null;
+    }
+
+    console.log(`✏️  ${result.applied} edit${result.applied === 1 ? '' : 's'} ready from ${responseChars} characters of output (the file is ${file.content.length})`);
+    const approved = confirm ? await confirm() : this.cliParser.args.apply;
+    if (!approved) {
+      console.log(confirm ? '↩️  Edits discarded' : '💡 Dry run - pass --apply to write the file');
+      return result.applied;
+    }
+
+    FileUtils.writeFile(filepath, result.content, file);
+    console.log(`💾 Updated ${filepath}`);
+    this.conversation.push({ role: 'user', content: `[Edit: ${filepath}] ${instruction}` }, { role: 'assistant', content: response });
+    this.session?.addMessage('user', `[Edit: ${filepath}] ${instruction}`);
+    this.session?.addMessage('assistant', response);
+    return result.applied;
   }
 
   async processFileInteractive(filepath) {
@@ -640,14 +4712,21 @@ class MyCodeHelperComplete {
       console.log(`❌ Could not read file: ${filepath}`);
       return;
     }
+    if (file.kind === 'binary') {
+      console.log(`❌ Not a text file: ${filepath}`);
+      return;
+    }
 
-    console.log(`📁 Loaded: ${filepath} (${file.size} bytes)`);
+    console.log(`📁 Loaded: ${filepath} (${file.size} bytes${file.kind === 'text' ? '' : `, ${file.kind} - summarized in prompts`})`);
+    this.session?.pin(file);
+    this.refreshProjectContext();
     
     const options = {
       files: [file],
-      history: this.conversation.slice(-5),
+      history: this.conversation.slice(-CONFIG.fileHistoryMessages),
       stream: CONFIG.streaming,
-      systemPrompt: this.getSystemPrompt() + '\n\nThe user has provided a file for analysis.'
+      systemPrompt: this.getSystemPrompt() + '\n\nThe user has provided a file for analysis.',
+      task: 'review'
     };
 
     const prompt = `Please analyze the file ${filepath} and provide insights.`;
@@ -662,27 +4741,36 @@ class MyCodeHelperComplete {
 
     this.conversation.push({ role: 'user', content: `[File: ${filepath}]` });
     this.conversation.push({ role: 'assistant', content: response });
+    this.session?.addMessage('user', `[File: ${filepath}]`);
+    this.session?.addMessage('assistant', response);
   }
 
-  getSystemPrompt() {
-    return `You are MyCodeHelper, an expert AI coding assistant. You help with:
-- Code analysis and debugging
-- Architecture and design patterns  
-- Best practices and optimization
-- Documentation and explanations
-- Problem solving and algorithms
+  showSymbols(query) {
+    if (!this.symbolIndex) {
+      this.symbolIndex = SymbolIndex.load().update(FileUtils.analyzeCodebase());
+      this.symbolIndex.save();
+    }
 
-Provide clear, actionable, and helpful responses. When analyzing code, be specific about improvements and potential issues.`;
-  }
+    const defs = this.symbolIndex.lookup(query);
+    if (defs.length === 0) {
+      console.log(`🔎 No symbols matching: ${query}`);
+      console.log('');
+      return;
+    }
 
-  loadConfig(configPath) {
-    try {
-      const config = JSON.parse(FileUtils.readFile(configPath).content);
-      Object.assign(CONFIG, config);
-      console.log(`📄 Configuration loaded from: ${configPath}`);
-    } catch (error) {
-      console.log(`❌ Could not load config: ${error.message}`);
+    console.log(`🔎 Symbols matching "${query}":`);
+    defs.slice(0, 20).forEach(def => {
+      const refs = this.symbolIndex.referencesTo(def.name).length;
+      console.log(`  ${def.kind.padEnd(9)} ${def.name}  ${def.file}:${def.line}  (${refs} referencing files)`);
+    });
+    if (defs.length > 20) {
+      console.log(`  ... and ${defs.length - 20} more`);
     }
+    console.log('');
+  }
+
+  getSystemPrompt() {
+    return SYSTEM_PROMPT;
   }
 
   showHelp() {
@@ -694,13 +4782,28 @@ USAGE:
 
 OPTIONS:
   -i, --interactive          Start interactive mode (default)
-  -f, --file <path>         Process a specific file
+  -f, --file <path>         Process a specific file ("-" reads stdin)
+  --edit <path>             Ask for edits to a file as SEARCH/REPLACE blocks (dry run)
+  --apply                   Write the edits from --edit to the file
+  --stdin                   Stream input from stdin (automatic when piped)
+  --batch <path>            Run one prompt per line (or JSONL {"prompt", "file"})
+  --chunk-size <chars>      Split piped input into chunks of this size (default: 24000)
+  --concurrency <n|auto>    Process up to n chunks in parallel, or adapt to the server (default: 1)
   -o, --output <path>       Save output to file  
   -a, --analyze             Analyze current codebase
   -c, --codebase            Load project context
-  --format <format>         Output format (text, json, markdown)
+  --project-root <path>     Project directory to scan and index (default: cwd)
+  --daemon                  Serve runs over a local socket with warm caches
+  --watch                   Keep the symbol index current as files change (interactive)
+  --resume <id|last>        Continue a saved session (history, pinned files, context)
+  --models <list>           Send each prompt to several models (comma-separated)
+  --fanout <mode>           first (stream the fastest model) or compare (all, with timings)
+  --draft-model <model>     Answer with this small model first; escalate hard prompts
+  --format <format>         Output format (text, json, jsonl, markdown)
+  --schema <name|path>      Reply as JSON validated against a schema (built-in: findings)
   --no-stream              Disable streaming responses
-  --config <path>          Load configuration file
+  --config <path>          Load configuration file (over ~/.mycodehelper/config.json and ./.mycodehelper.json)
+  --profile <name>         Apply a named settings profile from the config files
   -h, --help               Show this help
   -v, --version            Show version
 
@@ -708,27 +4811,67 @@ EXAMPLES:
   mycodehelper                                    # Interactive mode
   mycodehelper "Explain this error message"       # Single prompt
   mycodehelper -f app.js "Review this code"       # Analyze file
+  mycodehelper --edit app.js --apply "Add input validation"  # Patch a file in place
   mycodehelper -a                                 # Analyze codebase
   mycodehelper --codebase "What's the architecture?" # With project context
   mycodehelper -f script.py -o analysis.md        # Save to file
+  mycodehelper --format jsonl "Summarize" | jq    # Stream structured events
+  mycodehelper --schema findings -f app.js "Review" | jq '.findings[]'  # Machine-readable review
+  git diff | mycodehelper "Review this diff"      # Pipe input through the model
+  mycodehelper --resume last "And the tests?"     # Follow up on the latest session
+  mycodehelper --models qwen-1.5b,llama-3.1-8b --fanout compare "Explain closures"
 
 INTERACTIVE COMMANDS:
   help                     Show interactive help
   clear                    Clear conversation history
   status                   Show current configuration
   analyze                  Analyze current codebase
-  file <path>              Load and analyze a file
+  symbols <name>           Find definitions in the symbol index
+  file <path>              Load, pin and analyze a file
+  edit <path> <request>    Change a file through small patches
+  unpin <path>             Stop sending a pinned file
+  sessions                 List saved sessions
+  resume <id>              Switch to a saved session
   exit                     Quit the application
 
 ENVIRONMENT VARIABLES:
   HUGGING_FACE_API_KEY     Hugging Face API token
   HUGGING_FACE_MODEL       Hugging Face model name
+  HUGGING_FACE_BASE_URL    TGI or Inference Endpoint URL (default: hosted Inference API)
+  HUGGING_FACE_API         auto, chat or text-generation (default: auto)
+  HUGGING_FACE_BATCH_SIZE  Batch items per text-generation request (default: 8)
   LOCAL_AI_API_KEY         Local AI API key
   LOCAL_AI_BASE_URL        Local AI server URL
   LOCAL_AI_MODEL           Local AI model name
+  MYCODEHELPER_EMBEDDED_MODEL GGUF model run in-process (needs node-llama-cpp; no server)
+  MYCODEHELPER_THREADS     CPU threads for the embedded model (default: library default)
   MYCODEHELPER_MAX_TOKENS  Maximum response tokens (default: 8192)
+  MYCODEHELPER_OUTPUT_BUDGETS Per-task response budgets, e.g. chat=4096,review=4096,edit=4096,summary=1024
+  MYCODEHELPER_CONTEXT_WINDOW Model context in tokens when the server does not report it (default: 100000)
   MYCODEHELPER_TEMPERATURE Response creativity (default: 0.7)
   MYCODEHELPER_STREAMING   Enable streaming (default: true)
+  MYCODEHELPER_OUTPUT_FORMAT Default output format (default: text)
+  MYCODEHELPER_CHUNK_SIZE  Piped input chunk size in characters (default: 24000)
+  MYCODEHELPER_FILE_CONTEXT_TOKENS Larger context files are cut to relevant chunks (default: 6000)
+  MYCODEHELPER_TOKENIZER   Local tokenizer.json (file or directory) for exact token counts
+  MYCODEHELPER_CONTEXT_CHUNK Target chunk size for context files (default: 4000)
+  MYCODEHELPER_MAX_FILE_SIZE Largest file the scan reads (default: 1000000)
+  MYCODEHELPER_MAX_SCAN_FILES Files indexed per project (default: 100)
+  MYCODEHELPER_DEDUPE      Send duplicate context files once and name the copies (default: true)
+  MYCODEHELPER_NEAR_DUPLICATE Similarity at which files count as copies (default: 0.9; above 1 exact only)
+  MYCODEHELPER_COMPRESS    Compress request bodies: gzip, zstd or off (default: off)
+  MYCODEHELPER_COMPRESS_MIN_BYTES Smallest body worth compressing (default: 32768)
+  MYCODEHELPER_CONTEXT_WHITESPACE compact or lossless file context (default: compact)
+  MYCODEHELPER_WATCH_INTERVAL Polling interval when fs.watch is unavailable (default: 2000 ms)
+  MYCODEHELPER_CONCURRENCY Parallel chunk requests, or auto (default: 1)
+  MYCODEHELPER_MAX_CONCURRENCY Upper bound for auto concurrency (default: 16)
+  MYCODEHELPER_CACHE_DIR   Index cache directory (default: ~/.mycodehelper/cache)
+  MYCODEHELPER_SESSION_DIR Saved sessions (default: ~/.mycodehelper/sessions)
+  MYCODEHELPER_MODELS      Fan-out models: model, local:model@url, hf:org/model or embedded:path.gguf
+  MYCODEHELPER_FANOUT      Fan-out mode: first or compare (default: first)
+  MYCODEHELPER_DRAFT_MODEL Small draft model for the cascade (same syntax as MODELS)
+  MYCODEHELPER_CASCADE_MAX_FILES  Send prompts with more files straight to the large model (default: 3)
+  MYCODEHELPER_CASCADE_MAX_CHARS  ...or more input characters (default: 12000)
 
 For more information, visit: https://github.com/your-repo/mycodehelper
 `);
@@ -741,7 +4884,12 @@ For more information, visit: https://github.com/your-repo/mycodehelper
     console.log('  clear                    Clear conversation history');
     console.log('  status                   Show current configuration');
     console.log('  analyze                  Analyze current codebase');
-    console.log('  file <path>              Load and analyze a file');
+    console.log('  symbols <name>           Find definitions in the symbol index');
+    console.log('  file <path>              Load, pin and analyze a file');
+    console.log('  edit <path> <request>    Change a file through small patches');
+    console.log('  unpin <path>             Stop sending a pinned file');
+    console.log('  sessions                 List saved sessions');
+    console.log('  resume <id>              Switch to a saved session');
     console.log('  exit                     Exit the application');
     console.log('');
     console.log('💡 Examples:');
@@ -752,39 +4900,97 @@ For more information, visit: https://github.com/your-repo/mycodehelper
     console.log('');
   }
 
+  // The provider client that sent the most recent request (fan-out and cascade delegate)
+  lastRequestClient() {
+    const providers = [];
+    const walk = (client) => {
+      if (client.clients) client.clients.forEach(walk);
+      else if (client.draft) [client.draft, client.target].forEach(walk);
+      else providers.push(client);
+    };
+    walk(this.client);
+    return providers.filter(client => client.lastRequestAt).sort((a, b) => b.lastRequestAt - a.lastRequestAt)[0] || null;
+  }
+
   showStatus() {
     console.log('⚙️ MyCodeHelper Status:');
     console.log('======================');
     console.log(`Provider: ${this.providerType}`);
     console.log(`Model: ${this.client.config.model}`);
+    if (this.client instanceof FanOutClient) {
+      console.log(`Fan-out: ${this.client.mode} across ${this.client.clients.length} models`);
+    }
+    if (this.client instanceof EmbeddedClient) {
+      console.log(`Embedded: ${this.client.describe()}`);
+    }
+    if (this.client instanceof CascadeClient) {
+      console.log('Cascade:');
+      console.log(this.client.describeStats());
+    }
     console.log(`Conversation length: ${this.conversation.length} messages`);
+    if (this.session) {
+      console.log(`Session: ${this.session.id} (${this.session.pinned.size} pinned files)`);
+    }
+    const sources = this.settings.sources.length > 0 ? this.settings.sources.join(', ') : 'defaults and environment';
+    console.log(`Settings: ${sources}${this.settings.profile ? ` (profile ${this.settings.profile})` : ''}`);
     console.log(`Temperature: ${CONFIG.temperature}`);
-    console.log(`Max tokens: ${CONFIG.maxTokens}`);
+    console.log(`Max tokens: ${CONFIG.maxTokens} (budgets: ${Object.entries(CONFIG.outputBudgets).map(([task, tokens]) => `${task} ${tokens}`).join(', ')})`);
     console.log(`Streaming: ${CONFIG.streaming ? 'enabled' : 'disabled'}`);
     console.log(`Project context: ${this.projectContext ? 'loaded' : 'not loaded'}`);
+    if (this.symbolIndex) {
+      const stats = this.symbolIndex.getStats();
+      console.log(`Symbol index: ${stats.definitions} definitions in ${stats.indexedFiles} files, ${stats.chunks} chunks (${stats.changedChunks} re-chunked this run)`);
+      console.log(`Indexed tokens: ${stats.tokens.toLocaleString()}`);
+    }
+    if (Deduplicator.omitted > 0) {
+      console.log(`Duplicates omitted: ${Deduplicator.omitted} files (${Deduplicator.savedChars.toLocaleString()} chars not sent)`);
+    }
+    console.log(`Tokenizer: ${TokenCounter.current.describe()}`);
+    const last = this.lastRequestClient();
+    if (last) {
+      const reported = last.lastUsage?.prompt_tokens ? ` (server counted ${last.lastUsage.prompt_tokens.toLocaleString()})` : '';
+      console.log(`Last prompt: ${last.lastPromptTokens.toLocaleString()} tokens${reported}, max_tokens ${last.lastMaxTokens}`);
+      if (last.lastRequest) {
+        const { bytes, wireBytes, encoding } = last.lastRequest;
+        console.log(`Last request: ${bytes.toLocaleString()} bytes${encoding ? `, ${wireBytes.toLocaleString()} on the wire (${encoding})` : ''}`);
+      }
+    }
+    if (RequestEncoder.totals.requests > 0) {
+      const { requests, bytes, wireBytes, resent } = RequestEncoder.totals;
+      const saved = bytes > wireBytes ? ` (${bytes.toLocaleString()} before compression)` : '';
+      const retried = resent ? `; ${resent} compressed ${resent === 1 ? 'request was' : 'requests were'} rejected and resent uncompressed` : '';
+      console.log(`Sent: ${requests} requests, ${wireBytes.toLocaleString()} bytes on the wire${saved}${retried}`);
+    }
+    if (this.watcher) {
+      const last = this.watcher.lastUpdateAt ? `, last at ${this.watcher.lastUpdateAt.toLocaleTimeString()}` : '';
+      console.log(`Watch: ${this.watcher.mode}, ${this.watcher.updates} updates${last}`);
+    }
     console.log(`Working directory: ${CONFIG.projectRoot}`);
     console.log('');
   }
 }
 
-// Handle process termination
-process.on('SIGINT', () => {
-  console.log('\n👋 Goodbye!');
-  process.exit(0);
-});
-
-process.on('SIGTERM', () => {
-  console.log('\n👋 Goodbye!');
-  process.exit(0);
-});
-
 // Run the application
 async function main() {
+  // Handle process termination; registered here so importing the module leaves signals alone
+  for (const signal of ['SIGINT', 'SIGTERM']) {
+    process.on(signal, () => {
+      console.log('\n👋 Goodbye!');
+      process.exit(0);
+    });
+  }
+
   const app = new MyCodeHelperComplete();
   await app.run();
+  process.exitCode = app.exitCode;
 }
 
-main().catch(error => {
+// Run only when executed (directly or through a bin symlink), not when imported by benchmarks
+const invokedDirectly = Boolean(process.argv[1]) && existsSync(process.argv[1]) && realpathSync(process.argv[1]) === realpathSync(__filename);
+
+export { PromptBuilder, TokenCounter, ContentChunker, Deduplicator, PatchApplier, SYSTEM_PROMPT };
+
+if (invokedDirectly) main().catch(error => {
   console.error('💥 Fatal error:', error.message);
   process.exit(1);
 });
\ No newline at end of file
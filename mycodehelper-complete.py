@@ -25,24 +25,17 @@ Features:
 Requirements: Python 3.7+, Node.js 20+
 """
 
+# Startup cost matters for --version, --help and daemon-client runs: everything beyond
+# os/sys is imported inside the code path that needs it (see bench-startup.py).
 import os
 import sys
-import json
-import argparse
-import subprocess
-import tempfile
-import shutil
-import glob
-from pathlib import Path
-from urllib.request import urlopen, Request
-from urllib.error import URLError
-import logging
-
-# Fix Windows console encoding issues
-if sys.platform == 'win32':
-    import codecs
-    sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer, 'strict')
-    sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer, 'strict')
+
+
+def configure_console():
+    """Fix Windows console encoding issues"""
+    if sys.platform == 'win32':
+        for stream in (sys.stdout, sys.stderr):
+            stream.reconfigure(encoding='utf-8', errors='strict')
 
 # Enhanced MyCodeHelper JavaScript with full CLI features
 MYCODEHELPER_COMPLETE_JS = '''
@@ -119,6 +112,8 @@ class CLIParser {
         parsed.codebase = true;
       } else if (arg === '--config') {
         parsed.config = args[++i];
+      } else if (arg === '--project-root') {
+        parsed.projectRoot = args[++i];
       } else if (!arg.startsWith('-') && !parsed.prompt) {
         parsed.prompt = args.slice(i).join(' ');
         break;
@@ -159,7 +154,7 @@ class FileUtils {
     }
   }
 
-  static analyzeCodebase(rootPath = '.', maxFiles = 100) {
+  static analyzeCodebase(rootPath = CONFIG.projectRoot, maxFiles = 100) {
     const files = [];
     const ignoreDirs = new Set(['node_modules', '.git', 'dist', 'build', '.next', '__pycache__']);
     const codeExts = new Set(['.js', '.ts', '.jsx', '.tsx', '.py', '.java', '.cpp', '.c', '.cs', '.php', '.rb', '.go', '.rs', '.swift', '.kt']);
@@ -193,7 +188,7 @@ class FileUtils {
     return files;
   }
 
-  static getProjectSummary(rootPath = '.') {
+  static getProjectSummary(rootPath = CONFIG.projectRoot) {
     const files = this.analyzeCodebase(rootPath, 50);
     const summary = {
       totalFiles: files.length,
@@ -442,6 +437,10 @@ class MyCodeHelperComplete {
       return false;
     }
 
+    if (this.cliParser.args.projectRoot) {
+      CONFIG.projectRoot = resolve(this.cliParser.args.projectRoot);
+    }
+
     // Load configuration
     if (this.cliParser.args.config) {
       this.loadConfig(this.cliParser.args.config);
@@ -825,18 +824,705 @@ main().catch(error => {
 });
 '''
 
+# System prompts shared with the Node app
+SYSTEM_PROMPT = """You are MyCodeHelper, an expert AI coding assistant. You help with:
+- Code analysis and debugging
+- Architecture and design patterns  
+- Best practices and optimization
+- Documentation and explanations
+- Problem solving and algorithms
+
+Provide clear, actionable, and helpful responses. When analyzing code, be specific about improvements and potential issues."""
+
+FILE_SYSTEM_PROMPT = 'You are an expert code analyst. Provide detailed insights about the provided file.'
+
+
+def default_cache_dir():
+    """Shared with the Node app (CONFIG.cacheDir)"""
+    return os.getenv('MYCODEHELPER_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.mycodehelper', 'cache')
+
+
+# Config-file settings the launcher and native client read, by key path (CONFIG_ENV in the app)
+SETTINGS_ENV = {
+    ('LOCAL_AI', 'apiKey'): 'LOCAL_AI_API_KEY',
+    ('LOCAL_AI', 'baseUrl'): 'LOCAL_AI_BASE_URL',
+    ('LOCAL_AI', 'model'): 'LOCAL_AI_MODEL',
+    ('HUGGING_FACE', 'apiKey'): 'HUGGING_FACE_API_KEY',
+    ('HUGGING_FACE', 'model'): 'HUGGING_FACE_MODEL',
+    ('HUGGING_FACE', 'baseUrl'): 'HUGGING_FACE_BASE_URL',
+    ('HUGGING_FACE', 'api'): 'HUGGING_FACE_API',
+    ('HUGGING_FACE', 'batchSize'): 'HUGGING_FACE_BATCH_SIZE',
+    ('EMBEDDED', 'model'): 'MYCODEHELPER_EMBEDDED_MODEL',
+    ('maxTokens',): 'MYCODEHELPER_MAX_TOKENS',
+    ('contextWindow',): 'MYCODEHELPER_CONTEXT_WINDOW',
+    ('outputBudgets',): 'MYCODEHELPER_OUTPUT_BUDGETS',
+    ('temperature',): 'MYCODEHELPER_TEMPERATURE',
+    ('streaming',): 'MYCODEHELPER_STREAMING',
+    ('schema',): 'MYCODEHELPER_SCHEMA',
+    ('chunkSize',): 'MYCODEHELPER_CHUNK_SIZE',
+    ('fileContextTokens',): 'MYCODEHELPER_FILE_CONTEXT_TOKENS',
+    ('concurrency',): 'MYCODEHELPER_CONCURRENCY',
+    ('models',): 'MYCODEHELPER_MODELS',
+    ('draftModel',): 'MYCODEHELPER_DRAFT_MODEL',
+    ('cacheDir',): 'MYCODEHELPER_CACHE_DIR',
+    ('requestCompression',): 'MYCODEHELPER_COMPRESS',
+    ('compressMinBytes',): 'MYCODEHELPER_COMPRESS_MIN_BYTES',
+    ('contextWhitespace',): 'MYCODEHELPER_CONTEXT_WHITESPACE',
+}
+
+
+# File sniffing, as FileSniffer in the app: the first block decides whether a file is text,
+# binary, minified or a lockfile, and which encoding it uses
+SNIFF_BLOCK_BYTES = 8192
+LOCKFILE_NAMES = {'package-lock.json', 'npm-shrinkwrap.json', 'yarn.lock', 'pnpm-lock.yaml', 'bun.lockb',
+                  'Cargo.lock', 'poetry.lock', 'Pipfile.lock', 'uv.lock', 'composer.lock', 'Gemfile.lock',
+                  'go.sum', 'flake.lock', 'packages.lock.json'}
+MINIFIED_SUFFIXES = ('.min.js', '-min.js', '.min.mjs', '.min.cjs', '.min.css', '-min.css', '.bundle.js')
+BINARY_SIGNATURES = (b'\x89PNG', b'\xff\xd8\xff', b'GIF8', b'%PDF', b'PK\x03\x04', b'\x1f\x8b', b'\x7fELF',
+                     b'\xcf\xfa\xed\xfe')
+
+
+def sniff(head, name):
+    """(kind, encoding) for the first block of a file"""
+    if head.startswith(BINARY_SIGNATURES):
+        return 'binary', None
+    name_kind = 'lockfile' if name in LOCKFILE_NAMES else 'minified' if name.endswith(MINIFIED_SUFFIXES) else None
+    if head.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return name_kind or 'text', 'utf-16'
+    if b'\x00' in head:
+        return 'binary', None
+    control = sum(1 for byte in head if byte < 9 or (13 < byte < 32 and byte != 27))
+    if control > len(head) * 0.1:
+        return 'binary', None
+
+    import codecs
+
+    encoding = 'utf-8-sig'
+    try:
+        # Incremental, so a character cut off at the end of the block is not an error
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+    except UnicodeDecodeError:
+        import math
+
+        # Legacy single-byte text, unless the bytes look random (compressed or encrypted data)
+        counts = [head.count(bytes([byte])) for byte in set(head)]
+        if -sum(c / len(head) * math.log2(c / len(head)) for c in counts) > 7.5:
+            return 'binary', None
+        encoding = 'latin-1'
+    minified = len(head) >= 2048 and len(head) / (head.count(b'\n') + 1) > 250
+    return name_kind or ('minified' if minified else 'text'), encoding
+
+
+def summarize(kind, content, size):
+    """What a prompt gets instead of a minified bundle or lockfile"""
+    size_kb = f'{size / 1024:.1f} KB'
+    lines = content.split('\n')
+    if kind == 'lockfile':
+        shown = min(20, len(lines))
+        return f'[lockfile, {size_kb}, {len(lines)} lines - first {shown} shown]\n' + '\n'.join(lines[:20])
+    return f'[minified, {size_kb} on {len(lines)} lines - first {min(400, len(content))} characters shown]\n{content[:400]}'
+
+
+# A 415, or a 400 whose body names the encoding, means the server cannot read compressed
+# bodies (RequestEncoder.rejects in the app); other errors are not the compression's fault
+ENCODING_ERROR = r'encod|gzip|zstd|compress'
+
+
+def rejects_encoding(response):
+    import re
+
+    if response.status == 415:
+        response.read()
+        return True
+    if response.status != 400:
+        return False
+    detail = response.read()
+    # Callers still read the error body
+    response.read = lambda *args: detail
+    return bool(re.search(ENCODING_ERROR, detail.decode('utf-8', 'replace'), re.IGNORECASE))
+
+
+def compact_whitespace(content):
+    """Drop CRLFs, trailing whitespace and extra blank lines; indentation is kept (PromptBuilder.compact)"""
+    import re
+
+    content = '\n'.join(line.rstrip(' \t') for line in content.replace('\r\n', '\n').split('\n'))
+    return re.sub(r'\n{3,}', '\n\n', content)
+
+
+# Token estimate and response sizing, as TokenCounter in the app without a tokenizer: about
+# four characters per word piece, with 15% headroom on the prompt
+TOKEN_PRETOKENIZE = r"'(?:[sdmt]|ll|ve|re)| ?[^\W\d_]+| ?\d+| ?(?:[^\s\w]|_)+|\s+(?!\S)|\s+"
+OUTPUT_BUDGETS = {'chat': 4096, 'review': 4096, 'edit': 4096, 'summary': 1024}
+
+
+def estimate_tokens(text):
+    import re
+
+    return sum(max(1, -(-(len(piece) - (piece[0] == ' ')) // 4)) for piece in re.findall(TOKEN_PRETOKENIZE, text))
+
+
+def parse_budgets(value):
+    """'chat=4096,summary=1024' over the defaults (parseBudgets in the app)"""
+    budgets = dict(OUTPUT_BUDGETS)
+    for pair in value.split(','):
+        task, _, tokens = (part.strip() for part in pair.partition('='))
+        if task and tokens.isdigit() and int(tokens) > 0:
+            budgets[task] = int(tokens)
+    return budgets
+
+
+# Variables a daemon run takes from its caller instead of the daemon's own environment
+DAEMON_ENV_PREFIXES = ('MYCODEHELPER_', 'LOCAL_AI_', 'HF_', 'HUGGING_FACE_')
+
+
+def daemon_env():
+    """The caller's settings variables, including those from .env and config files"""
+    return {name: value for name, value in os.environ.items()
+            if name.startswith(DAEMON_ENV_PREFIXES) or name.endswith('_API_KEY')}
+
+
+def merge_settings(base, overrides):
+    """Nested dicts merge key by key; everything else replaces (ConfigLoader.merge in the app)"""
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            merge_settings(base[key], value)
+        elif value is not None:
+            base[key] = value
+    return base
+
+
+class NativeClient:
+    """Stdlib-only Local AI / Hugging Face client that keeps one connection open across requests"""
+
+    def __init__(self):
+        from urllib.parse import urlsplit
+
+        self.temperature = float(os.getenv('MYCODEHELPER_TEMPERATURE', '0.7'))
+        self.headers = {}
+        if os.getenv('HUGGING_FACE_API_KEY'):
+            self.provider = 'Hugging Face'
+            self.api_key = os.getenv('HUGGING_FACE_API_KEY')
+            self.model = os.getenv('HUGGING_FACE_MODEL', 'microsoft/DialoGPT-large')
+            # A TGI server or Inference Endpoint serves at its root; the hosted API per model
+            base_url = os.getenv('HUGGING_FACE_BASE_URL') or 'https://api-inference.huggingface.co'
+            self.model_path = '' if os.getenv('HUGGING_FACE_BASE_URL') else f'/models/{self.model}'
+            self.hf_api = os.getenv('HUGGING_FACE_API', 'auto')
+            # Only deterministic requests may be answered from the HF cache
+            self.headers['x-use-cache'] = 'true' if self.temperature == 0 else 'false'
+        else:
+            self.provider = 'Local AI'
+            self.api_key = os.getenv('LOCAL_AI_API_KEY', 'local-key')
+            self.model = os.getenv('LOCAL_AI_MODEL', 'llama-3.1-8b')
+            base_url = os.getenv('LOCAL_AI_BASE_URL', 'http://localhost:8080')
+            self.model_path = ''
+            self.hf_api = None
+
+        url = urlsplit(base_url)
+        self.scheme = url.scheme
+        self.netloc = url.netloc
+        self.base_path = url.path.rstrip('/')
+        self.max_tokens = int(os.getenv('MYCODEHELPER_MAX_TOKENS', '8192'))
+        self.output_budgets = parse_budgets(os.getenv('MYCODEHELPER_OUTPUT_BUDGETS', ''))
+        self.context_window = None
+        self.last_status = None
+        self.streaming = os.getenv('MYCODEHELPER_STREAMING') != 'false'
+        self.compression = os.getenv('MYCODEHELPER_COMPRESS', 'off')
+        self.compress_min_bytes = int(os.getenv('MYCODEHELPER_COMPRESS_MIN_BYTES', '32768'))
+        self.compact = os.getenv('MYCODEHELPER_CONTEXT_WHITESPACE') != 'lossless'
+        self.sent = {'requests': 0, 'bytes': 0, 'wireBytes': 0}
+        self.connection = None
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def encode(self, payload):
+        """(body, encoding) - gzip or zstd for large bodies when MYCODEHELPER_COMPRESS asks for it"""
+        if self.compression not in ('gzip', 'zstd') or len(payload) < self.compress_min_bytes:
+            return payload, None
+        if self.compression == 'zstd':
+            try:
+                from compression import zstd  # Python 3.14+
+                return zstd.compress(payload), 'zstd'
+            except ImportError:
+                pass
+        import gzip
+
+        return gzip.compress(payload, compresslevel=1, mtime=0), 'gzip'
+
+    def post(self, path, body):
+        import http.client
+        import json
+
+        payload = json.dumps(body, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        data, encoding = self.encode(payload)
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {self.api_key}',
+            **({'Content-Encoding': encoding} if encoding else {}),
+            **self.headers
+        }
+
+        for attempt in range(2):
+            if self.connection is None:
+                connection_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+                self.connection = connection_class(self.netloc, timeout=600)
+            try:
+                self.connection.request('POST', self.base_path + path, body=data, headers=headers)
+                response = self.connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # The server dropped the kept-alive connection; reconnect once
+                self.close()
+                if attempt == 1:
+                    raise
+                continue
+            if encoding and rejects_encoding(response):
+                # The server cannot read compressed bodies; send plain JSON from now on
+                self.compression = 'off'
+                return self.post(path, body)
+            # Only the attempt the server answered is counted
+            self.sent['requests'] += 1
+            self.sent['bytes'] += len(payload)
+            self.sent['wireBytes'] += len(data)
+            return response
+
+    def context(self, content):
+        return compact_whitespace(content) if self.compact else content
+
+    def build_messages(self, message, files, system_prompt):
+        messages = []
+        if system_prompt:
+            messages.append({'role': 'system', 'content': system_prompt})
+        if files:
+            file_context = '\n\n'.join(
+                f"File: {f['path']}\n```{f['extension']}\n{self.context(f['content'])}\n```" for f in files
+            )
+            messages.append({'role': 'system', 'content': f'Here are the relevant files for context:\n\n{file_context}'})
+        messages.append({'role': 'user', 'content': message})
+        return messages
+
+    def probe_context_window(self):
+        """vLLM reports max_model_len per model, llama.cpp n_ctx on /props and TGI max_total_tokens on /info"""
+        import http.client
+        import json
+
+        def probe(path):
+            connection_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+            connection = connection_class(self.netloc, timeout=1.5)
+            try:
+                connection.request('GET', self.base_path + self.model_path + path,
+                                   headers={'Authorization': f'Bearer {self.api_key}'})
+                response = connection.getresponse()
+                data = json.loads(response.read()) if response.status == 200 else None
+                return data if isinstance(data, dict) else {}
+            except (OSError, ValueError, http.client.HTTPException):
+                return {}
+            finally:
+                connection.close()
+
+        entries = [entry for entry in probe('/v1/models').get('data') or [] if isinstance(entry, dict)]
+        entry = next((entry for entry in entries if entry.get('id') == self.model), entries[0] if entries else {})
+        if (entry.get('max_model_len') or 0) > 0:
+            return entry['max_model_len']
+        props = probe('/props')
+        n_ctx = (props.get('default_generation_settings') or {}).get('n_ctx') or props.get('n_ctx')
+        if (n_ctx or 0) > 0:
+            return n_ctx
+        return probe('/info').get('max_total_tokens') or None
+
+    def response_limit(self, prompt_tokens, task):
+        """max_tokens for one request (TokenCounter.responseLimit): the task's output budget, capped by
+        MYCODEHELPER_MAX_TOKENS and by what the context window has left after the prompt"""
+        if self.context_window is None:
+            # MYCODEHELPER_CONTEXT_WINDOW wins; otherwise ask the server once per run
+            self.context_window = int(os.getenv('MYCODEHELPER_CONTEXT_WINDOW') or 0) or self.probe_context_window() or 100000
+        headroom = -(-prompt_tokens * 15 // 100) + 16
+        budget = self.output_budgets.get(task) or self.output_budgets['chat']
+        max_tokens = min(self.max_tokens, budget, self.context_window - prompt_tokens - headroom)
+        if max_tokens < min(256, budget):
+            raise RuntimeError(f'Prompt is about {prompt_tokens} tokens, leaving no room for a response '
+                               f'in the {self.context_window}-token context window')
+        return max_tokens
+
+    def generate(self, message, files=None, system_prompt=None, stream=True, on_token=None, task='chat'):
+        """Return (response_text, usage); tokens are passed to on_token as they arrive"""
+        try:
+            if self.provider == 'Hugging Face':
+                return self.generate_hugging_face(message, files, system_prompt, stream and self.streaming, on_token, task)
+            return self.generate_local_ai(message, files, system_prompt, stream and self.streaming, on_token, task)
+        except Exception as e:
+            self.close()
+            return f'Error: {e}', None
+
+    def generate_local_ai(self, message, files, system_prompt, stream, on_token, task):
+        import json
+
+        messages = self.build_messages(message, files, system_prompt)
+        # Chat templates add a few tokens of framing per message
+        prompt_tokens = sum(estimate_tokens(m['content']) + 4 for m in messages) + 2
+        response = self.post(self.model_path + '/v1/chat/completions', {
+            'model': self.model,
+            'messages': messages,
+            'temperature': self.temperature,
+            'max_tokens': self.response_limit(prompt_tokens, task),
+            'stream': stream
+        })
+        self.last_status = response.status
+        if response.status != 200:
+            response.read()
+            raise RuntimeError(f'{self.provider} API error: {response.status} {response.reason}')
+
+        if not stream:
+            data = json.loads(response.read())
+            content = ((data.get('choices') or [{}])[0].get('message') or {}).get('content') or 'No response from Local AI'
+            if on_token:
+                on_token(content)
+            return content, data.get('usage')
+
+        parts = []
+        usage = None
+        for raw in response:
+            line = raw.decode('utf-8').strip()
+            if not line.startswith('data: '):
+                continue
+            data = line[6:]
+            if data == '[DONE]':
+                break
+            try:
+                parsed = json.loads(data)
+            except ValueError:
+                continue
+            content = ((parsed.get('choices') or [{}])[0].get('delta') or {}).get('content') or ''
+            if content:
+                parts.append(content)
+                if on_token:
+                    on_token(content)
+            usage = parsed.get('usage') or usage
+        # Drain the rest of the body so the connection can be reused
+        response.read()
+        return ''.join(parts), usage
+
+    def generate_hugging_face(self, message, files, system_prompt, stream, on_token, task):
+        """Chat endpoint first (server-side chat templates); text-generation where it is missing"""
+        if self.hf_api != 'text-generation':
+            try:
+                return self.generate_local_ai(message, files, system_prompt, stream, on_token, task)
+            except RuntimeError:
+                if self.hf_api == 'chat' or self.last_status not in (404, 405):
+                    raise
+            self.hf_api = 'text-generation'
+        return self.generate_text(message, files, system_prompt, on_token, task)
+
+    def generate_text(self, message, files, system_prompt, on_token, task):
+        import json
+
+        prompt = ''
+        if system_prompt:
+            prompt += f'System: {system_prompt}\n\n'
+        if files:
+            prompt += 'Files for context:\n'
+            for f in files:
+                prompt += f"\n{f['path']}:\n{self.context(f['content'])}\n"
+            prompt += '\n'
+        prompt += f'Human: {message}\nAssistant:'
+
+        sampling = self.temperature > 0
+        parameters = {'max_new_tokens': self.response_limit(estimate_tokens(prompt), task),
+                      'return_full_text': False, 'do_sample': sampling}
+        if sampling:
+            parameters['temperature'] = self.temperature
+        response = self.post(self.model_path or '/', {
+            'inputs': prompt,
+            'parameters': parameters,
+            'options': {'wait_for_model': True, 'use_cache': not sampling}
+        })
+        body = response.read()
+        if response.status != 200:
+            raise RuntimeError(f"Hugging Face API error: {response.status} {body.decode('utf-8', 'replace')}")
+
+        data = json.loads(body)
+        result = (data[0] if isinstance(data, list) and data else data).get('generated_text') or 'No response'
+        if on_token:
+            on_token(result)
+        return result, None
+
+
+class NativeOutput:
+    """Python counterpart of the Node output sinks (text, markdown, json, jsonl)"""
+
+    def __init__(self, fmt, output, meta):
+        import time
+
+        self.clock = time
+        self.format = fmt
+        self.output = output
+        self.stream = open(output, 'w', encoding='utf-8') if output else sys.stdout
+        self.meta = meta
+        self.usage = None
+        self.sent = None
+        self.token_count = 0
+        self.started = self.clock.time()
+        self.first_token = None
+
+    @staticmethod
+    def encode(value):
+        import json
+
+        # Match JSON.stringify so both engines produce identical envelopes
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+    def emit(self, text):
+        self.stream.write(text)
+        self.stream.flush()
+
+    def begin(self):
+        if self.format == 'markdown':
+            lines = ['# MyCodeHelper Response', '']
+            for key, label in (('provider', 'Provider'), ('model', 'Model'), ('file', 'File'), ('prompt', 'Prompt')):
+                if self.meta.get(key):
+                    lines.append(f'- **{label}:** {self.meta[key]}')
+            self.emit('\n'.join(lines) + '\n\n')
+        elif self.format == 'json':
+            self.emit(self.encode(dict(self.meta, response=''))[:-2])
+        elif self.format == 'jsonl':
+            self.emit(self.encode(dict(type='start', **self.meta)) + '\n')
+
+    def part(self, index, detail):
+        if self.format == 'jsonl':
+            self.emit(self.encode({'type': 'part', 'index': index, 'detail': detail}) + '\n')
+        elif self.format == 'markdown':
+            self.emit(f"{chr(10) * 2 if index > 1 else ''}## Part {index} ({detail})\n\n")
+        else:
+            self.write_token(f"{chr(10) * 2 if index > 1 else ''}--- Part {index} ({detail}) ---\n\n")
+
+    def write(self, token):
+        if not token:
+            return
+        if self.first_token is None:
+            self.first_token = self.clock.time()
+        self.token_count += 1
+        self.write_token(token)
+
+    def write_token(self, token):
+        if self.format == 'json':
+            self.emit(self.encode(token)[1:-1])
+        elif self.format == 'jsonl':
+            self.emit(self.encode({'type': 'token', 'text': token}) + '\n')
+        else:
+            self.emit(token)
+
+    def summary(self):
+        total_ms = int((self.clock.time() - self.started) * 1000)
+        timings = {
+            'startedAt': self.clock.strftime('%Y-%m-%dT%H:%M:%SZ', self.clock.gmtime(self.started)),
+            'firstTokenMs': None if self.first_token is None else int((self.first_token - self.started) * 1000),
+            'totalMs': total_ms
+        }
+        usage = self.usage or {}
+        return timings, {
+            'promptTokens': usage.get('prompt_tokens'),
+            'completionTokens': usage.get('completion_tokens') or self.token_count,
+            'estimated': not usage.get('completion_tokens'),
+            'requestBytes': self.sent['bytes'] if self.sent else None,
+            'wireBytes': self.sent['wireBytes'] if self.sent else None
+        }
+
+    def end(self):
+        timings, usage = self.summary()
+        if self.format == 'markdown':
+            seconds = timings['totalMs'] / 1000
+            parts = [f'Generated in {seconds:.2f}s']
+            if timings['firstTokenMs'] is not None:
+                parts.append(f"first token {timings['firstTokenMs'] / 1000:.2f}s")
+            parts.append(f"{'~' if usage['estimated'] else ''}{usage['completionTokens']} completion tokens")
+            if seconds > 0:
+                parts.append(f"{usage['completionTokens'] / seconds:.1f} tokens/s")
+            if usage['wireBytes'] is not None:
+                parts.append(f"{usage['wireBytes']:,} bytes sent")
+            self.emit(f"\n\n---\n_{' · '.join(parts)}_\n")
+        elif self.format == 'json':
+            self.emit('",' + self.encode({'timings': timings, 'usage': usage})[1:] + '\n')
+        elif self.format == 'jsonl':
+            self.emit(self.encode({'type': 'end', 'timings': timings, 'usage': usage}) + '\n')
+        else:
+            self.emit('\n')
+
+        if self.output:
+            self.stream.flush()
+            os.fsync(self.stream.fileno())
+            self.stream.close()
+
+
+class NativeRunner:
+    """Runs prompt, --file and --batch modes without spawning Node"""
+
+    def __init__(self, args):
+        self.args = args
+        self.client = NativeClient()
+        self.structured_stdout = args.format != 'text' and not args.output
+        # Unreadable inputs and error replies make the run exit 1, as in the app
+        self.failed = False
+
+    def info(self, message):
+        print(message, file=sys.stderr if self.structured_stdout else sys.stdout)
+
+    def read_file(self, filepath):
+        try:
+            with open(filepath, 'rb') as f:
+                head = f.read(SNIFF_BLOCK_BYTES)
+                kind, encoding = sniff(head, os.path.basename(filepath))
+                if kind == 'binary':
+                    print(f'[ERROR] Not a text file: {filepath}', file=sys.stderr)
+                    self.failed = True
+                    return None
+                data = head + f.read()
+        except OSError as e:
+            print(f'[ERROR] Could not read file: {filepath} ({e})', file=sys.stderr)
+            self.failed = True
+            return None
+        content = data.decode(encoding, errors='replace')
+        if kind != 'text':
+            self.info(f'[INFO] {filepath}: {kind} content, sending a summary instead of the full file')
+            content = summarize(kind, content, len(data))
+        return {'path': filepath, 'content': content, 'size': len(data), 'extension': os.path.splitext(filepath)[1]}
+
+    def open_output(self, meta):
+        return NativeOutput(self.args.format, self.args.output, dict(
+            provider=self.client.provider, model=self.client.model, **meta))
+
+    def make_writer(self, sink):
+        def on_token(token):
+            sink.write(token)
+            if sink.output:
+                sys.stdout.write(token)
+                sys.stdout.flush()
+        return on_token
+
+    def run(self):
+        """Return the exit status: 1 when an input could not be read or a request failed"""
+        try:
+            if self.args.batch:
+                self.run_batch(self.args.batch)
+            elif self.args.file:
+                self.run_file(self.args.file)
+            else:
+                self.run_prompt(' '.join(self.args.prompt))
+        finally:
+            self.client.close()
+        return 1 if self.failed else 0
+
+    def run_single(self, prompt, files, system_prompt, meta, task):
+        sink = self.open_output(dict(meta, prompt=prompt))
+        sink.begin()
+        received = []
+        on_token = self.make_writer(sink)
+
+        def collect(token):
+            received.append(True)
+            on_token(token)
+
+        response, usage = self.client.generate(
+            prompt, files, system_prompt, stream=not self.args.no_stream, on_token=collect, task=task)
+        sink.usage = usage
+        sink.sent = dict(self.client.sent)
+        if not received and response:
+            on_token(response)
+        if response and response.startswith('Error: '):
+            self.failed = True
+        sink.end()
+        if self.args.output:
+            print(f'\n[INFO] Output saved to: {self.args.output}')
+
+    def run_prompt(self, prompt):
+        self.info(f'[AI] {self.client.provider}:')
+        self.run_single(prompt, None, SYSTEM_PROMPT, {}, 'chat')
+
+    def run_file(self, filepath):
+        file = self.read_file(filepath)
+        if not file:
+            return
+        self.info(f'[INFO] Processing file: {filepath}')
+        self.info(f"[INFO] Size: {file['size']} bytes")
+        self.info('')
+        prompt = ' '.join(self.args.prompt) or f"Analyze this {file['extension']} file and provide insights:"
+        self.run_single(prompt, [file], FILE_SYSTEM_PROMPT, {'file': filepath}, 'review')
+
+    def run_batch(self, batch_path):
+        try:
+            batch = open(batch_path, encoding='utf-8')
+        except OSError:
+            print(f'[ERROR] Could not read batch file: {batch_path}', file=sys.stderr)
+            self.failed = True
+            return
+
+        self.info(f'[INFO] Running batch: {batch_path}')
+        sink = self.open_output({'batch': batch_path})
+        on_token = self.make_writer(sink)
+        sink.begin()
+        parts = 0
+        with batch:
+            for line_number, line in enumerate(batch, 1):
+                item = parse_batch_line(line)
+                if not item:
+                    continue
+                files = []
+                if item.get('file'):
+                    file = self.read_file(item['file'])
+                    if file:
+                        files.append(file)
+                prompt = item.get('prompt') or f"Analyze this {os.path.splitext(item.get('file', ''))[1]} file and provide insights:"
+
+                parts += 1
+                sink.part(parts, f'line {line_number}')
+                if sink.output:
+                    self.info(f'\n[PART {parts}] line {line_number}:')
+                received = []
+
+                def collect(token):
+                    received.append(True)
+                    on_token(token)
+
+                response, usage = self.client.generate(
+                    prompt, files, SYSTEM_PROMPT, stream=not self.args.no_stream, on_token=collect, task='summary')
+                sink.usage = usage or sink.usage
+                sink.sent = dict(self.client.sent)
+                if not received and response:
+                    on_token(response)
+                if response and response.startswith('Error: '):
+                    self.failed = True
+        sink.end()
+        if self.args.output:
+            print()
+        self.info(f'[OK] Processed {parts} batch items')
+        if self.args.output:
+            print(f'[INFO] Output saved to: {self.args.output}')
+
+
+def parse_batch_line(line):
+    """One batch item per line: a plain prompt or a {"prompt": ..., "file": ...} object"""
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    if line.startswith('{'):
+        import json
+
+        try:
+            item = json.loads(line)
+            return item if item.get('prompt') or item.get('file') else None
+        except ValueError:
+            pass
+    return {'prompt': line}
+
+
 class MyCodeHelperLauncher:
     def __init__(self):
-        self.setup_logging()
-        
-    def setup_logging(self):
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(levelname)s: %(message)s'
-        )
-        self.logger = logging.getLogger(__name__)
+        self.stopping = False
 
     def parse_arguments(self):
+        import argparse
+
         parser = argparse.ArgumentParser(
             description='MyCodeHelper Complete - Full-Featured AI Code Assistant',
             formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -846,12 +1532,18 @@ Examples:
   python mycodehelper-complete.py "Explain this error"         # Single prompt  
   python mycodehelper-complete.py -f app.js "Review this"      # Analyze file
   python mycodehelper-complete.py -a                           # Analyze codebase
+  python mycodehelper-complete.py --batch prompts.txt          # One prompt per line
+  python mycodehelper-complete.py --daemon                     # Keep a warm Node daemon running
+  python mycodehelper-complete.py --resume last "And now?"     # Continue the latest session
+  git diff | python mycodehelper-complete.py "Review this"     # Pipe input
+  python mycodehelper-complete.py --config settings.json "..." # Layer a settings file
   python mycodehelper-complete.py --config                     # Configure AI
 
 Environment Variables:
   HUGGING_FACE_API_KEY     Hugging Face API token
   LOCAL_AI_API_KEY         Local AI API key
   LOCAL_AI_BASE_URL        Local AI server URL
+  MYCODEHELPER_ENGINE      auto, node or python (default: auto)
             '''
         )
         
@@ -859,31 +1551,72 @@ Environment Variables:
         parser.add_argument('-i', '--interactive', action='store_true', 
                           help='Start interactive mode')
         parser.add_argument('-f', '--file', type=str,
-                          help='Process a specific file')
+                          help='Process a specific file ("-" reads stdin)')
+        parser.add_argument('--edit', type=str, metavar='FILE',
+                          help='Ask for edits to FILE as small patches (dry run unless --apply)')
+        parser.add_argument('--apply', action='store_true',
+                          help='Write the edits produced by --edit')
+        parser.add_argument('--batch', type=str,
+                          help='Run one prompt per line of a file (or JSONL {"prompt", "file"})')
+        parser.add_argument('--engine', choices=['auto', 'node', 'python'],
+                          default=os.getenv('MYCODEHELPER_ENGINE', 'auto'),
+                          help='Run with Node or the built-in Python client (auto: Python for '
+                               'prompt, --file and --batch runs)')
+        parser.add_argument('--stdin', action='store_true',
+                          help='Stream input from stdin (automatic when piped)')
+        parser.add_argument('--chunk-size', type=int,
+                          help='Split piped input into chunks of this many characters')
+        parser.add_argument('--concurrency', type=str, metavar='N',
+                          help='Process up to N input chunks or batch items in parallel '
+                               '("auto" adapts to the server)')
         parser.add_argument('-o', '--output', type=str,
                           help='Save output to file')
         parser.add_argument('-a', '--analyze', action='store_true',
                           help='Analyze current codebase')
         parser.add_argument('-c', '--codebase', action='store_true',
                           help='Load project context')
-        parser.add_argument('--format', choices=['text', 'json', 'markdown'],
+        parser.add_argument('--format', choices=['text', 'json', 'jsonl', 'markdown'],
                           default='text', help='Output format')
+        parser.add_argument('--schema', type=str, metavar='NAME|PATH',
+                          help='Reply as JSON validated against a schema (built-in: findings)')
         parser.add_argument('--no-stream', action='store_true',
                           help='Disable streaming responses')
-        parser.add_argument('--config', action='store_true',
-                          help='Configure AI providers')
+        parser.add_argument('--config', nargs='?', const=True, metavar='PATH',
+                          help='Load settings from PATH (without PATH: configure AI providers)')
+        parser.add_argument('--profile', type=str,
+                          help='Apply a named settings profile from the config files')
+        parser.add_argument('--daemon', action='store_true',
+                          help='Run a supervised Node daemon that serves later runs')
+        parser.add_argument('--watch', action='store_true',
+                          help='Keep the project index current as files change (interactive mode)')
+        parser.add_argument('--no-daemon', action='store_true',
+                          help='Do not hand this run to a running daemon')
+        parser.add_argument('--models', type=str,
+                          help='Send each prompt to several comma-separated models at once')
+        parser.add_argument('--fanout', choices=['first', 'compare'],
+                          help='first: fastest successful answer; compare: all answers with timings')
+        parser.add_argument('--draft-model', type=str,
+                          help='Answer with this small model first and escalate hard prompts')
+        parser.add_argument('--resume', type=str, metavar='ID',
+                          help='Continue a saved session ("last" for the most recent one)')
+        parser.add_argument('--project-root', type=str, default=os.getcwd(),
+                          help='Project directory to scan and index (default: current directory)')
         parser.add_argument('-v', '--version', action='store_true',
                           help='Show version information')
         
         return parser.parse_args()
 
-    def check_prerequisites(self):
+    async def check_prerequisites(self):
         """Check if Node.js is installed"""
+        import asyncio
+
         try:
-            result = subprocess.run(['node', '--version'], 
-                                  capture_output=True, text=True)
-            if result.returncode == 0:
-                version = result.stdout.strip()
+            process = await asyncio.create_subprocess_exec(
+                'node', '--version',
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+            stdout, _ = await process.communicate()
+            if process.returncode == 0:
+                version = stdout.decode().strip()
                 major_version = int(version[1:].split('.')[0])
                 if major_version >= 20:
                     print(f"[OK] Node.js {version} detected")
@@ -898,6 +1631,70 @@ Environment Variables:
         print("[INFO] Install Node.js 20+ from: https://nodejs.org/")
         return False
 
+    def load_settings_files(self, args):
+        """Export config-file settings (~/.mycodehelper/config.json, the project's
+        .mycodehelper.json, --config, then the selected profile) as environment defaults
+
+        Only the keys in SETTINGS_ENV are exported and variables that are already set win,
+        matching the app's layering. Returns the errors for unreadable files; the Node app
+        reports those itself, so the caller prints them for native runs only."""
+        paths = [os.path.join(os.path.expanduser('~'), '.mycodehelper', 'config.json'),
+                 os.path.join(args.project_root, '.mycodehelper.json')]
+        if isinstance(args.config, str):
+            paths.append(args.config)
+        paths = [path for path in paths if os.path.isfile(path)]
+        if not paths:
+            return []
+
+        import json
+
+        merged, errors = {}, []
+        for path in paths:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    merge_settings(merged, json.load(f))
+            except (OSError, ValueError) as e:
+                errors.append(f"Could not load config {path}: {e}")
+        profiles = merged.pop('profiles', None) or {}
+        name = args.profile or os.getenv('MYCODEHELPER_PROFILE') or merged.get('profile')
+        if name in profiles:
+            merge_settings(merged, profiles[name])
+
+        for keys, variable in SETTINGS_ENV.items():
+            value = merged
+            for key in keys:
+                value = value.get(key) if isinstance(value, dict) else None
+            if isinstance(value, dict):
+                value = ','.join(f'{key}={item}' for key, item in value.items())
+            if value is not None and not os.getenv(variable):
+                os.environ[variable] = str(value).lower() if isinstance(value, bool) else str(value)
+        return errors
+
+    def load_env_file(self, path='.env'):
+        """Load KEY=value pairs written by setup-env.sh without overriding the real environment"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                lines = f.readlines()
+        except OSError:
+            return 0
+
+        loaded = 0
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith('#') or '=' not in line:
+                continue
+            key, value = line.split('=', 1)
+            key = key.strip()
+            if key.startswith('export '):
+                key = key[7:].strip()
+            value = value.strip()
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'':
+                value = value[1:-1]
+            if key and key not in os.environ:
+                os.environ[key] = value
+                loaded += 1
+        return loaded
+
     def setup_ai_config(self):
         """Interactive AI provider configuration"""
         print("[SETUP] AI Provider Configuration")
@@ -952,60 +1749,196 @@ Environment Variables:
             else:
                 print("Invalid choice, please enter 1, 2, or 3")
 
-    def run_mycodehelper(self, args):
-        """Create and run the complete MyCodeHelper"""
-        print("[INFO] Starting MyCodeHelper Complete...")
-        
-        # Create temporary directory
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_path = Path(temp_dir)
-            
-            # Write package.json
-            package_json = {
-                "name": "mycodehelper-complete",
-                "version": "0.1.13", 
-                "type": "module",
-                "engines": {"node": ">=20.0.0"},
-                "dependencies": {}
-            }
-            
-            package_path = temp_path / "package.json"
-            with open(package_path, 'w') as f:
-                json.dump(package_json, f, indent=2)
-            
-            # Write complete JavaScript app
-            app_path = temp_path / "mycodehelper.js"
-            with open(app_path, 'w', encoding='utf-8') as f:
-                f.write(MYCODEHELPER_COMPLETE_JS)
-            
-            # Build command line arguments for Node.js
-            node_args = ['node', 'mycodehelper.js']
-            
-            # Pass through arguments
-            if args.interactive:
-                node_args.append('--interactive')
-            if args.file:
-                node_args.extend(['--file', args.file])
-            if args.output:
-                node_args.extend(['--output', args.output])
-            if args.analyze:
-                node_args.append('--analyze')
-            if args.codebase:
-                node_args.append('--codebase')
-            if args.format != 'text':
-                node_args.extend(['--format', args.format])
-            if args.no_stream:
-                node_args.append('--no-stream')
-            if args.prompt:
-                node_args.append(' '.join(args.prompt))
-            
-            # Run the app
+    def find_bundled_app(self):
+        """Return the bundled Node app shipped next to this launcher, if present"""
+        bundled = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'bundle', 'mycodehelper-complete.js')
+        return bundled if os.path.isfile(bundled) else None
+
+    def materialize_app(self):
+        """Return the Node app to run, writing the embedded copy into the cache once per version"""
+        bundled = self.find_bundled_app()
+        if bundled:
+            return bundled
+
+        import hashlib
+        import json
+
+        digest = hashlib.sha1(MYCODEHELPER_COMPLETE_JS.encode('utf-8')).hexdigest()[:12]
+        app_dir = os.path.join(default_cache_dir(), 'app', digest)
+        app_path = os.path.join(app_dir, 'mycodehelper.js')
+        if os.path.isfile(app_path):
+            return app_path
+
+        os.makedirs(app_dir, exist_ok=True)
+        package_json = {
+            "name": "mycodehelper-complete",
+            "version": "0.1.13", 
+            "type": "module",
+            "engines": {"node": ">=20.0.0"},
+            "dependencies": {}
+        }
+        with open(os.path.join(app_dir, 'package.json'), 'w') as f:
+            json.dump(package_json, f, indent=2)
+
+        # Write to a temp name first so a concurrent launcher never runs a half-written app
+        partial = os.path.join(app_dir, f'mycodehelper.js.{os.getpid()}.tmp')
+        with open(partial, 'w', encoding='utf-8') as f:
+            f.write(MYCODEHELPER_COMPLETE_JS)
+        os.replace(partial, app_path)
+        return app_path
+
+    def build_cli_args(self, args):
+        """Translate launcher arguments into the Node CLI's arguments"""
+        # Scans, indexes and caches are keyed by the caller's project, not the launcher's files
+        cli_args = ['--project-root', os.path.abspath(args.project_root)]
+
+        # Pass through arguments
+        if args.interactive:
+            cli_args.append('--interactive')
+        if args.file:
+            cli_args.extend(['--file', args.file])
+        if args.batch:
+            cli_args.extend(['--batch', args.batch])
+        if args.edit:
+            cli_args.extend(['--edit', args.edit])
+        if args.apply:
+            cli_args.append('--apply')
+        if args.stdin:
+            cli_args.append('--stdin')
+        if args.chunk_size:
+            cli_args.extend(['--chunk-size', str(args.chunk_size)])
+        if args.concurrency:
+            cli_args.extend(['--concurrency', str(args.concurrency)])
+        if args.output:
+            cli_args.extend(['--output', args.output])
+        if args.analyze:
+            cli_args.append('--analyze')
+        if args.codebase:
+            cli_args.append('--codebase')
+        if args.format != 'text':
+            cli_args.extend(['--format', args.format])
+        if args.schema:
+            cli_args.extend(['--schema', args.schema])
+        if isinstance(args.config, str):
+            cli_args.extend(['--config', args.config])
+        if args.profile:
+            cli_args.extend(['--profile', args.profile])
+        if args.no_stream:
+            cli_args.append('--no-stream')
+        if args.daemon:
+            cli_args.append('--daemon')
+        if args.watch:
+            cli_args.append('--watch')
+        if args.resume:
+            cli_args.extend(['--resume', args.resume])
+        if args.models:
+            cli_args.extend(['--models', args.models])
+        if args.fanout:
+            cli_args.extend(['--fanout', args.fanout])
+        if args.draft_model:
+            cli_args.extend(['--draft-model', args.draft_model])
+        if args.prompt:
+            cli_args.append(' '.join(args.prompt))
+        return cli_args
+
+    def daemon_eligible(self, args):
+        """Non-interactive Node runs can be handed to a running daemon"""
+        if os.name != 'posix' or args.daemon or args.no_daemon:
+            return False
+        if args.interactive or args.stdin or args.file == '-' or self.stdin_is_piped():
+            return False
+        return bool(args.prompt or args.file or args.batch or args.analyze)
+
+    def connect_daemon(self):
+        socket_path = os.getenv('MYCODEHELPER_DAEMON_SOCKET') or os.path.join(default_cache_dir(), 'daemon.sock')
+        if not os.path.exists(socket_path):
+            return None
+
+        import socket
+
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            client.connect(socket_path)
+        except OSError:
+            client.close()
+            return None
+        return client
+
+    def run_via_daemon(self, client, args):
+        """Send the run to the daemon and replay its framed stdout/stderr"""
+        import json
+
+        exit_code = 1
+        streams = {'stdout': sys.stdout, 'stderr': sys.stderr}
+        with client, client.makefile('rb') as reader:
+            request = {'argv': self.build_cli_args(args), 'cwd': os.getcwd(), 'env': daemon_env()}
+            client.sendall((json.dumps(request) + '\n').encode('utf-8'))
+            for line in reader:
+                message = json.loads(line)
+                if 'exit' in message:
+                    exit_code = message['exit']
+                    continue
+                stream = streams.get(message.get('stream'), sys.stdout)
+                stream.write(message.get('data', ''))
+                stream.flush()
+        return exit_code
+
+    def forward_signals(self, loop, process):
+        """Relay termination signals to the Node child; returns the hooked signals"""
+        if os.name != 'posix':
+            return []
+
+        import signal
+
+        def relay(sig):
+            self.stopping = True
+            if process.returncode is None:
+                process.send_signal(sig)
+
+        def interrupted():
+            # Ctrl-C already reaches the child through the terminal's process group
+            self.stopping = True
+
+        for sig in (signal.SIGTERM, signal.SIGHUP):
+            loop.add_signal_handler(sig, relay, sig)
+        loop.add_signal_handler(signal.SIGINT, interrupted)
+        return [signal.SIGTERM, signal.SIGHUP, signal.SIGINT]
+
+    async def supervise(self, node_args, restart=False):
+        """Run the Node child with inherited stdio; in daemon mode restart it when it crashes"""
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        self.stopping = False
+        backoff = 1
+
+        while True:
+            started = loop.time()
             try:
-                subprocess.run(node_args, cwd=temp_dir)
-            except KeyboardInterrupt:
-                print("\\nGoodbye!")
-            except Exception as e:
+                # Inherited stdio: the child's output reaches the terminal with no extra buffering
+                process = await asyncio.create_subprocess_exec(*node_args, cwd=os.getcwd())
+            except OSError as e:
                 print(f"[ERROR] Error running MyCodeHelper: {e}")
+                return 1
+
+            hooked = self.forward_signals(loop, process)
+            try:
+                code = await process.wait()
+            finally:
+                for sig in hooked:
+                    loop.remove_signal_handler(sig)
+
+            if code < 0:
+                code = 128 - code  # Killed by a signal
+            if not restart or code == 0 or self.stopping:
+                return code
+
+            if loop.time() - started > 60:
+                backoff = 1
+            print(f"[WARN] MyCodeHelper daemon exited with code {code}; restarting in {backoff}s",
+                  file=sys.stderr)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
 
     def show_version(self):
         print("MyCodeHelper Complete v0.1.13")
@@ -1019,35 +1952,150 @@ Environment Variables:
         print("  [OK] Project context understanding")
         print("  [OK] Multiple output formats")
 
+    def stdin_is_piped(self):
+        import stat
+
+        try:
+            mode = os.fstat(sys.stdin.fileno()).st_mode
+        except (OSError, ValueError):
+            return False
+        return stat.S_ISFIFO(mode) or stat.S_ISREG(mode)
+
+    def fits_file_context(self, path):
+        """Whether a context file goes out whole; the Node app cuts larger ones to the chunks
+        that share the most identifiers with the prompt"""
+        budget = int(os.getenv('MYCODEHELPER_FILE_CONTEXT_TOKENS', '6000'))
+        try:
+            # The estimate never exceeds the byte count, so small files skip reading
+            if os.path.getsize(path) <= budget:
+                return True
+            with open(path, encoding='utf-8', errors='replace') as f:
+                return estimate_tokens(f.read()) <= budget
+        except OSError:
+            return True
+
+    def batch_fits_file_context(self, batch_path):
+        try:
+            with open(batch_path, encoding='utf-8') as batch:
+                items = [parse_batch_line(line) for line in batch]
+        except OSError:
+            return True
+        return all(self.fits_file_context(item['file']) for item in items if item and item.get('file'))
+
+    def can_run_natively(self, args):
+        """One-shot prompt, --file and --batch runs need nothing from Node"""
+        if args.interactive or args.analyze or args.codebase or args.stdin or args.file == '-':
+            return False
+        # Saved sessions, edits, schema runs, multi-model fan-out and the cascade are owned by the Node app
+        if args.resume or args.edit or args.schema or args.models or args.fanout or args.draft_model:
+            return False
+        if os.getenv('MYCODEHELPER_MODELS') or os.getenv('MYCODEHELPER_DRAFT_MODEL') or os.getenv('MYCODEHELPER_SCHEMA'):
+            return False
+        # The embedded backend runs inside the Node process
+        if os.getenv('MYCODEHELPER_EMBEDDED_MODEL'):
+            return False
+        if not (args.prompt or args.file or args.batch):
+            return False
+        # Files too big for one request are chunked along definitions by the Node app
+        if args.file and os.path.isfile(args.file):
+            limit = args.chunk_size or int(os.getenv('MYCODEHELPER_CHUNK_SIZE', '24000'))
+            if os.path.getsize(args.file) > limit:
+                return False
+        # The native batch runner is sequential; parallel and adaptive batches run in Node
+        if args.batch and (args.concurrency or os.getenv('MYCODEHELPER_CONCURRENCY', '1')) != '1':
+            return False
+        # Files over MYCODEHELPER_FILE_CONTEXT_TOKENS are excerpted by the Node app; the native
+        # client sends files whole, so those runs go to Node (unless forced here)
+        if args.engine != 'python':
+            if args.file and not self.fits_file_context(args.file):
+                return False
+            if args.batch and not self.batch_fits_file_context(args.batch):
+                return False
+        # Hugging Face batches go to Node, which sends them as list inputs (unless forced here)
+        if args.batch and args.engine != 'python' and os.getenv('HUGGING_FACE_API_KEY') \
+                and os.getenv('HUGGING_FACE_BATCH_SIZE', '8') != '1':
+            return False
+        # Piped input is streamed by the Node app
+        return bool(args.file or args.batch) or not self.stdin_is_piped()
+
     def main(self):
+        # --version needs none of the argument parsing machinery
+        if sys.argv[1:] in (['-v'], ['--version']):
+            self.show_version()
+            return 0
+
         args = self.parse_arguments()
         
         if args.version:
             self.show_version()
-            return
-        
-        # Check prerequisites
-        if not self.check_prerequisites():
-            return
-        
+            return 0
+
+        configure_console()
+        settings_errors = self.load_settings_files(args)
+
+        native = args.engine != 'node' and self.can_run_natively(args)
+        if args.engine == 'python' and not native:
+            print("[ERROR] The Python engine supports prompt, --file and --batch runs only")
+            return 2
+
         # Setup AI configuration if requested
-        if args.config:
+        if args.config is True:
+            self.load_env_file()
             self.setup_ai_config()
-            return
-        
-        # Setup AI if not configured
-        if not (os.getenv('HUGGING_FACE_API_KEY') or os.getenv('LOCAL_AI_API_KEY')):
-            print("No AI provider configured. Running setup...")
-            if not self.setup_ai_config():
-                return
+            return 0
+
+        if native:
+            for error in settings_errors:
+                print(f"[ERROR] {error}")
+            self.load_env_file()
+            if not self.ensure_ai_config():
+                return 1
+            return NativeRunner(args).run()
+
+        # A running daemon already has Node, the app and warm caches
+        daemon = self.connect_daemon() if self.daemon_eligible(args) else None
+        if daemon:
+            self.load_env_file()
+            return self.run_via_daemon(daemon, args)
+
+        import asyncio
+
+        if sys.platform == 'win32' and sys.version_info < (3, 8):
+            # Subprocesses need the proactor loop on older Windows Pythons
+            asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
+        return asyncio.run(self.run_node(args))
+
+    async def run_node(self, args):
+        import asyncio
+
+        # Node detection, app materialization and config loading overlap
+        loop = asyncio.get_running_loop()
+        node_ok, app_path, _ = await asyncio.gather(
+            self.check_prerequisites(),
+            loop.run_in_executor(None, self.materialize_app),
+            loop.run_in_executor(None, self.load_env_file))
+        if not node_ok:
+            return 1
+
+        if not self.ensure_ai_config():
+            return 1
         
         # Run the complete application
-        self.run_mycodehelper(args)
+        print("[INFO] Starting MyCodeHelper Complete...")
+        return await self.supervise(['node', str(app_path)] + self.build_cli_args(args), restart=args.daemon)
+
+    def ensure_ai_config(self):
+        # Setup AI if not configured (never prompt when stdin carries piped input)
+        configured = os.getenv('HUGGING_FACE_API_KEY') or os.getenv('LOCAL_AI_API_KEY') or os.getenv('MYCODEHELPER_EMBEDDED_MODEL')
+        if not configured and sys.stdin.isatty():
+            print("No AI provider configured. Running setup...")
+            return self.setup_ai_config()
+        return True
 
 if __name__ == "__main__":
     try:
         launcher = MyCodeHelperLauncher()
-        launcher.main()
+        sys.exit(launcher.main())
     except KeyboardInterrupt:
         print("\\nGoodbye!")
     except Exception as e: